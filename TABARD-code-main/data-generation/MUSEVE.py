@@ -5,9 +5,15 @@ from tqdm import tqdm
 import json
 import re
 import ast
+from response_cache import open_cache, chat_completion
 
 # Set your OpenAI API key
-openai.api_key = ""
+API_KEY = ""
+
+# Response cache (SQLite file; "" disables it). CACHE_READ_ONLY replays
+# cached replies only and never calls the API
+CACHE_PATH = r""
+CACHE_READ_ONLY = False
 
 # **Provide the folder paths directly in the code**
 input_folder_path = r""
@@ -23,6 +29,8 @@ def clean_output(output):
 def generate_anomalies(input_folder_path, output_folder_path, log_file_path):
     input_files = sorted(os.listdir(input_folder_path))
     log_file = open(log_file_path, 'w', encoding="utf-8", errors="ignore")  # Fix log file encoding issue
+    client = openai.OpenAI(api_key=API_KEY or None)
+    cache = open_cache(CACHE_PATH, CACHE_READ_ONLY)
     
     # Filter out only the JSON files
     json_files = [file for file in input_files if file.endswith('.json') and os.path.isfile(os.path.join(input_folder_path, file))]
@@ -118,7 +126,8 @@ Each reasoning path **must verify its own flagged security anomalies**:
 Return **only** the structured list of confirmed anomalies. Return the output in the format [(index, column_name), (index, column_name)] where index corresponds to the index in the list and column_name is the name of the column you think there is a security anomaly.
 """
 
-                response = openai.ChatCompletion.create(
+                reply = chat_completion(
+                    client, cache,
                     model="gpt-4o",
                     messages=[
                         {"role": "system", "content": "You are a data expert skilled at detecting anomalies."},
@@ -128,7 +137,7 @@ Return **only** the structured list of confirmed anomalies. Return the output in
                     temperature=0.7,
                 )
 
-                output = clean_output(response.choices[0].message.content.strip())  # Remove unwanted characters
+                output = clean_output(reply)  # Remove unwanted characters
                 log_file.write(f"{json_file}:\n {output}\n")
 
                 try:
@@ -151,6 +160,9 @@ Return **only** the structured list of confirmed anomalies. Return the output in
         except Exception as e:
             print(f"Error reading {json_file}: {e}")
 
+    if cache is not None:
+        print(cache.summary())
+
 # **No longer using command-line arguments**
 if __name__ == "__main__":
     generate_anomalies(input_folder_path, output_folder_path, log_file_path)
@@ -0,0 +1,218 @@
+# ── injection_batch.py ──────────────────────────────────────────────────────
+
+import os
+import json
+import time
+import hashlib
+import openai
+
+from injection_engine import InjectionEngine, BatchDeferred, record_usage
+
+# Offline Batch-API mode for the anomaly generators. The generators are not
+# changed: the engine they already call is swapped for one that
+#   emit   : records every request it is asked to send into a batch JSONL
+#   submit : emit, upload the JSONL and create the batch (returns at once)
+#   ingest : waits for / downloads the batch output, then answers each
+#            request from it, so the usual extract / validate / "@@@_" diff
+#            logic runs over all responses in one pass
+# Requests are matched to responses by a hash of the request body, so the
+# chunked (*_LargeTables) generators work the same way as the others. With a
+# response cache, emit only records requests that are not cached yet and
+# ingest stores every reply in the cache.
+BATCH_MODES = ("emit", "submit", "ingest")
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINAL_STATUSES = ("completed", "failed", "cancelled", "expired")
+
+
+def request_key(body: dict) -> str:
+    """custom_id of a chat-completion body: stable across emit and ingest runs."""
+    payload = json.dumps(body, sort_keys=True, ensure_ascii=False)
+    return "req-" + hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def batch_id_path(batch_output: str) -> str:
+    """Where "submit" leaves the batch id for a later "ingest" run."""
+    return batch_output + ".batch_id"
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# EMIT
+# ────────────────────────────────────────────────────────────────────────────
+class BatchRecorder(InjectionEngine):
+    """Engine that writes requests to `batch_input` instead of sending them."""
+
+    uses_manifest = False  # nothing is finished until the batch is ingested
+
+    def __init__(self, batch_input: str, **engine_kwargs):
+        super().__init__(**engine_kwargs)
+        self.batch_input = batch_input
+        self._requests = {}
+
+    def _open(self):
+        self._requests = {}
+
+    async def _close(self):
+        if os.path.dirname(self.batch_input):
+            os.makedirs(os.path.dirname(self.batch_input), exist_ok=True)
+        with open(self.batch_input, "w", encoding="utf-8") as f:
+            for custom_id, body in self._requests.items():
+                line = {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    async def _send(self, body: dict) -> str:
+        custom_id = request_key(body)
+        self._requests[custom_id] = body
+        raise BatchDeferred(custom_id)
+
+    def _write_result(self, filename, result, output_folder, log_path):
+        pass  # tables skipped by build_prompt have nothing to emit
+
+    def _finish(self):
+        print(f"Wrote {len(self._requests)} batch requests to {self.batch_input}")
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# SUBMIT / DOWNLOAD
+# ────────────────────────────────────────────────────────────────────────────
+def submit_batch(batch_input: str, batch_output: str, api_key: str = "", description: str = "") -> str:
+    """Upload `batch_input`, create the batch and record its id next to `batch_output`."""
+    client = openai.OpenAI(api_key=api_key or os.environ.get("OPENAI_API_KEY", ""))
+    with open(batch_input, "rb") as f:
+        batch_input_file = client.files.create(file=f, purpose="batch")
+    print(f"Uploaded input file: {batch_input_file.id}")
+
+    batch = client.batches.create(
+        input_file_id=batch_input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+        metadata={"description": description or f"{os.path.basename(batch_input)} - anomaly-generation-batch-job"},
+    )
+    print(f"Created batch: {batch.id}")
+
+    if os.path.dirname(batch_output):
+        os.makedirs(os.path.dirname(batch_output), exist_ok=True)
+    with open(batch_id_path(batch_output), "w", encoding="utf-8") as f:
+        f.write(batch.id)
+    return batch.id
+
+
+def download_batch(batch_output: str, api_key: str = "", interval: int = 30) -> bool:
+    """
+    Wait for the batch recorded by submit_batch and save its output JSONL to
+    `batch_output`. Returns False if the batch did not complete.
+    """
+    with open(batch_id_path(batch_output), "r", encoding="utf-8") as f:
+        batch_id = f.read().strip()
+
+    client = openai.OpenAI(api_key=api_key or os.environ.get("OPENAI_API_KEY", ""))
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        print(f"Batch {batch_id} status: {batch.status}")
+        if batch.status in FINAL_STATUSES:
+            break
+        time.sleep(interval)
+
+    if batch.status != "completed" or not batch.output_file_id:
+        print(f"[ERROR] Batch {batch_id} finished with status: {batch.status}. No output saved.")
+        return False
+
+    result_file = client.files.content(batch.output_file_id)
+    with open(batch_output, "w", encoding="utf-8") as f:
+        f.write(result_file.text)
+    print(f"Batch output saved to {batch_output}")
+    return True
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# INGEST
+# ────────────────────────────────────────────────────────────────────────────
+def read_batch_output(batch_output: str) -> dict:
+    """
+    Return {custom_id: (reply text, usage dict)}, or {custom_id: Exception}
+    explaining why a request has no reply.
+    """
+    replies = {}
+    with open(batch_output, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                custom_id = record["custom_id"]
+            except (json.JSONDecodeError, KeyError) as e:
+                print(f"[ERROR] Line {line_no} of {batch_output}: {e}")
+                continue
+
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                error = record.get("error") or response.get("body", {}).get("error")
+                replies[custom_id] = ValueError(f"Batch request {custom_id} failed: {error}")
+                continue
+            try:
+                content = response["body"]["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError) as e:
+                replies[custom_id] = ValueError(f"Batch request {custom_id} has no reply: {e}")
+                continue
+            replies[custom_id] = ((content or "").strip(), response["body"].get("usage") or {})
+    return replies
+
+
+class BatchReplayer(InjectionEngine):
+    """Engine that answers each request from a downloaded batch output JSONL."""
+
+    def __init__(self, batch_output: str, **engine_kwargs):
+        super().__init__(**engine_kwargs)
+        self.batch_output = batch_output
+        self._replies = {}
+
+    def _open(self):
+        self._replies = read_batch_output(self.batch_output)
+
+    async def _close(self):
+        pass
+
+    async def _send(self, body: dict) -> str:
+        custom_id = request_key(body)
+        reply = self._replies.get(custom_id)
+        if reply is None:
+            raise KeyError(f"No batch result for {custom_id} (was the batch emitted from the same inputs?)")
+        if isinstance(reply, Exception):
+            raise reply
+        text, usage = reply
+        record_usage(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        return text
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# ENTRY POINT
+# ────────────────────────────────────────────────────────────────────────────
+def run_generator(batch_mode, batch_input, batch_output,
+                  input_folder, output_folder, log_path,
+                  build_prompt=None, apply_response=None, process_table=None,
+                  manifest_path=None, retry_failed=None,
+                  **engine_kwargs):
+    """
+    Run a generator interactively (batch_mode=None) or in one of BATCH_MODES.
+    Takes the same arguments as InjectionEngine(...).run(...). "emit" and
+    "submit" leave the run manifest alone; "ingest" records each table.
+    """
+    handlers = dict(build_prompt=build_prompt, apply_response=apply_response, process_table=process_table,
+                    manifest_path=manifest_path, retry_failed=retry_failed)
+
+    if batch_mode is None:
+        InjectionEngine(**engine_kwargs).run(input_folder, output_folder, log_path, **handlers)
+    elif batch_mode in ("emit", "submit"):
+        BatchRecorder(batch_input, **engine_kwargs).run(input_folder, output_folder, log_path, **handlers)
+        if batch_mode == "submit":
+            submit_batch(batch_input, batch_output, api_key=engine_kwargs.get("api_key", ""))
+    elif batch_mode == "ingest":
+        if not os.path.exists(batch_output):
+            if not os.path.exists(batch_id_path(batch_output)):
+                print(f"[ERROR] Neither {batch_output} nor a submitted batch id was found.")
+                return
+            if not download_batch(batch_output, api_key=engine_kwargs.get("api_key", "")):
+                return
+        BatchReplayer(batch_output, **engine_kwargs).run(input_folder, output_folder, log_path, **handlers)
+    else:
+        print(f"[ERROR] Unknown batch mode {batch_mode!r}; expected None or one of {BATCH_MODES}")
@@ -0,0 +1,409 @@
+# ── injection_engine.py ─────────────────────────────────────────────────────
+
+import os
+import json
+import time
+import random
+import asyncio
+import typing
+import contextvars
+from collections import deque
+import pandas as pd
+import openai
+
+from run_manifest import RunManifest, MANIFEST_NAME, DONE, SKIPPED, FAILED, retry_failed_requested, sha256_text
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.encoding_for_model("gpt-4o")
+except Exception:  # tiktoken is only used to estimate tokens for the rate limiter
+    _ENCODING = None
+
+# Errors worth retrying: 429s, 5xx and dropped/timed-out connections
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+# Token usage of the table being processed: {"prompt": n, "completion": n}
+_USAGE = contextvars.ContextVar("injection_usage", default=None)
+
+
+def record_usage(prompt_tokens: int, completion_tokens: int):
+    """Add API token usage to the current table's manifest entry."""
+    usage = _USAGE.get()
+    if usage is not None:
+        usage["prompt"] += prompt_tokens or 0
+        usage["completion"] += completion_tokens or 0
+
+
+class BatchDeferred(Exception):
+    """Raised by a recording engine (batch "emit" mode) instead of returning a reply."""
+
+
+class ReplyRejected(ValueError):
+    """The reply for a table could not be used; the table is recorded as failed and retried."""
+
+
+def rejected_replies(file_id: str, log_entries: list) -> ReplyRejected:
+    """The error for a chunked table none of whose slice replies yielded anomalies, citing their [ERROR] log lines."""
+    errors = [entry.splitlines()[0] for entry in log_entries if entry.startswith("[ERROR]")]
+    return ReplyRejected("; ".join(errors) or f"no anomalies could be applied from the replies for {file_id}")
+
+
+class InjectionRequest(typing.NamedTuple):
+    """What a generator's prompt builder returns for one chat completion."""
+    messages: list
+    max_tokens: int = None     # None → engine default
+    temperature: float = None  # None → engine default
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# RATE LIMITING
+# ────────────────────────────────────────────────────────────────────────────
+def estimate_tokens(messages: list) -> int:
+    text = "".join(m.get("content") or "" for m in messages)
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text)) + 4 * len(messages)
+    return len(text) // 3 + 4 * len(messages)
+
+
+class RateLimiter:
+    """
+    Sliding one-minute window over requests and tokens. A request waits
+    until both budgets have room; one request larger than the whole token
+    budget is still let through once the window is empty.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._window = deque()  # (timestamp, tokens)
+        self._tokens = 0
+        self._lock = asyncio.Lock()
+
+    def _expire(self, now: float):
+        while self._window and now - self._window[0][0] >= 60:
+            _, tokens = self._window.popleft()
+            self._tokens -= tokens
+
+    async def acquire(self, tokens: int):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                fits_requests = len(self._window) < self.requests_per_minute
+                fits_tokens = self._tokens + tokens <= self.tokens_per_minute or not self._window
+                if fits_requests and fits_tokens:
+                    self._window.append((now, tokens))
+                    self._tokens += tokens
+                    return
+                await asyncio.sleep(max(0.05, 60 - (now - self._window[0][0])))
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# SLICES
+# ────────────────────────────────────────────────────────────────────────────
+async def _deferrable(coro):
+    try:
+        return await coro
+    except BatchDeferred as deferred:  # keep recording the other slices
+        return deferred
+
+
+async def gather_slices(coros: list, concurrent: bool = True) -> list:
+    """
+    Await the per-slice coroutines of one table and return their results in
+    slice order. With `concurrent`, every slice is in flight at once (the
+    engine's semaphore and rate limiter still apply); otherwise they run one
+    after another as before. If a slice fails, the others are dropped.
+    """
+    if not concurrent:
+        results = []
+        for i, coro in enumerate(coros):
+            try:
+                results.append(await _deferrable(coro))
+            except BaseException:
+                for rest in coros[i + 1:]:  # never started: close so they aren't left unawaited
+                    rest.close()
+                raise
+    else:
+        tasks = [asyncio.ensure_future(_deferrable(coro)) for coro in coros]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    for result in results:
+        if isinstance(result, BatchDeferred):
+            raise result
+    return results
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# ENGINE
+# ────────────────────────────────────────────────────────────────────────────
+class InjectionEngine:
+    """
+    Runs a generator's prompts concurrently against an OpenAI-compatible
+    chat endpoint and writes the results in input order.
+
+    A generator supplies two callables:
+        build_prompt(df, file_id)           -> InjectionRequest, or None to skip the table
+        apply_response(df, file_id, reply)  -> (modified_df or None, log_entries)
+    where apply_response holds the JSON extraction and diff/"@@@_" marking
+    logic. If apply_response raises or returns None, the reply was unusable:
+    the table is recorded as failed (with the error) and redone with
+    --retry-failed. Chunked generators pass `process_table` instead (see
+    run()) and raise ReplyRejected themselves.
+
+    Point `base_url` at a local mock server (e.g. "http://127.0.0.1:8000/v1")
+    to exercise the whole pipeline offline. Pass a response_cache.ResponseCache
+    as `cache` to reuse replies across runs (read-only caches never call the API).
+    """
+
+    uses_manifest = True
+
+    def __init__(
+        self,
+        api_key: str = "",
+        base_url: str = None,
+        model: str = "gpt-4o",
+        max_tokens: int = 5000,
+        temperature: float = 0.7,
+        concurrency: int = 8,
+        requests_per_minute: int = 500,
+        tokens_per_minute: int = 30_000,
+        max_retries: int = 6,
+        backoff_base: float = 2.0,
+        backoff_cap: float = 60.0,
+        timeout: float = 600.0,
+        cache=None,
+    ):
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY", "")
+        self.base_url = base_url
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        self.cache = cache
+        self._client = None
+        self._semaphore = None
+        self._limiter = None
+
+    # ─── single call ────────────────────────────────────────────────────────
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after) + random.uniform(0, 1)
+            except ValueError:
+                pass
+        delay = min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def request_body(self, request: InjectionRequest) -> dict:
+        """The chat-completion body sent for `request`, with engine defaults filled in."""
+        return {
+            "model": self.model,
+            "messages": request.messages,
+            "max_tokens": request.max_tokens or self.max_tokens,
+            "temperature": self.temperature if request.temperature is None else request.temperature,
+        }
+
+    async def complete(self, request: InjectionRequest) -> str:
+        """Return the stripped reply text for one chat completion, from the cache when possible."""
+        body = self.request_body(request)
+        if self.cache is not None:
+            reply = self.cache.get_or_raise(body)
+            if reply is not None:
+                return reply
+        reply = await self._send(body)
+        if self.cache is not None:
+            self.cache.put(body, reply)
+        return reply
+
+    async def _send(self, body: dict) -> str:
+        """Send one chat completion (rate limited, retried)."""
+        tokens = estimate_tokens(body["messages"]) + body["max_tokens"]
+
+        for attempt in range(self.max_retries + 1):
+            await self._limiter.acquire(tokens)
+            try:
+                async with self._semaphore:
+                    rsp = await self._client.chat.completions.create(**body)
+                if rsp.usage is not None:
+                    record_usage(rsp.usage.prompt_tokens, rsp.usage.completion_tokens)
+                return (rsp.choices[0].message.content or "").strip()
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                print(f"[Retry {attempt + 1}/{self.max_retries}] {type(e).__name__}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def inject(self, df: pd.DataFrame, file_id: str, build_prompt, apply_response):
+        """
+        One prompt per table: build, send, diff. Returns (modified_df, log_entries),
+        or (None, []) if build_prompt turned the table down; raises ReplyRejected
+        if the reply cannot be used.
+        """
+        request = build_prompt(df, file_id)
+        if request is None:
+            return None, []
+        reply = await self.complete(request)
+        print(f"GPT Response for {file_id}:\n{reply}")
+        try:
+            modified_df, log_entries = apply_response(df, file_id, reply)
+        except Exception as e:
+            raise ReplyRejected(f"{type(e).__name__}: {e}") from e
+        if modified_df is None:
+            raise ReplyRejected("no anomalies could be applied from the reply")
+        return modified_df, [f"GPT Response for {file_id}:\n{reply}"] + log_entries
+
+    # ─── whole folder ───────────────────────────────────────────────────────
+    async def _process_file(self, input_folder: str, filename: str, process_table, usage: dict):
+        _USAGE.set(usage)  # inherited by any slice tasks this table starts
+        file_id = os.path.splitext(filename)[0]
+        with open(os.path.join(input_folder, filename), "r", encoding="utf-8") as f:
+            table_data = json.load(f)
+        df = pd.DataFrame(table_data)
+        print(f"Processing: {filename}")
+        return await process_table(self, df, file_id)
+
+    def _write_result(self, filename: str, result, output_folder: str, log_path: str):
+        """Write one table's output and log; returns (output_path, sha256) or None if nothing was saved."""
+        modified_df, log_entries = result
+        if modified_df is None:
+            print(f"{filename} was turned down by the generator, skipping saving.")
+            return None
+
+        file_id = os.path.splitext(filename)[0]
+        output_path = os.path.join(output_folder, f"{file_id}_updated.json")
+        # Manually write JSON to avoid escaping slashes & unicode
+        json_str = modified_df.to_json(None, orient="records", indent=4, force_ascii=False)
+        json_str = json_str.replace('\\/', '/')
+        with open(output_path, "w", encoding="utf-8") as out_f:
+            out_f.write(json_str)
+        print(f"Saved updated file: {output_path}")
+
+        with open(log_path, "a", encoding="utf-8") as log_file:
+            log_file.write(f"Table: {filename}\n")
+            log_file.write("\n".join(log_entries))
+            log_file.write("\n\n")
+        return output_path, sha256_text(json_str)
+
+    def _open(self):
+        self._client = openai.AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            max_retries=0,  # retries are handled here, with jitter
+            timeout=self.timeout,
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._limiter = RateLimiter(self.requests_per_minute, self.tokens_per_minute)
+
+    async def _close(self):
+        await self._client.close()
+
+    def _finish(self):
+        print("All modified files and logs have been saved.")
+
+    async def _run(self, input_folder: str, output_folder: str, log_path: str, process_table,
+                   manifest: RunManifest = None, retry_failed: bool = False):
+        self._open()
+
+        filenames = [f for f in sorted(os.listdir(input_folder)) if f.endswith(".json")]
+        if manifest is not None:
+            remaining = [f for f in filenames if not manifest.is_complete(f, retry_failed)]
+            if len(remaining) < len(filenames):
+                print(f"[Skip] {len(filenames) - len(remaining)} file(s) already completed in {manifest.path}")
+            filenames = remaining
+        # Keep a bounded window of tables in flight and write them back in input order
+        window = max(1, self.concurrency * 4)
+        pending = deque()
+
+        async def drain_one():
+            filename, task, usage = pending.popleft()
+            try:
+                result = await task
+            except BatchDeferred:
+                return
+            except Exception as e:
+                print(f"Error processing {filename}: {e}")
+                if manifest is not None:
+                    manifest.record(filename, FAILED, tokens=usage, error=f"{type(e).__name__}: {e}")
+                return
+            written = self._write_result(filename, result, output_folder, log_path)
+            if manifest is not None:
+                if written is None:
+                    manifest.record(filename, SKIPPED, tokens=usage)
+                else:
+                    manifest.record(filename, DONE, output=written[0], output_sha256=written[1], tokens=usage)
+
+        try:
+            for filename in filenames:
+                usage = {"prompt": 0, "completion": 0}
+                task = asyncio.create_task(self._process_file(input_folder, filename, process_table, usage))
+                pending.append((filename, task, usage))
+                if len(pending) >= window:
+                    await drain_one()
+            while pending:
+                await drain_one()
+        except BaseException:
+            # Aborted (error or Ctrl-C): don't leave the tables still in flight running
+            tasks = [task for _, task, _ in pending]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            await self._close()
+
+    def run(self, input_folder: str, output_folder: str, log_path: str,
+            build_prompt=None, apply_response=None, process_table=None,
+            manifest_path: str = None, retry_failed: bool = None):
+        """
+        Process every *.json table in `input_folder`, writing
+        <file_id>_updated.json to `output_folder` and appending to `log_path`.
+
+        Either pass build_prompt + apply_response (one prompt per table), or
+        an async process_table(engine, df, file_id) -> (modified_df or None,
+        log_entries) that may call engine.complete() several times. None
+        means the table was turned down (e.g. no suitable columns); a table
+        whose replies are unusable raises (ReplyRejected) and is recorded
+        as failed.
+
+        Each finished table is appended to a manifest (by default
+        <output_folder>/manifest.jsonl, see run_manifest.py); tables it lists
+        as finished are skipped, failed ones only with --retry-failed.
+        """
+        if process_table is None:
+            async def process_table(engine, df, file_id):
+                return await engine.inject(df, file_id, build_prompt, apply_response)
+
+        os.makedirs(output_folder, exist_ok=True)
+        if os.path.dirname(log_path):
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        manifest = None
+        if self.uses_manifest:
+            manifest = RunManifest(manifest_path or os.path.join(output_folder, MANIFEST_NAME))
+        if retry_failed is None:
+            retry_failed = retry_failed_requested()
+        asyncio.run(self._run(input_folder, output_folder, log_path, process_table, manifest, retry_failed))
+        self._finish()
+        if manifest is not None:
+            print(manifest.summary())
+        if self.cache is not None:
+            print(self.cache.summary())
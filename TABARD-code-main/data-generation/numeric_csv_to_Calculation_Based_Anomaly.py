@@ -1,11 +1,31 @@
 import os 
 import pandas as pd
-import openai
 import json
 import re
-
-# Set your OpenAI API key
-openai.api_key = ""
+from injection_engine import InjectionRequest
+from injection_batch import run_generator
+from response_cache import open_cache
+
+# Set your OpenAI API key (BASE_URL may point at any OpenAI-compatible server, e.g. a local mock)
+API_KEY = ""
+BASE_URL = None
+
+# Concurrency and per-minute limits for the injection engine
+CONCURRENCY = 8
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 30_000
+
+# Batch API mode: None sends requests interactively; "emit" writes them to
+# BATCH_INPUT, "submit" also uploads it, "ingest" applies BATCH_OUTPUT
+# (downloading it first when only the submitted batch id is there)
+BATCH_MODE = None
+BATCH_INPUT = r""
+BATCH_OUTPUT = r""
+
+# Response cache (SQLite file; "" disables it). CACHE_READ_ONLY replays
+# cached replies only and never calls the API
+CACHE_PATH = r""
+CACHE_READ_ONLY = False
 
 # Paths to input/output folders
 input_folder = r""
@@ -78,9 +98,9 @@ def identify_calculation_related_columns(df):
 # Removed the is_suitable_for_calculation_anomalies function
 # so the code no longer decides "suitable" vs. "not suitable."
 
-def generate_anomalies(df, file_id, max_anomalies=6):
+def build_prompt(df, file_id, max_anomalies=6):
     """
-    Generate calculation-based anomalies in the dataset by prompting GPT to introduce them.
+    Build the GPT request that introduces calculation-based anomalies in the dataset.
     """
     columns_info = analyze_columns(df)
     # We are no longer checking if the table is suitable; we simply proceed.
@@ -115,22 +135,20 @@ Dataset:
 Modified Dataset in JSON:
 """
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4o",
+    return InjectionRequest(
         messages=[
             {"role": "system", "content": "You are a data expert skilled at introducing calculation-based anomalies."},
             {"role": "user", "content": prompt},
         ],
-        max_tokens=5000,
-        temperature=0.7,
     )
 
-    output = response.choices[0].message.content.strip()
-    print(f"GPT Response for {file_id}:\n{output}")
-
+def apply_response(df, file_id, output):
+    """
+    Mark every cell GPT changed with '@@@_'.
+    Returns (modified_df, log_entries); modified_df is None if nothing changed;
+    raises if the reply cannot be parsed.
+    """
     log_entries = []
-    # Capture the entire GPT response in the log
-    log_entries.append(f"GPT Response for {file_id}:\n{output}")
 
     try:
         json_content = extract_json_from_response(output)
@@ -166,47 +184,27 @@ Modified Dataset in JSON:
 
     except Exception as e:
         print(f"Error parsing GPT output for {file_id}: {e}")
-        print("Skipping table due to error.")
-        return None, []
-
-# Process each file in the input folder
-for filename in sorted(os.listdir(input_folder)):
-    # We now look for .json files instead of .csv
-    if filename.endswith(".json"):
-        file_path = os.path.join(input_folder, filename)
-        file_id = os.path.splitext(filename)[0]
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                table_data = json.load(f)
-            df = pd.DataFrame(table_data)
-            print(f"Processing: {filename}")
-
-            modified_df, log_entries = generate_anomalies(df, file_id)
-
-            if modified_df is not None:
-                # Manually write JSON to avoid escapes
-                json_str = modified_df.to_json(None, orient="records", indent=4, force_ascii=False)
-                # Remove escaped slashes
-                json_str = json_str.replace('\\/', '/')
-
-                output_path = os.path.join(output_folder, f"{file_id}_updated.json")
-                with open(output_path, "w", encoding="utf-8") as out_f:
-                    out_f.write(json_str)
-                print(f"Saved updated file: {output_path}")
-
-                # Save the log file
-                log_path = os.path.join(log_folder, "anomalies_log.txt")
-                with open(log_path, "a") as log_file:
-                    log_file.write(f"Table: {filename}\n")
-                    log_file.write("\n".join(log_entries))
-                    log_file.write("\n\n")
-            else:
-                print(f"No anomalies generated for {filename}, skipping saving.")
-
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
-
-print(f"All modified files and logs have been saved.")
+        raise  # recorded as failed in the run manifest, redone with --retry-failed
+
+# Process each file in the input folder (concurrently; results are written in file order)
+run_generator(
+    BATCH_MODE, BATCH_INPUT, BATCH_OUTPUT,
+    input_folder,
+    output_folder,
+    os.path.join(log_folder, "anomalies_log.txt"),
+    build_prompt,
+    apply_response,
+    api_key=API_KEY,
+    base_url=BASE_URL,
+    model="gpt-4o",
+    max_tokens=5000,
+    temperature=0.7,
+    concurrency=CONCURRENCY,
+    requests_per_minute=REQUESTS_PER_MINUTE,
+    tokens_per_minute=TOKENS_PER_MINUTE,
+    cache=open_cache(CACHE_PATH, CACHE_READ_ONLY),
+)
+
 
 
 def identify_calculation_related_columns(df):
@@ -1,11 +1,31 @@
 import os 
 import pandas as pd
-import openai
 import json
 import re
-
-# Set your OpenAI API key
-openai.api_key = ""
+from injection_engine import InjectionRequest
+from injection_batch import run_generator
+from response_cache import open_cache
+
+# Set your OpenAI API key (BASE_URL may point at any OpenAI-compatible server, e.g. a local mock)
+API_KEY = ""
+BASE_URL = None
+
+# Concurrency and per-minute limits for the injection engine
+CONCURRENCY = 8
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 30_000
+
+# Batch API mode: None sends requests interactively; "emit" writes them to
+# BATCH_INPUT, "submit" also uploads it, "ingest" applies BATCH_OUTPUT
+# (downloading it first when only the submitted batch id is there)
+BATCH_MODE = None
+BATCH_INPUT = r""
+BATCH_OUTPUT = r""
+
+# Response cache (SQLite file; "" disables it). CACHE_READ_ONLY replays
+# cached replies only and never calls the API
+CACHE_PATH = r""
+CACHE_READ_ONLY = False
 # Paths to input/output folders
 input_folder = r""
 output_folder = r""
@@ -72,29 +92,33 @@ def is_suitable_for_consistency_anomalies(columns_info):
     # Suitable if there are ID columns, categorical columns, or numeric columns
     return len(id_columns) > 0 or len(categorical_columns) > 0 or len(numeric_columns) > 0
 
-def generate_anomalies(df, file_id):
+def max_anomalies_for(row_count):
     """
-    Generate data consistency anomalies in the dataset by prompting GPT to introduce them.
     The number of anomalies is dynamically decided based on table size.
     """
-    columns_info = analyze_columns(df)
-
-    if not is_suitable_for_consistency_anomalies(columns_info):
-        print(f"Table {file_id} is not suitable for data consistency anomalies. Skipping...")
-        return None, []
-
-    # Dynamically determine number of anomalies
-    row_count = len(df)
     if row_count <= 10:
-        max_anomalies = 3
+        return 3
     elif row_count <= 25:
-        max_anomalies = 5
+        return 5
     elif row_count <= 50:
-        max_anomalies = 7
+        return 7
     elif row_count <= 100:
-        max_anomalies = 10
+        return 10
     else:
-        max_anomalies = 10  # Upper bound
+        return 10  # Upper bound
+
+def build_prompt(df, file_id):
+    """
+    Build the GPT request that introduces data consistency anomalies in the dataset.
+    Returns None when the table is not suitable for them.
+    """
+    columns_info = analyze_columns(df)
+
+    if not is_suitable_for_consistency_anomalies(columns_info):
+        print(f"Table {file_id} is not suitable for data consistency anomalies. Skipping...")
+        return None
+
+    max_anomalies = max_anomalies_for(len(df))
 
     prompt = f"""
 First, thoroughly analyze the entire table. Understand its structure, context, and relationships between columns and rows. Do not skip this step.
@@ -127,22 +151,20 @@ Dataset:
 Modified Dataset in JSON:
 """
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4o",
+    return InjectionRequest(
         messages=[
             {"role": "system", "content": "You are a data expert skilled at introducing data consistency anomalies."},
             {"role": "user", "content": prompt},
         ],
-        max_tokens=3000,
-        temperature=0.7,
     )
 
-    output = response.choices[0].message.content.strip()
-    print(f"GPT Response for {file_id}:\n{output}")
-
+def apply_response(df, file_id, output):
+    """
+    Mark up to max_anomalies_for(len(df)) changed cells with '@@@_' and revert the rest.
+    Returns (modified_df, log_entries); raises if the reply cannot be used.
+    """
+    max_anomalies = max_anomalies_for(len(df))
     log_entries = []
-    # Add GPT response to log_entries
-    log_entries.append(f"GPT Response for {file_id}:\n{output}")
 
     try:
         json_content = extract_json_from_response(output)
@@ -181,46 +203,24 @@ Modified Dataset in JSON:
 
     except Exception as e:
         print(f"Error parsing GPT output for {file_id}: {e}")
-        print("Skipping table due to error.")
-        return None, []
-
-# Process each file in the input folder
-for filename in sorted(os.listdir(input_folder)):
-    # >>> Changed here: now we look for .json instead of .csv
-    if filename.endswith(".json"):
-        file_path = os.path.join(input_folder, filename)
-        file_id = os.path.splitext(filename)[0]
-        try:
-            # Instead of pd.read_csv, read JSON
-            with open(file_path, "r", encoding="utf-8") as f:
-                table_data = json.load(f)
-            df = pd.DataFrame(table_data)
-            print(f"Processing: {filename}")
-
-            modified_df, log_entries = generate_anomalies(df, file_id)
-
-            if modified_df is not None:  # Only save if anomalies are generated
-                # >>> Manually write JSON to avoid escaping slashes & unicode
-                json_str = modified_df.to_json(None, orient="records", indent=4, force_ascii=False)
-                # Replace escaped slash
-                json_str = json_str.replace('\\/', '/')
-
-                output_path = os.path.join(output_folder, f"{file_id}_updated.json")
-                with open(output_path, "w", encoding="utf-8") as out_f:
-                    out_f.write(json_str)
-
-                print(f"Saved updated file: {output_path}")
-
-                # Save the log file
-                log_path = os.path.join(log_folder, "anomalies_log.txt")
-                with open(log_path, "a", encoding="utf-8") as log_file:
-                    log_file.write(f"Table: {filename}\n")
-                    log_file.write("\n".join(log_entries))
-                    log_file.write("\n\n")
-            else:
-                print(f"No anomalies generated for {filename}, skipping saving.")
-
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
-
-print(f"All modified files and logs have been saved.")
+        raise  # recorded as failed in the run manifest, redone with --retry-failed
+
+# Process each file in the input folder (concurrently; results are written in file order)
+run_generator(
+    BATCH_MODE, BATCH_INPUT, BATCH_OUTPUT,
+    input_folder,
+    output_folder,
+    os.path.join(log_folder, "anomalies_log.txt"),
+    build_prompt,
+    apply_response,
+    api_key=API_KEY,
+    base_url=BASE_URL,
+    model="gpt-4o",
+    max_tokens=3000,
+    temperature=0.7,
+    concurrency=CONCURRENCY,
+    requests_per_minute=REQUESTS_PER_MINUTE,
+    tokens_per_minute=TOKENS_PER_MINUTE,
+    cache=open_cache(CACHE_PATH, CACHE_READ_ONLY),
+)
+
@@ -1,17 +1,42 @@
 import os
 import math
 import pandas as pd
-import openai
 import json
 import re
 import tiktoken
+from injection_engine import InjectionEngine, InjectionRequest, gather_slices
+from injection_batch import run_generator
+from response_cache import open_cache
 
 # ────────────────────────────────────────────────────────────────────────────
 # CONFIG
 # ────────────────────────────────────────────────────────────────────────────
-openai.api_key = ""
+# BASE_URL may point at any OpenAI-compatible server, e.g. a local mock
+API_KEY  = ""
+BASE_URL = None
 max_model_tokens = 16384
 
+# Concurrency and per-minute limits for the injection engine (set the
+# per-minute limits to your account's gpt-4o tier)
+CONCURRENCY         = 16
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE   = 800_000
+
+# Send all slices of a table at once (False: one slice after another)
+CONCURRENT_SLICES = True
+
+# Batch API mode: None sends requests interactively; "emit" writes them to
+# BATCH_INPUT, "submit" also uploads it, "ingest" applies BATCH_OUTPUT
+# (downloading it first when only the submitted batch id is there)
+BATCH_MODE   = None
+BATCH_INPUT  = r""
+BATCH_OUTPUT = r""
+
+# Response cache (SQLite file; "" disables it). CACHE_READ_ONLY replays
+# cached replies only and never calls the API
+CACHE_PATH      = r""
+CACHE_READ_ONLY = False
+
 input_folder  = r""
 output_folder = r""
 log_file      = r""
@@ -57,7 +82,7 @@ def validate_json_structure(js: str) -> bool:
 # ────────────────────────────────────────────────────────────────────────────
 # CORE FUNCTIONS
 # ────────────────────────────────────────────────────────────────────────────
-def generate_factual_anomalies(df: pd.DataFrame, file_id: str, max_anomalies: int):
+async def generate_factual_anomalies(engine: InjectionEngine, df: pd.DataFrame, file_id: str, max_anomalies: int):
     """
     Uses GPT to inject up to `max_anomalies` factual anomalies into `df`.
     Returns modified DataFrame (with markers) and a list of log entries.
@@ -119,17 +144,13 @@ Return modified dataset now:
     in_tokens = len(enc.encode(system_msg)) + len(enc.encode(prompt))
     max_out = max_model_tokens - in_tokens - 50
 
-    rsp = openai.ChatCompletion.create(
-        model="gpt-4o",
+    reply = await engine.complete(InjectionRequest(
         messages=[
             {"role": "system", "content": system_msg},
             {"role": "user",   "content": prompt}
         ],
-        temperature=0.7,
-        max_tokens=max_out
-    )
-
-    reply = rsp.choices[0].message.content.strip()
+        max_tokens=max_out,
+    ))
     # Separate JSON and explanations
     json_end_idx = reply.rfind(']')
     if json_end_idx == -1:
@@ -169,7 +190,7 @@ Return modified dataset now:
     return modified, logs
 
 
-def process_in_chunks(df: pd.DataFrame, file_id: str, total_anomalies: int, chunk_size: int = 30):
+async def process_in_chunks(engine: InjectionEngine, df: pd.DataFrame, file_id: str, total_anomalies: int, chunk_size: int = 30):
     """
     Splits `df` into chunks to respect token limits, distributes `total_anomalies` across slices,
     calls `generate_factual_anomalies` on each sub-DataFrame, then reassembles results.
@@ -186,11 +207,17 @@ def process_in_chunks(df: pd.DataFrame, file_id: str, total_anomalies: int, chun
     all_modified = []
     all_logs = []
 
-    for start, end in zip(boundaries, boundaries[1:]):
+    spans = list(zip(boundaries, boundaries[1:]))
+    jobs = []
+    for start, end in spans:
         sub = df.iloc[start:end].reset_index(drop=True)
         slice_anoms = max(1, int(total_anomalies * (end-start) / n))
         sub_id = f"{file_id}_{start}-{end}"
-        mod_sub, sub_logs = generate_factual_anomalies(sub, sub_id, slice_anoms)
+        jobs.append(generate_factual_anomalies(engine, sub, sub_id, slice_anoms))
+
+    # Slices are independent: dispatch them together, then reassemble in order
+    results = await gather_slices(jobs, concurrent=CONCURRENT_SLICES)
+    for (start, end), (mod_sub, sub_logs) in zip(spans, results):
         all_modified.append(mod_sub)
 
         # Adjust row indices in logs
@@ -207,32 +234,23 @@ def process_in_chunks(df: pd.DataFrame, file_id: str, total_anomalies: int, chun
 # ────────────────────────────────────────────────────────────────────────────
 # MAIN LOOP
 # ────────────────────────────────────────────────────────────────────────────
-for fname in sorted(os.listdir(input_folder)):
-    if not fname.endswith('.json'):
-        continue
-    path = os.path.join(input_folder, fname)
-    fid  = os.path.splitext(fname)[0]
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        df = pd.DataFrame(data)
-        print(f"Processing: {fname}")
-
-        row_count     = len(df)
-        max_anomalies = math.ceil(row_count * 0.30)
-        mod_df, log_entries = process_in_chunks(df, fid, max_anomalies)
-       
-
-        out_path = os.path.join(output_folder, f"{fid}_updated.json")
-        mod_df.to_json(out_path, orient="records", indent=4, force_ascii=False)
-        print(f"Saved updated file: {out_path}")
-
-        # Append to log
-        with open(log_file, 'a', encoding='utf-8') as lf:
-            lf.write(f"Table: {fname}\n")
-            lf.write("\n".join(log_entries) + "\n\n")
-
-    except Exception as e:
-        print(f"Error processing {fname}: {e}")
-
-print("All modified files and logs have been saved.")
+async def process_table(engine: InjectionEngine, df: pd.DataFrame, fid: str):
+    max_anomalies = math.ceil(len(df) * 0.30)
+    return await process_in_chunks(engine, df, fid, max_anomalies)
+
+# Tables and their slices run concurrently; results are written in file order
+run_generator(
+    BATCH_MODE, BATCH_INPUT, BATCH_OUTPUT,
+    input_folder,
+    output_folder,
+    log_file,
+    process_table=process_table,
+    api_key             = API_KEY,
+    base_url            = BASE_URL,
+    model               = "gpt-4o",
+    temperature         = 0.7,
+    concurrency         = CONCURRENCY,
+    requests_per_minute = REQUESTS_PER_MINUTE,
+    tokens_per_minute   = TOKENS_PER_MINUTE,
+    cache               = open_cache(CACHE_PATH, CACHE_READ_ONLY),
+)
@@ -2,17 +2,41 @@ import os
 import math
 import ast
 import pandas as pd
-import openai
 import json
 import re
 import tiktoken
+from injection_engine import InjectionEngine, InjectionRequest, gather_slices
+from injection_batch import run_generator
+from response_cache import open_cache
 
 # ────────────────────────────────────────────────────────────────────────────
 # CONFIG
 # ────────────────────────────────────────────────────────────────────────────
-openai.api_key = ""
+# BASE_URL may point at any OpenAI-compatible server, e.g. a local mock
+API_KEY  = ""
+BASE_URL = None
 max_model_tokens = 16384
 
+# Concurrency and per-minute limits for the injection engine
+CONCURRENCY         = 8
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE   = 30_000
+
+# Send all slices of a table at once (False: one slice after another)
+CONCURRENT_SLICES = True
+
+# Batch API mode: None sends requests interactively; "emit" writes them to
+# BATCH_INPUT, "submit" also uploads it, "ingest" applies BATCH_OUTPUT
+# (downloading it first when only the submitted batch id is there)
+BATCH_MODE   = None
+BATCH_INPUT  = r""
+BATCH_OUTPUT = r""
+
+# Response cache (SQLite file; "" disables it). CACHE_READ_ONLY replays
+# cached replies only and never calls the API
+CACHE_PATH      = r""
+CACHE_READ_ONLY = False
+
 input_folder  = r""
 output_folder = r""
 log_folder    = r""
@@ -63,8 +87,8 @@ def validate_json_structure(js: str) -> bool:
 # ────────────────────────────────────────────────────────────────────────────
 # CHUNKING  (✓ change: min 5 / max 10 anomalies per slice)
 # ────────────────────────────────────────────────────────────────────────────
-def process_in_chunks(df: pd.DataFrame, file_id: str,
-                      total_anomalies: int, chunk_size: int = 50):
+async def process_in_chunks(engine: InjectionEngine, df: pd.DataFrame, file_id: str,
+                            total_anomalies: int, chunk_size: int = 50):
     modified, logs = [], []
     n = len(df)
 
@@ -76,8 +100,10 @@ def process_in_chunks(df: pd.DataFrame, file_id: str,
     auto_chunk     = max(1, int(safe_budget / avg_row_tokens))
     chunk_size     = min(chunk_size, auto_chunk)
 
-    idxs = list(range(0, n, chunk_size)) + [n]
-    for start, end in zip(idxs, idxs[1:]):
+    idxs  = list(range(0, n, chunk_size)) + [n]
+    spans = list(zip(idxs, idxs[1:]))
+    jobs  = []
+    for start, end in spans:
         sub         = df.iloc[start:end].reset_index(drop=True)
 
         # NEW: guarantee 5 – 10 anomalies per slice
@@ -85,7 +111,11 @@ def process_in_chunks(df: pd.DataFrame, file_id: str,
         slice_anoms = min(slice_anoms, 10)
 
         sub_id      = f"{file_id}_{start}-{end}"
-        mod_sub, sub_log = generate_anomalies(sub, sub_id, slice_anoms)
+        jobs.append(generate_anomalies(engine, sub, sub_id, slice_anoms))
+
+    # Slices are independent: dispatch them together, then reassemble in order
+    results = await gather_slices(jobs, concurrent=CONCURRENT_SLICES)
+    for (start, end), (mod_sub, sub_log) in zip(spans, results):
         modified.append(mod_sub)
 
         # shift row numbers in logs
@@ -100,7 +130,7 @@ def process_in_chunks(df: pd.DataFrame, file_id: str,
 # ────────────────────────────────────────────────────────────────────────────
 # GPT-DRIVEN ANOMALY GENERATION  (✓ change: Reason line)
 # ────────────────────────────────────────────────────────────────────────────
-def generate_anomalies(df: pd.DataFrame, file_id: str, max_anomalies: int):
+async def generate_anomalies(engine: InjectionEngine, df: pd.DataFrame, file_id: str, max_anomalies: int):
     cols   = analyze_columns(df)
     prompt = f"""
         First, thoroughly analyze the entire table. Understand its structure, context, and relationships between columns and rows. Do not skip this step.
@@ -155,15 +185,11 @@ Return the modified table now:
     in_tokens  = len(enc.encode(system_msg)) + len(enc.encode(prompt))
     max_out    = max_model_tokens - in_tokens - 50
 
-    rsp = openai.ChatCompletion.create(
-        model       = "gpt-4o",
-        messages    = [{"role": "system", "content": system_msg},
-                       {"role": "user",   "content": prompt}],
-        temperature = 0.7,
-        max_tokens  = max_out,
-    )
-
-    reply       = rsp.choices[0].message.content.strip()
+    reply = await engine.complete(InjectionRequest(
+        messages   = [{"role": "system", "content": system_msg},
+                      {"role": "user",   "content": prompt}],
+        max_tokens = max_out,
+    ))
     log_entries = [f"GPT raw reply for {file_id}:\n{reply}"]
 
     js = extract_json_from_response(reply)
@@ -202,37 +228,23 @@ Return the modified table now:
 # ────────────────────────────────────────────────────────────────────────────
 # MAIN LOOP
 # ────────────────────────────────────────────────────────────────────────────
-for filename in sorted(os.listdir(input_folder)):
-    if not filename.endswith(".json"):
-        continue
-
-    file_path = os.path.join(input_folder, filename)
-    file_id   = os.path.splitext(filename)[0]
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            table_data = json.load(f)
-        df = pd.DataFrame(table_data)
-
-        print(f"Processing: {filename}")
-        row_count     = len(df)
-        max_anomalies = math.ceil(row_count * 0.5)
-
-        modified_df, log_entries = process_in_chunks(
-            df, file_id, max_anomalies, chunk_size=50
-        )
-
-        output_path = os.path.join(output_folder, f"{file_id}_updated.json")
-        modified_df.to_json(output_path, orient="records", indent=4)
-        print(f"Saved updated file: {output_path}")
-
-        log_path = os.path.join(log_folder, "anomalies_log.txt")
-        with open(log_path, "a", encoding="utf-8") as lf:
-            lf.write(f"Table: {filename}\n")
-            lf.write("\n".join(log_entries))
-            lf.write("\n\n")
-
-    except Exception as exc:
-        print(f"Error processing {filename}: {exc}")
-
-print("All modified files and logs have been saved.")
-
+async def process_table(engine: InjectionEngine, df: pd.DataFrame, file_id: str):
+    max_anomalies = math.ceil(len(df) * 0.5)
+    return await process_in_chunks(engine, df, file_id, max_anomalies, chunk_size=50)
+
+# Tables run concurrently; results are written in file order
+run_generator(
+    BATCH_MODE, BATCH_INPUT, BATCH_OUTPUT,
+    input_folder,
+    output_folder,
+    os.path.join(log_folder, "anomalies_log.txt"),
+    process_table=process_table,
+    api_key             = API_KEY,
+    base_url            = BASE_URL,
+    model               = "gpt-4o",
+    temperature         = 0.7,
+    concurrency         = CONCURRENCY,
+    requests_per_minute = REQUESTS_PER_MINUTE,
+    tokens_per_minute   = TOKENS_PER_MINUTE,
+    cache               = open_cache(CACHE_PATH, CACHE_READ_ONLY),
+)
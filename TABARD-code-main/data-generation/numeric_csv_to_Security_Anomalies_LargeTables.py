@@ -1,18 +1,43 @@
 import os
 import math
 import pandas as pd
-import openai
 import json
 import re
 import tiktoken
+from injection_engine import InjectionEngine, InjectionRequest, gather_slices, rejected_replies
+from injection_batch import run_generator
+from response_cache import open_cache
 
 # ────────────────────────────────────────────────────────────────────────────
 # CONFIG
 # ────────────────────────────────────────────────────────────────────────────
 
-openai.api_key = ""
+# BASE_URL may point at any OpenAI-compatible server, e.g. a local mock
+API_KEY  = ""
+BASE_URL = None
 max_model_tokens = 16384
 
+# Concurrency and per-minute limits for the injection engine (set the
+# per-minute limits to your account's gpt-4o tier)
+CONCURRENCY         = 16
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE   = 800_000
+
+# Send all slices of a table at once (False: one slice after another)
+CONCURRENT_SLICES = True
+
+# Batch API mode: None sends requests interactively; "emit" writes them to
+# BATCH_INPUT, "submit" also uploads it, "ingest" applies BATCH_OUTPUT
+# (downloading it first when only the submitted batch id is there)
+BATCH_MODE   = None
+BATCH_INPUT  = r""
+BATCH_OUTPUT = r""
+
+# Response cache (SQLite file; "" disables it). CACHE_READ_ONLY replays
+# cached replies only and never calls the API
+CACHE_PATH      = r""
+CACHE_READ_ONLY = False
+
 input_folder = r""
 output_folder = r""
 log_file = r""
@@ -58,7 +83,7 @@ def validate_json_structure(js: str) -> bool:
 # ────────────────────────────────────────────────────────────────────────────
 # CORE FUNCTIONS
 # ────────────────────────────────────────────────────────────────────────────
-def generate_security_anomalies(df: pd.DataFrame, file_id: str, max_anomalies: int):
+async def generate_security_anomalies(engine: InjectionEngine, df: pd.DataFrame, file_id: str, max_anomalies: int):
     cols_info = analyze_columns(df)
 
     prompt = f"""
@@ -101,14 +126,10 @@ Return modified dataset now:
     in_tokens = len(enc.encode(system_msg)) + len(enc.encode(prompt))
     max_out = max_model_tokens - in_tokens - 50
 
-    rsp = openai.ChatCompletion.create(
-        model="gpt-4o",
+    reply = await engine.complete(InjectionRequest(
         messages=[{"role":"system","content":system_msg}, {"role":"user","content":prompt}],
-        temperature=0.7,
-        max_tokens=max_out
-    )
-
-    reply = rsp.choices[0].message.content.strip()
+        max_tokens=max_out,
+    ))
     json_part = extract_json_from_response(reply)
     explanation = reply.replace(json_part or '', '').strip() if json_part else ''
 
@@ -144,7 +165,7 @@ Return modified dataset now:
     return modified, logs, anomalies_found
 
 
-def process_in_chunks(df: pd.DataFrame, file_id: str, total_anomalies: int, chunk_size: int = 30):
+async def process_in_chunks(engine: InjectionEngine, df: pd.DataFrame, file_id: str, total_anomalies: int, chunk_size: int = 30):
     n = len(df)
     enc = tiktoken.encoding_for_model("gpt-4o")
     avg_tokens = len(enc.encode(df.head(10).to_json(orient='records'))) / 10
@@ -155,11 +176,17 @@ def process_in_chunks(df: pd.DataFrame, file_id: str, total_anomalies: int, chun
 
     all_mods, all_logs = [], []
     any_anoms = False
-    for start, end in zip(boundaries, boundaries[1:]):
+    spans = list(zip(boundaries, boundaries[1:]))
+    jobs = []
+    for start, end in spans:
         sub = df.iloc[start:end].reset_index(drop=True)
         slice_anoms = max(1, math.ceil(total_anomalies * (end-start) / n))
         sub_id = f"{file_id}_{start}-{end}"
-        mod_sub, sub_logs, found = generate_security_anomalies(sub, sub_id, slice_anoms)
+        jobs.append(generate_security_anomalies(engine, sub, sub_id, slice_anoms))
+
+    # Slices are independent: dispatch them together, then reassemble in order
+    results = await gather_slices(jobs, concurrent=CONCURRENT_SLICES)
+    for (start, end), (mod_sub, sub_logs, found) in zip(spans, results):
         all_mods.append(mod_sub)
         any_anoms |= found
         for entry in sub_logs:
@@ -175,26 +202,26 @@ def process_in_chunks(df: pd.DataFrame, file_id: str, total_anomalies: int, chun
 # ────────────────────────────────────────────────────────────────────────────
 # MAIN LOOP
 # ────────────────────────────────────────────────────────────────────────────
-for fname in sorted(os.listdir(input_folder)):
-    if not fname.endswith('.json'):
-        continue
-    path, fid = os.path.join(input_folder, fname), os.path.splitext(fname)[0]
-    with open(path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    df = pd.DataFrame(data)
-
-    print(f"Processing: {fname}")
+async def process_table(engine: InjectionEngine, df: pd.DataFrame, fid: str):
     total_anoms = math.ceil(len(df) * 0.30)
-    mod_df, log_entries, anoms_present = process_in_chunks(df, fid, total_anoms)
-
-    if anoms_present:
-        out_path = os.path.join(output_folder, f"{fid}_updated.json")
-        mod_df.to_json(out_path, orient='records', indent=4, force_ascii=False)
-        print(f"Saved updated file: {out_path}")
-        with open(log_file, 'a', encoding='utf-8') as lf:
-            lf.write(f"Table: {fname}\n")
-            lf.write("\n".join(log_entries) + "\n\n")
-    else:
-        print(f"No anomalies imparted for {fname}. File skipped.")
-
-print("All modified files and logs have been saved.")
+    mod_df, log_entries, anoms_present = await process_in_chunks(engine, df, fid, total_anoms)
+    if not anoms_present:  # recorded as failed, redone with --retry-failed
+        raise rejected_replies(fid, log_entries)
+    return mod_df, log_entries
+
+# Tables and their slices run concurrently; results are written in file order
+run_generator(
+    BATCH_MODE, BATCH_INPUT, BATCH_OUTPUT,
+    input_folder,
+    output_folder,
+    log_file,
+    process_table=process_table,
+    api_key             = API_KEY,
+    base_url            = BASE_URL,
+    model               = "gpt-4o",
+    temperature         = 0.7,
+    concurrency         = CONCURRENCY,
+    requests_per_minute = REQUESTS_PER_MINUTE,
+    tokens_per_minute   = TOKENS_PER_MINUTE,
+    cache               = open_cache(CACHE_PATH, CACHE_READ_ONLY),
+)
@@ -2,6 +2,7 @@ import os
 import pandas as pd
 import random
 import json
+from run_manifest import RunManifest, MANIFEST_NAME, DONE, FAILED, retry_failed_requested, sha256_file
 
 # Folders for input, output, and Yes/No tables
 input_folder = r"C:\Users\MAMANROY CHOUDHURY\Downloads\WikiTableQuestions-master\numeric_json_long_tables_spider_beaver"
@@ -77,14 +78,19 @@ def generate_yes_no_table(df, anomalies):
             yes_no.at[row, col] = "Yes"
     return yes_no
 
-def impart_value_anomalies(input_folder, output_folder, yes_no_folder, log_file_path):
+def impart_value_anomalies(input_folder, output_folder, yes_no_folder, log_file_path, retry_failed=False):
     total_anom = 0
     table_count = 0
 
-    with open(log_file_path, "w", encoding="utf-8") as log_file:
+    # Tables already in the manifest are skipped, so a restarted run appends to the log
+    manifest = RunManifest(os.path.join(output_folder, MANIFEST_NAME))
+    with open(log_file_path, "a" if len(manifest) else "w", encoding="utf-8") as log_file:
         for filename in os.listdir(input_folder):
             if not filename.endswith(".json"):
                 continue
+            if manifest.is_complete(filename, retry_failed):
+                print(f"[Skip] {filename}: already {manifest.status(filename)} in manifest")
+                continue
 
             in_path = os.path.join(input_folder, filename)
             out_path = os.path.join(output_folder, filename)
@@ -115,13 +121,18 @@ def impart_value_anomalies(input_folder, output_folder, yes_no_folder, log_file_
                     log_file.write(f"- Type: {a['type']}\n")
                     log_file.write(f"  Description: {a['description']}\n")
                 log_file.write("\n")
+                log_file.flush()
+                manifest.record(filename, DONE, output=out_path, output_sha256=sha256_file(out_path))
 
                 total_anom += len(anomalies)
                 table_count += 1
             except Exception as e:
                 print(f"Error processing {filename}: {e}")
+                manifest.record(filename, FAILED, error=f"{type(e).__name__}: {e}")
 
     print(f"\nProcessed {table_count} tables, imparted {total_anom} anomalies in total.")
+    print(manifest.summary())
 
 if __name__ == "__main__":
-    impart_value_anomalies(input_folder, output_folder, yes_no_folder, log_file_path)
+    impart_value_anomalies(input_folder, output_folder, yes_no_folder, log_file_path,
+                           retry_failed=retry_failed_requested())
@@ -0,0 +1,199 @@
+# ── response_cache.py ───────────────────────────────────────────────────────
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+# Persistent cache of chat-completion replies, one SQLite file shared by all
+# generators and detectors. An entry is keyed on
+#   (model, sha256 of the messages, temperature, max_tokens)
+# so re-running a script after a crash, or after changing only the parsing
+# code, costs no API calls. Least recently used entries are evicted once the
+# stored replies exceed `max_bytes`.
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    model         TEXT    NOT NULL,
+    messages_hash TEXT    NOT NULL,
+    temperature   REAL    NOT NULL,
+    max_tokens    INTEGER NOT NULL,
+    reply         TEXT    NOT NULL,
+    size          INTEGER NOT NULL,
+    created       REAL    NOT NULL,
+    last_used     REAL    NOT NULL,
+    PRIMARY KEY (model, messages_hash, temperature, max_tokens)
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+class CacheMiss(KeyError):
+    """Raised in read-only replay mode when a request has no cached reply."""
+
+
+def messages_hash(messages: list) -> str:
+    payload = json.dumps(messages, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _key(body: dict) -> tuple:
+    return (
+        body["model"],
+        messages_hash(body["messages"]),
+        float(body.get("temperature") or 0.0),
+        int(body.get("max_tokens") or 0),
+    )
+
+
+class ResponseCache:
+    """
+    SQLite-backed reply cache.
+
+    Usage:
+        cache = ResponseCache("llm_cache.sqlite")
+        reply = cache.get(body)          # body = {"model", "messages", "temperature", "max_tokens"}
+        if reply is None:
+            reply = call_the_api(body)
+            cache.put(body, reply)
+        print(cache.summary())
+
+    With read_only=True the database is opened read-only, nothing is written
+    or evicted, and get_or_raise() raises CacheMiss instead of returning None,
+    so a replay run can never reach the API.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES, read_only: bool = False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+        if read_only:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"Read-only replay needs an existing response cache: {path}")
+            self._db = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, timeout=30)
+        else:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+            self._db.commit()
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    # ─── lookups ────────────────────────────────────────────────────────────
+    def get(self, body: dict):
+        """Return the cached reply for a request body, or None."""
+        key = _key(body)
+        row = self._db.execute(
+            "SELECT reply FROM responses "
+            "WHERE model = ? AND messages_hash = ? AND temperature = ? AND max_tokens = ?",
+            key,
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if not self.read_only:
+            self._db.execute(
+                "UPDATE responses SET last_used = ? "
+                "WHERE model = ? AND messages_hash = ? AND temperature = ? AND max_tokens = ?",
+                (time.time(),) + key,
+            )
+            self._db.commit()
+        return row[0]
+
+    def get_or_raise(self, body: dict):
+        """Like get(), but a miss in read-only mode raises CacheMiss."""
+        reply = self.get(body)
+        if reply is None and self.read_only:
+            raise CacheMiss(f"No cached reply for this {body['model']} request (read-only replay)")
+        return reply
+
+    # ─── writes ─────────────────────────────────────────────────────────────
+    def put(self, body: dict, reply: str):
+        if self.read_only:
+            return
+        key = _key(body)
+        size = len(reply.encode("utf-8"))
+        now = time.time()
+        old = self._db.execute(
+            "SELECT size FROM responses "
+            "WHERE model = ? AND messages_hash = ? AND temperature = ? AND max_tokens = ?",
+            key,
+        ).fetchone()
+        self._db.execute(
+            "INSERT OR REPLACE INTO responses "
+            "(model, messages_hash, temperature, max_tokens, reply, size, created, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            key + (reply, size, now, now),
+        )
+        self._bytes += size - (old[0] if old else 0)
+        if self._bytes > self.max_bytes:
+            self._evict()
+        self._db.commit()
+
+    def _evict(self):
+        """Drop least recently used replies until the cache is back under 90% of max_bytes."""
+        target = self.max_bytes * 0.9
+        rows = self._db.execute("SELECT rowid, size FROM responses ORDER BY last_used").fetchall()
+        doomed = []
+        for rowid, size in rows:
+            if self._bytes <= target:
+                break
+            doomed.append((rowid,))
+            self._bytes -= size
+        self._db.executemany("DELETE FROM responses WHERE rowid = ?", doomed)
+        self.evicted += len(doomed)
+
+    # ─── stats ──────────────────────────────────────────────────────────────
+    def stats(self) -> dict:
+        entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evicted": self.evicted,
+            "entries": entries,
+            "bytes": self._bytes,
+        }
+
+    def summary(self) -> str:
+        s = self.stats()
+        return (
+            f"Response cache {self.path}: {s['hits']} hits, {s['misses']} misses "
+            f"({s['hit_rate']:.1%} hit rate), {s['entries']} entries, "
+            f"{s['bytes'] / 1024 ** 2:.1f} MB, {s['evicted']} evicted"
+        )
+
+    def close(self):
+        self._db.close()
+
+
+def open_cache(path: str, read_only: bool = False, max_bytes: int = DEFAULT_MAX_BYTES):
+    """ResponseCache for `path`, or None when `path` is empty (caching disabled)."""
+    if not path:
+        return None
+    return ResponseCache(path, max_bytes=max_bytes, read_only=read_only)
+
+
+def chat_completion(client, cache, **body) -> str:
+    """
+    Synchronous, cached chat completion for scripts that call the API directly
+    (MUSEVE.py, SEVCOT.py). Returns the stripped reply text.
+    """
+    if cache is not None:
+        reply = cache.get_or_raise(body)
+        if reply is not None:
+            return reply
+    response = client.chat.completions.create(**body)
+    reply = (response.choices[0].message.content or "").strip()
+    if cache is not None:
+        cache.put(body, reply)
+    return reply
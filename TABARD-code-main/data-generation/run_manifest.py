@@ -0,0 +1,117 @@
+# ── run_manifest.py ─────────────────────────────────────────────────────────
+
+import os
+import sys
+import json
+import time
+import hashlib
+
+# Append-only record of what a generator run has finished, one JSON line per
+# input file as it completes:
+#   {"file": "t1.json", "status": "done", "output": ".../t1_updated.json",
+#    "output_sha256": "...", "tokens": {"prompt": 812, "completion": 640},
+#    "error": null, "time": 1718000000.0}
+# The last line for a file wins. On restart, files whose last status is
+# "done" (with its output still on disk) or "skipped" (the generator turned
+# the table down, e.g. no suitable columns) are not processed again, nor are
+# "failed" ones (API errors, or a reply that could not be parsed or yielded
+# no anomalies; "error" holds why) unless the script is started with
+# --retry-failed.
+MANIFEST_NAME = "manifest.jsonl"
+
+DONE, SKIPPED, FAILED = "done", "skipped", "failed"
+
+
+def retry_failed_requested() -> bool:
+    return "--retry-failed" in sys.argv[1:]
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class RunManifest:
+    """
+    Usage:
+        manifest = RunManifest(os.path.join(output_folder, MANIFEST_NAME))
+        for filename in files:
+            if manifest.is_complete(filename, retry_failed):
+                continue
+            ...
+            manifest.record(filename, DONE, output=out_path, output_sha256=..., tokens=...)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry["file"]] = entry
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        continue  # torn last line from a crash mid-write
+            with open(path, "rb+") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")  # start new entries on their own line
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def status(self, filename: str):
+        entry = self.entries.get(filename)
+        return entry["status"] if entry else None
+
+    def is_complete(self, filename: str, retry_failed: bool = False) -> bool:
+        entry = self.entries.get(filename)
+        if entry is None:
+            return False
+        if entry["status"] == DONE:
+            return not entry.get("output") or os.path.exists(entry["output"])
+        if entry["status"] == FAILED:
+            return not retry_failed
+        return True
+
+    def record(self, filename: str, status: str, output: str = None, output_sha256: str = None,
+               tokens: dict = None, error: str = None):
+        entry = {
+            "file": filename,
+            "status": status,
+            "output": output,
+            "output_sha256": output_sha256,
+            "tokens": tokens or {},
+            "error": error,
+            "time": time.time(),
+        }
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        # One O_APPEND write per entry, flushed to disk before returning, so a
+        # crash leaves at most a torn last line (ignored when reading)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.entries[filename] = entry
+
+    def summary(self) -> str:
+        counts = {}
+        for entry in self.entries.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        tokens = sum(sum(entry.get("tokens", {}).values()) for entry in self.entries.values())
+        parts = ", ".join(f"{n} {status}" for status, n in sorted(counts.items()))
+        return f"Manifest {self.path}: {parts or 'empty'}; {tokens} tokens used"
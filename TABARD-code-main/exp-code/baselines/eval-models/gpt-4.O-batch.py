@@ -1,8 +1,8 @@
 from openai import OpenAI
-import time 
-from tqdm.auto import tqdm
 import logging
 import os
+from src.experiment_matrix import OpenAIBatchBackend, expand_matrix, run_matrix
+from src.job_registry import JobRegistry
 
 def setup_logger(log_name: str = "batch_logger", log_file: str = "gpt4o_batch.log", level=logging.INFO):
     """
@@ -42,48 +42,24 @@ folder = ['(dataset_name ie.(FetaQA ... ))-jsonl-gpt4o-level4-ncot', '(dataset_n
 List = ['Calculation_Based_Anomaly_(dataset_name ie.(FetaQA ... ))','Data_Consistency_Anomaly_(dataset_name ie.(FetaQA ... ))','Factual_Anomaly_(dataset_name ie.(FetaQA ... ))','Logical_Anomaly_(dataset_name ie.(FetaQA ... ))','Normalization_Anomaly_(dataset_name ie.(FetaQA ... ))','Security_anomaly_(dataset_name ie.(FetaQA ... ))','Temporal_Anomaly_(dataset_name ie.(FetaQA ... ))','Value_Anomaly_(dataset_name ie.(FetaQA ... ))']
 
 
-for fold in tqdm(folder,desc="Processing Folder"):
-    for i in tqdm(List, desc="Processing batches"):
-        input_jsonl_path = f"..dataset_name ie.(FetaQA ... ))/batch-files-gpt/{fold}/{i}.jsonl"
-        output_jsonl_path = f"..(dataset_name ie.(FetaQA ... ))/gpt-output/output_folder-{fold}/{i}.jsonl"
-        try:
-            logger.info(f"Starting batch for: {i}")
-            batch_input_file = client.files.create(
-                file=open(input_jsonl_path, "rb"),
-                purpose="batch"
-            )
-            logger.info(f"Uploaded input file: {batch_input_file.id}")
+# Jobs in flight at once; one shared poller checks each of them at most every
+# POLL_INTERVAL seconds, backing off adaptively up to MAX_POLL_INTERVAL
+MAX_IN_FLIGHT = 16
+POLL_INTERVAL = 30
+MAX_POLL_INTERVAL = 600
 
-            batch = client.batches.create(
-                input_file_id=batch_input_file.id,
-                endpoint="/v1/chat/completions",
-                completion_window="24h",
-                metadata={"description": f"{i} - anomaly-detection-batch-job"}
-            )
-            logger.info(f"Created batch: {batch.id}")
+# Record of submitted jobs: a rerun reattaches to running jobs and skips
+# succeeded ones instead of submitting them again
+REGISTRY_PATH = "logs/gpt4o_batch_jobs.sqlite"
 
-            def wait_for_batch(batch_id, interval=30):
-                while True:
-                    b = client.batches.retrieve(batch_id)
-                    logger.info(f"Batch {batch_id} status: {b.status}")
-                    if b.status in ["completed", "failed", "cancelled", "expired"]:
-                        return b
-                    time.sleep(interval)
-
-            batch = wait_for_batch(batch.id)
-
-            if batch.status == "completed" and batch.output_file_id:
-                result_file = client.files.content(batch.output_file_id)
-
-                output_dir = os.path.dirname(output_jsonl_path)
-                os.makedirs(output_dir, exist_ok=True)
-
-                with open(output_jsonl_path, "w", encoding="utf-8") as f:
-                    f.write(result_file.text)
-                logger.info(f"Batch output saved to {output_jsonl_path}")
-            else:
-                logger.warning(f"Batch {batch.id} finished with status: {batch.status}. No output saved.")
-
-        except Exception as e:
-            logger.error(f"Error in processing {i}: {str(e)}")
+# {prompt} is a batch-file folder from `folder`, {category} an entry of `List`
+input_jsonl_path = "..dataset_name ie.(FetaQA ... ))/batch-files-gpt/{prompt}/{category}.jsonl"
+output_jsonl_path = "..(dataset_name ie.(FetaQA ... ))/gpt-output/output_folder-{prompt}/{category}.jsonl"
 
+backend = OpenAIBatchBackend(client, input_jsonl_path, output_jsonl_path)
+experiments = expand_matrix(["gpt-4o"], folder, ["(dataset_name ie.(FetaQA ... ))"], categories=List)
+logger.info(f"Running {len(experiments)} experiments, up to {MAX_IN_FLIGHT} at a time")
+registry = JobRegistry(REGISTRY_PATH)
+run_matrix(experiments, {"gpt-4o": backend}, max_in_flight=MAX_IN_FLIGHT, poll_interval=POLL_INTERVAL,
+           max_poll_interval=MAX_POLL_INTERVAL,
+           logger=logger, registry=registry)
@@ -1,64 +1,49 @@
 import vertexai
-from vertexai.batch_prediction import BatchPredictionJob
-import time
 import logging
-from tqdm.auto import tqdm
+from src.experiment_matrix import VertexBatchBackend, expand_matrix, run_matrix
+from src.job_registry import JobRegistry
 
 folder = ['(dataset_name ie.(FetaQA ... ))-jsonl-llama-level1-ncot', '(dataset_name ie.(FetaQA ... ))-jsonl-llama-level1-wcot', '(dataset_name ie.(FetaQA ... ))-jsonl-llama-level2-ncot', '(dataset_name ie.(FetaQA ... ))-jsonl-llama-level2-wcot', '(dataset_name ie.(FetaQA ... ))-jsonl-llama-level-3-ncot','(dataset_name ie.(FetaQA ... ))-jsonl-llama-level3-wcot', '(dataset_name ie.(FetaQA ... ))-jsonl-llama-level4-ncot', '(dataset_name ie.(FetaQA ... ))-jsonl-llama-level4-wcot', '(dataset_name ie.(FetaQA ... ))-jsonl-llama-prompt-1-1', '(dataset_name ie.(FetaQA ... ))-jsonl-llama-prompt-2-1']
 
 List = ['Calculation_Based_Anomaly_(dataset_name ie.(FetaQA ... ))','Data_Consistency_Anomaly_(dataset_name ie.(FetaQA ... ))','Factual_Anomaly_(dataset_name ie.(FetaQA ... ))','Logical_Anomaly_(dataset_name ie.(FetaQA ... ))','Normalization_Anomaly_(dataset_name ie.(FetaQA ... ))','Security_anomaly_(dataset_name ie.(FetaQA ... ))','Temporal_Anomaly_(dataset_name ie.(FetaQA ... ))','Value_Anomaly_(dataset_name ie.(FetaQA ... ))']
 
-for fold in tqdm(folder,desc="Processing Folder"):
-    # 'Calculation_Based_Anomaly_FeTaQA',
-    for i in tqdm(List, desc="Processing batches"):
-        # Initialize logging
-        logging.basicConfig(
-            filename="llama-batch_prediction_job5.log",  # Log file name
-            level=logging.INFO,                   # Log level (INFO, DEBUG, WARNING, ERROR)
-            format='%(asctime)s - %(levelname)s - %(message)s',  # Log format with timestamp
-        )
 
-        # Log the start of the script
-        logging.info("Starting the batch prediction job.")
-
-        # Initialize Vertex AI
-        vertexai.init(project="coral-lab-expirements", location="us-central1")
-
-        # Set input/output URIs
-        batch_input_bucket = f"(dataset_name ie.(FetaQA ... ))2"
-        batch_output_bucket = f"(dataset_name ie.(FetaQA ... ))2"
-        input_uri = f"gs://{batch_input_bucket}/{fold}/{i}.jsonl"
-        output_uri = f"gs://{batch_output_bucket}/output_folder-{fold}/{i}/"
-
-        # Log input/output URIs
-        logging.info(f"Input URI: {input_uri}")
-        logging.info(f"Output URI: {output_uri}")
-
-        # Submit the batch prediction job
-        try:
-            batch_prediction_job = BatchPredictionJob.submit(
-                source_model="publishers/meta/models/llama-3.1-70b-instruct-maas",
-                input_dataset=input_uri,
-                output_uri_prefix=output_uri,
-            )
-            logging.info(f"Job resource name: {batch_prediction_job.resource_name}")
-            logging.info(f"Model resource name with the job: {batch_prediction_job.model_name}")
-            logging.info(f"Job state: {batch_prediction_job.state.name}")
-        except Exception as e:
-            logging.error(f"Error while submitting the job: {str(e)}")
-            exit(1)
-
-        # Refresh the job until complete
-        while not batch_prediction_job.has_ended:
-            time.sleep(5)
-            batch_prediction_job.refresh()
-            logging.info(f"Job state: {batch_prediction_job.state.name}")
-
-        # Check if the job succeeded and log the result
-        if batch_prediction_job.has_succeeded:
-            logging.info("Job succeeded!")
-        else:
-            logging.error(f"Job failed: {batch_prediction_job.error}")
-
-        # Log the job output location
-        logging.info(f"Job output location: {batch_prediction_job.output_location}")
+# Initialize logging
+logging.basicConfig(
+    filename="llama-batch_prediction_job5.log",  # Log file name
+    level=logging.INFO,                   # Log level (INFO, DEBUG, WARNING, ERROR)
+    format='%(asctime)s - %(levelname)s - %(message)s',  # Log format with timestamp
+)
+
+# Log the start of the script
+logging.info("Starting the batch prediction job.")
+
+# Jobs in flight at once; one shared poller checks each of them at most every
+# POLL_INTERVAL seconds, backing off adaptively up to MAX_POLL_INTERVAL
+MAX_IN_FLIGHT = 16
+POLL_INTERVAL = 30
+MAX_POLL_INTERVAL = 600
+
+# Record of submitted jobs: a rerun reattaches to running jobs and skips
+# succeeded ones instead of submitting them again
+REGISTRY_PATH = "llama_batch_jobs.sqlite"
+
+# Initialize Vertex AI
+vertexai.init(project="coral-lab-expirements", location="us-central1")
+
+# Set input/output URIs ({prompt} is a batch-file folder from `folder`, {category} an entry of `List`)
+batch_input_bucket = f"(dataset_name ie.(FetaQA ... ))2"
+batch_output_bucket = f"(dataset_name ie.(FetaQA ... ))2"
+input_uri = f"gs://{batch_input_bucket}/{{prompt}}/{{category}}.jsonl"
+output_uri = f"gs://{batch_output_bucket}/output_folder-{{prompt}}/{{category}}/"
+
+MODEL = "publishers/meta/models/llama-3.1-70b-instruct-maas"
+
+# Results stay in the output bucket; the log records each job's output location
+backend = VertexBatchBackend(source_model=MODEL, input_uri=input_uri, output_uri=output_uri)
+experiments = expand_matrix([MODEL], folder, ["(dataset_name ie.(FetaQA ... ))"], categories=List)
+logging.info(f"Running {len(experiments)} experiments, up to {MAX_IN_FLIGHT} at a time")
+registry = JobRegistry(REGISTRY_PATH)
+run_matrix(experiments, {MODEL: backend}, max_in_flight=MAX_IN_FLIGHT, poll_interval=POLL_INTERVAL,
+           max_poll_interval=MAX_POLL_INTERVAL,
+           logger=logging.getLogger(), registry=registry)
@@ -3,6 +3,7 @@ import json
 import re
 from collections import defaultdict
 from tqdm import tqdm
+from src.sparse_predictions import is_sparse, merge_sparse, resolve_prediction_source, sparse_path
 
 def extract_base_and_range(filename):
     """
@@ -17,7 +18,15 @@ def extract_base_and_range(filename):
     return None, None
 
 def merge_chunks_in_folder(folder_path, output_folder):
-    """Merge chunked files in each subfolder and save as single merged files."""
+    """
+    Merge chunked files in each subfolder and save as single merged files.
+    A sparse <folder_path>.sparse.json is merged into <output_folder>.sparse.json instead.
+    """
+    source = resolve_prediction_source(folder_path)
+    if is_sparse(source):
+        merge_sparse(source, sparse_path(output_folder))
+        return
+
     for root, _, files in os.walk(folder_path):
         grouped_chunks = defaultdict(list)
 
@@ -48,6 +57,8 @@ def merge_chunks_in_folder(folder_path, output_folder):
             with open(merged_file_path, 'w', encoding='utf-8') as out_file:
                 json.dump(merged_data, out_file, indent=4, ensure_ascii=False)
 
+# gemini-1.5pro-postprocess.py now writes merged predictions directly; this only merges chunk
+# predictions (dense folders or chunk-level sparse files) left by older runs.
 if __name__ == "__main__":
     folder = ['(dataset_name ie.(FetaQA ... ))-jsonl-gemini-level1-ncot', '(dataset_name ie.(FetaQA ... ))-jsonl-gemini-level1-wcot', '(dataset_name ie.(FetaQA ... ))-jsonl-gemini-level2-ncot', '(dataset_name ie.(FetaQA ... ))-jsonl-gemini-level2-wcot', '(dataset_name ie.(FetaQA ... ))-jsonl-gemini-level3-ncot', '(dataset_name ie.(FetaQA ... ))-jsonl-gemini-level3-wcot', '(dataset_name ie.(FetaQA ... ))-jsonl-gemini-level4-ncot', '(dataset_name ie.(FetaQA ... ))-jsonl-gemini-level4-wcot', '(dataset_name ie.(FetaQA ... ))-jsonl-gemini-prompt-1-1', '(dataset_name ie.(FetaQA ... ))-jsonl-gemini-prompt-2-1']
     List = ['Calculation_Based_Anomaly_(dataset_name ie.(FetaQA ... ))','Data_Consistency_Anomaly_(dataset_name ie.(FetaQA ... ))','Factual_Anomaly_(dataset_name ie.(FetaQA ... ))','Logical_Anomaly_(dataset_name ie.(FetaQA ... ))','Normalization_Anomaly_(dataset_name ie.(FetaQA ... ))','Security_anomaly_(dataset_name ie.(FetaQA ... ))','Temporal_Anomaly_(dataset_name ie.(FetaQA ... ))','Value_Anomaly_(dataset_name ie.(FetaQA ... ))']
@@ -1,48 +1,45 @@
 import json
 import os
 import typing
-import tiktoken
+from src.token_counts import TokenCounter, get_counter
+from src.chunk_plan import plan_tokens
+from src.batch_shards import ShardedJsonlWriter
+from src.chunk_ids import ChunkId
+from src.prompt_templates import register_template
 
 max_model_tokens = 16384
+# Batch-file limits to split at (src/batch_shards.PROVIDER_LIMITS)
+BATCH_PROVIDER = "openai"
+
+# Template key (model, level, cot/wcot, anomaly type) and prompt order;
+# STATIC_FIRST_PROMPT=True puts the table after the instructions so the shared
+# prefix can be cached by the provider (changes the prompt, off by default)
+PROMPT_KEY = ("gpt-4o", "level4", "wcot", "Data_Consistency")
+STATIC_FIRST_PROMPT = False
 # Schema remains for documentation
 class Anomaly(typing.TypedDict):
     index: int
     anomaly_column: str
 
-def get_tokenizer(model_name="gpt-4o"):
-    return tiktoken.encoding_for_model(model_name)
+def get_tokenizer(model_name="gpt-4o") -> TokenCounter:
+    return get_counter(model_name)
 
 # --- Count tokens ---
-def count_tokens(text: str, tokenizer) -> int:
-    return len(tokenizer.encode(text))
+def count_tokens(text: str, tokenizer: TokenCounter) -> int:
+    return tokenizer.count_tokens(text)
 
 # --- Chunk data by token count ---
-def chunk_data_tokenwise(data: list, max_tokens: int, tokenizer) -> typing.Generator[typing.Tuple[list, int], None, None]:
-    chunk = []
-    current_tokens = 0
-    offset = 0
-
-    for i, item in enumerate(data):
-        item_str = json.dumps(item, ensure_ascii=False)
-        item_tokens = count_tokens(item_str, tokenizer)
-
-        if current_tokens + item_tokens > max_tokens:
-            yield chunk, offset
-            chunk = [item]
-            current_tokens = item_tokens
-            offset = i
-        else:
-            chunk.append(item)
-            current_tokens += item_tokens
-
-    if chunk:
-        yield chunk, offset
+def chunk_data_tokenwise(data: list, max_tokens: int, tokenizer: TokenCounter) -> typing.Generator[typing.Tuple[list, int], None, None]:
+    # One batched (and memoized) tokenization pass over all rows, then the
+    # fewest evenly filled chunks under max_tokens (see src/chunk_plan.py)
+    item_token_counts = tokenizer.count_rows(data)
 
-# Updated for GPT-4o prompt formatting
-def create_gpt4o_message(img_data, id=None, type_of_anomaly=''):
-    json_string = json.dumps(img_data, ensure_ascii=False)
+    for start, end in plan_tokens(item_token_counts, max_tokens):
+        yield data[start:end], start
 
-    prompt_str =  f"""---
+# Updated for GPT-4o prompt formatting
+# Prompt text with the table at {json_string}; compiled once (see src/prompt_templates.py)
+PROMPT_TEXT = """---
                 ### *📌 Important Clarification: Read This First*
                 **IMPORTANT:**
                 - DO NOT return anything else.
@@ -71,10 +68,20 @@ For each record in the dataset, check for anomalies. Here are examples of anomal
 ### Step 3: Generate the Anomalous Cells
 - Return the output in the format [(index, column_name), (index, column_name)] where index corresponds to the index in the list and column_name is the name of the column you think there is a data consistency anomaly. Just generate the list format output so I can easily parse it.
 
-               """    
+               """
+PROMPT = register_template(PROMPT_KEY, PROMPT_TEXT, static_first=STATIC_FIRST_PROMPT)
+
+def create_gpt4o_message(img_data, id=None, type_of_anomaly=''):
+    json_string = json.dumps(img_data, ensure_ascii=False)
+
+    prompt_str = PROMPT.render(json_string)    
     system_msg = "You are an advanced anomaly detection system."
-    enc = tiktoken.encoding_for_model("gpt-4o")
-    in_tokens = len(enc.encode(system_msg)) + len(enc.encode(prompt_str))
+    # The template's fixed cost is counted once; per request only the table is
+    # tokenized (a sum of parts never undercounts the joined prompt by more
+    # than a token or two, well inside the 50-token margin)
+    tokenizer = get_tokenizer()
+    in_tokens = (tokenizer.count_tokens(system_msg) + PROMPT.fixed_tokens(tokenizer)
+                 + tokenizer.count_tokens(json_string))
     max_out = max_model_tokens - in_tokens - 50
 
     return {
@@ -105,7 +112,11 @@ List = ["Data_Consistency_Anomaly_(dataset_name ie.(FetaQA ... ))"]
 # List = ['Calculation_Based_Anomaly_(dataset_name ie.(FetaQA ... ))','Data_Consistency_Anomaly_(dataset_name ie.(FetaQA ... ))','Factual_Anomaly_(dataset_name ie.(FetaQA ... ))','Logical_Anomaly_(dataset_name ie.(FetaQA ... ))','Normalization_Anomaly_(dataset_name ie.(FetaQA ... ))','Security_anomaly_(dataset_name ie.(FetaQA ... ))','Temporal_Anomaly_(dataset_name ie.(FetaQA ... ))','Value_Anomaly_(dataset_name ie.(FetaQA ... ))']
 
 def process_subdirectory(input_directory, output_directory):
+    # Request ids are canonical chunk ids (src/chunk_ids.py): category = anomaly
+    # folder, variation = the batch-file folder (dataset, level, cot)
+    variation = os.path.basename(os.path.normpath(output_directory))
     tokenizer = get_tokenizer()
+    print(PROMPT.summary(tokenizer))
     for subdir, dirs, files in os.walk(input_directory):
         if subdir == input_directory:
             continue  # Skip root
@@ -120,29 +131,29 @@ def process_subdirectory(input_directory, output_directory):
             print(f"Skipping unknown anomaly type: {subdir_name}")
             continue
 
-        jsonl_data = []
-        
         if subdir_name in List:
-            for file in os.listdir(subdir):
-                if file.endswith('.json'):
-                    json_path = os.path.join(subdir, file)
-                    with open(json_path, 'r', encoding='utf-8') as f:
-                        img_data = json.load(f)
-
-                    message = create_gpt4o_message(img_data, id=f"{subdir_name}/{file}_yes_no.json", type_of_anomaly=type_of_anomaly)
-                    jsonl_data.append(message)
-                    # for chunk_id, (chunk, offset) in enumerate(chunk_data_tokenwise(img_data, max_tokens=max_model_tokens, tokenizer=tokenizer)):
-                    #     custom_id = f'{subdir_name}/{file.replace(".json", f"_chunk_{chunk_id}_offset_{offset}.json")}'
-                    #     message = create_gpt4o_message(chunk, id=custom_id, type_of_anomaly=type_of_anomaly)
-                    #     jsonl_data.append(message)
-
-
-            if jsonl_data:
-                output_file_path = os.path.join(output_directory, f'{subdir_name}.jsonl')
-                with open(output_file_path, "w", encoding='utf-8') as jsonl_file:
-                    for entry in jsonl_data:
-                        jsonl_file.write(json.dumps(entry) + "\n")
-                print(f"Processed {subdir_name}: {len(jsonl_data)} files")
+            # Each request is written as soon as it is built; the writer splits
+            # the output at the OpenAI batch-file limits (see src/batch_shards.py)
+            output_file_path = os.path.join(output_directory, f'{subdir_name}.jsonl')
+            with ShardedJsonlWriter(output_file_path, provider=BATCH_PROVIDER) as jsonl_file:
+                for file in sorted(os.listdir(subdir)):
+                    if file.endswith('.json'):
+                        json_path = os.path.join(subdir, file)
+                        with open(json_path, 'r', encoding='utf-8') as f:
+                            img_data = json.load(f)
+
+                        message = create_gpt4o_message(img_data, id=str(ChunkId.of(file, subdir_name, variation)), type_of_anomaly=type_of_anomaly)
+                        try:
+                            jsonl_file.write(message)
+                        except ValueError as e:
+                            print(f"[Skip] {e}")
+                        # for chunk_id, (chunk, offset) in enumerate(chunk_data_tokenwise(img_data, max_tokens=max_model_tokens, tokenizer=tokenizer)):
+                        #     custom_id = f'{subdir_name}/{file.replace(".json", f"_chunk_{chunk_id}_offset_{offset}.json")}'
+                        #     message = create_gpt4o_message(chunk, id=custom_id, type_of_anomaly=type_of_anomaly)
+                        #     jsonl_file.write(message)
+
+            if jsonl_file.n_requests:
+                print(f"Processed {subdir_name}: {jsonl_file.summary()}")
 
 def main(input_directory, output_directory):
     os.makedirs(output_directory, exist_ok=True)
@@ -1,6 +1,16 @@
 import json
 import os
 import typing
+from src.batch_shards import ShardedJsonlWriter
+from src.chunk_ids import ChunkId
+from src.prompt_templates import register_template
+from src.token_counts import get_counter
+
+# Template key (model, level, cot/wcot, anomaly type) and prompt order;
+# STATIC_FIRST_PROMPT=True puts the table after the instructions so the shared
+# prefix can be cached by the provider (changes the prompt, off by default)
+PROMPT_KEY = ("gemini-1.5-pro-002", "level4", "wcot", "Calculation")
+STATIC_FIRST_PROMPT = False
 
 
 anomoly_schema = {
@@ -36,13 +46,8 @@ def chunk_table_data(table_data, max_rows=100):
     chunks = [table_data[i:i + max_rows] for i in range(0, len(table_data), max_rows)]
     return chunks
 
-# Function to generate messages with JSON data incorporated into the prompt
-def create_messages(img_data, obj=None, prompt=None, id=None,type_of_anomaly=''):
-    # Convert the JSON data to a string for inclusion in the prompt
-    json_string = json.dumps(img_data, ensure_ascii=False)
-    
-    # Construct the prompt by embedding the JSON data string
-    prompt_str =  f"""---
+# Prompt text with the table at {json_string}; compiled once (see src/prompt_templates.py)
+PROMPT_TEXT = """---
                 ### *📌 Important Clarification: Read This First*
                 **IMPORTANT:**
                 - DO NOT return anything else.
@@ -73,6 +78,15 @@ For each record in the dataset, check for anomalies. Here are examples of anomal
 - Return the output in the format [(index, column_name), (index, column_name)] where index corresponds to the index in the list and column_name is the name of the column you think there is a calculation anomaly. Just generate the list format output so I can easily parse it.
 
 """
+PROMPT = register_template(PROMPT_KEY, PROMPT_TEXT, static_first=STATIC_FIRST_PROMPT)
+
+# Function to generate messages with JSON data incorporated into the prompt
+def create_messages(img_data, obj=None, prompt=None, id=None,type_of_anomaly=''):
+    # Convert the JSON data to a string for inclusion in the prompt
+    json_string = json.dumps(img_data, ensure_ascii=False)
+    
+    # Construct the prompt by embedding the JSON data string
+    prompt_str = PROMPT.render(json_string)
 
 
     # Now, incorporate the prompt string into the data and return
@@ -107,11 +121,19 @@ map_dict = {"Calculation_Based_Anomaly_(dataset_name ie.(FetaQA ... ))":"Calcula
             "Temporal_Anomaly_(dataset_name ie.(FetaQA ... ))":"Temporal",
             "Value_Anomaly_(dataset_name ie.(FetaQA ... ))":"Value",
 }
+# Batch-file limits to split at (src/batch_shards.PROVIDER_LIMITS)
+BATCH_PROVIDER = "vertex"
 List = ["Calculation_Based_Anomaly_(dataset_name ie.(FetaQA ... ))"]
 # List = ['Calculation_Based_Anomaly_(dataset_name ie.(FetaQA ... ))','Data_Consistency_Anomaly_(dataset_name ie.(FetaQA ... ))','Factual_Anomaly_(dataset_name ie.(FetaQA ... ))','Logical_Anomaly_(dataset_name ie.(FetaQA ... ))','Normalization_Anomaly_(dataset_name ie.(FetaQA ... ))','Security_anomaly_(dataset_name ie.(FetaQA ... ))','Temporal_Anomaly_(dataset_name ie.(FetaQA ... ))','Value_Anomaly_(dataset_name ie.(FetaQA ... ))']
 
 # Function to process a subdirectory and create a JSONL file for each
 def process_subdirectory(input_directory, output_directory):
+    # Request ids are canonical chunk ids (src/chunk_ids.py): category = anomaly
+    # folder, variation = the batch-file folder (dataset, level, cot)
+    variation = os.path.basename(os.path.normpath(output_directory))
+    # Fixed prompt cost (byte estimate: no local tokenizer is needed for this model)
+    print(PROMPT.summary(get_counter("estimate")))
+
     # Walk through the directory to find subdirectories
     for subdir, dirs, files in os.walk(input_directory):
         if subdir == input_directory:
@@ -124,40 +146,36 @@ def process_subdirectory(input_directory, output_directory):
             continue
         
         type_of_anomaly = map_dict[subdir_name]
-        jsonl_data = []
-        
+
         if subdir_name in List:
-            # Process each JSON file in the stripped folder
-            for file in os.listdir(subdir):
-                if file.endswith('.json'):  # Process only JSON files
-                    json_path = os.path.join(subdir, file)
-                    
-                    # Read the JSON file
-                    with open(json_path, 'r', encoding='utf-8') as f:
-                        img_data = json.load(f)
-
-                    message = create_messages(img_data, id=f"{subdir_name}/{file}_yes_no.json", type_of_anomaly=type_of_anomaly)
-                    jsonl_data.append(message)
-                    # table_chunks = chunk_table_data(img_data, max_rows=20)
-                    # # Create message for Gemini evaluation
-                    # for i, chunk in enumerate(table_chunks):
-                    #     chunk_id = f'{subdir_name}/{file.replace(".json", f"_chunk_{i+1}.json")}'
-                    #     messages = create_messages(chunk, obj=None, prompt=None, id=chunk_id, type_of_anomaly=type_of_anomaly)
-                    #     jsonl_data.append(messages)
-                    
-                    # # Append the generated message to the jsonl_data list
-                    # jsonl_data.append(messages)
-            
-            # Write the output data to a JSONL file specific to this subdirectory
-            if jsonl_data:  # Only create the file if there is data
-                # output_subdir_path = os.path.join(output_directory, subdir_name)
-                # os.makedirs(output_subdir_path, exist_ok=True)
-                output_file_path = os.path.join(output_directory, f'{subdir_name}.jsonl')
-                
-                with open(output_file_path, "w") as jsonl_file:
-                    for entry in jsonl_data:
-                        jsonl_file.write(json.dumps(entry) + "\n")
-                print(f"Processed {subdir_name}: {len(jsonl_data)} files")
+            # Each request is written as soon as it is built; the writer splits
+            # the output at the Vertex batch input limits (see src/batch_shards.py)
+            output_file_path = os.path.join(output_directory, f'{subdir_name}.jsonl')
+            with ShardedJsonlWriter(output_file_path, provider=BATCH_PROVIDER) as jsonl_file:
+                # Process each JSON file in the stripped folder
+                for file in sorted(os.listdir(subdir)):
+                    if file.endswith('.json'):  # Process only JSON files
+                        json_path = os.path.join(subdir, file)
+
+                        # Read the JSON file
+                        with open(json_path, 'r', encoding='utf-8') as f:
+                            img_data = json.load(f)
+
+                        message = create_messages(img_data, id=str(ChunkId.of(file, subdir_name, variation)), type_of_anomaly=type_of_anomaly)
+                        try:
+                            jsonl_file.write(message)
+                        except ValueError as e:
+                            print(f"[Skip] {e}")
+                        # table_chunks = chunk_table_data(img_data, max_rows=20)
+                        # # Create message for Gemini evaluation
+                        # for i, chunk in enumerate(table_chunks):
+                        #     chunk_id = f'{subdir_name}/{file.replace(".json", f"_chunk_{i+1}.json")}'
+                        #     messages = create_messages(chunk, obj=None, prompt=None, id=chunk_id, type_of_anomaly=type_of_anomaly)
+                        #     jsonl_file.write(messages)
+
+            # Only report categories that produced requests
+            if jsonl_file.n_requests:
+                print(f"Processed {subdir_name}: {jsonl_file.summary()}")
 
 # Main function to run the process
 def main(input_directory, output_directory):
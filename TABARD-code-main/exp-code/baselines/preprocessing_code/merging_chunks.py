@@ -2,15 +2,21 @@ import os
 import json
 from collections import defaultdict
 from tqdm import tqdm
+from src.chunk_store import PACK_SUFFIX, merge_pack
 
 def merge_chunks(input_folder_path, output_folder_path):
     # Dictionary to hold chunks grouped by original file path
     chunks_dict = defaultdict(list)
 
     # Step 1: Traverse and group chunks
+    packs = []
     for root, _, files in os.walk(input_folder_path):
         for file in files:
-            if file.endswith(".json") and "_chunk_" in file:
+            if file.endswith(PACK_SUFFIX):
+                # <category>.chunks merges into the same place as a <category>/ folder would
+                rel_dir = os.path.relpath(os.path.join(root, file[:-len(PACK_SUFFIX)]), input_folder_path)
+                packs.append((os.path.join(root, file), rel_dir))
+            elif file.endswith(".json") and "_chunk_" in file:
                 file_path = os.path.join(root, file)
                 base_name = file.split("_chunk_")[0]
                 start_idx = int(file.split("_chunk_")[1].split("_")[0])
@@ -37,6 +43,10 @@ def merge_chunks(input_folder_path, output_folder_path):
         with open(output_file_path, 'w', encoding='utf-8') as out_file:
             json.dump(merged_data, out_file, indent=4, separators=(",", ":"), ensure_ascii=False)
 
+    for pack_file, rel_dir in tqdm(packs, desc="Merging chunk packs"):
+        merge_pack(pack_file, os.path.join(output_folder_path, rel_dir),
+                   indent=4, separators=(",", ":"), ensure_ascii=False)
+
 if __name__ == "__main__":
     input_folder_path = r"(dataset_name ie.(FetaQA ... ))r/(dataset_name ie.(FetaQA ... ))r-chunked"
     output_folder_path = r"(dataset_name ie.(FetaQA ... ))r/(dataset_name ie.(FetaQA ... ))r-merged"
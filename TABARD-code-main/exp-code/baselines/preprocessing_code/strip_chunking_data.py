@@ -1,8 +1,10 @@
 import os
 import json
 from tqdm import tqdm
+from src.chunk_plan import plan_rows
+from yes_no_chunking import create_yes_no, chunk_json_file
 
-MAX_ROWS = 30  # Max rows per chunk
+MAX_ROWS = 30  # Max rows per chunk (rows are spread evenly over the fewest chunks)
 
 def strip_prefix(data):
     """
@@ -24,9 +26,7 @@ def chunk_data(data, base_name, output_dir):
     """
     Chunk the data into parts and save as individual JSON files.
     """
-    total_rows = len(data)
-    for start in range(0, total_rows, MAX_ROWS):
-        end = min(start + MAX_ROWS, total_rows)
+    for start, end in plan_rows(len(data), MAX_ROWS):
         chunk = data[start:end]
         chunk_filename = f"{base_name}_chunk_{start}_{end}.json"
         chunk_file_path = os.path.join(output_dir, chunk_filename)
@@ -35,9 +35,23 @@ def chunk_data(data, base_name, output_dir):
             json.dump(chunk, f, indent=4, separators=(",", ":"), ensure_ascii=False)
 
 
-def process_and_chunk_json_files(input_folder_path, output_folder_path):
+def load_yes_no(root, file_name, data):
+    """
+    Yes/No rows for a perturbed table: the generator's YesNo_Tables copy when
+    there is one (Value anomalies carry no '@@@_' markers), else the markers.
+    """
+    yes_no_path = os.path.join(root, "YesNo_Tables", file_name.replace(".json", "_yes_no.json"))
+    if os.path.exists(yes_no_path):
+        with open(yes_no_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return create_yes_no(data)
+
+
+def process_and_chunk_json_files(input_folder_path, output_folder_path, yes_no_output_path=None):
     """
     Walk through all files in input folder, strip prefix, and chunk JSON files.
+    With yes_no_output_path, the Yes/No chunks yes_no_chunking.py produces are
+    written in the same pass, from the table already in memory.
     """
     for root, _, files in os.walk(input_folder_path):
         for file_name in tqdm(files, desc=f"Processing folder: {os.path.basename(root)}", unit="file"):
@@ -57,6 +71,12 @@ def process_and_chunk_json_files(input_folder_path, output_folder_path):
                 base_name = os.path.splitext(file_name)[0]
                 chunk_data(stripped_data, base_name, output_dir)
 
+                if yes_no_output_path and os.path.basename(root) != "YesNo_Tables":
+                    yes_no_dir = os.path.join(yes_no_output_path, relative_path)
+                    os.makedirs(yes_no_dir, exist_ok=True)
+                    yes_no_base = file_name.split("_updated")[0] if "_updated" in file_name else base_name
+                    chunk_json_file(load_yes_no(root, file_name, data), yes_no_base + "_yes_no", yes_no_dir)
+
             except json.JSONDecodeError as e:
                 print(f"[Error] JSON decode issue in {input_file_path}: {e}")
             except Exception as e:
@@ -66,8 +86,10 @@ def process_and_chunk_json_files(input_folder_path, output_folder_path):
 if __name__ == "__main__":
     input_folder_path = r"(dataset_name ie.(FetaQA ... ))/(dataset_name ie.(FetaQA ... ))_Perturbed_Tables"
     output_folder_path = r"(dataset_name ie.(FetaQA ... ))/(dataset_name ie.(FetaQA ... ))-chunked"
+    # Also write the Yes/No chunks in this pass ("" leaves them to yes_no_chunking.py)
+    yes_no_output_path = r"(dataset_name ie.(FetaQA ... ))/(dataset_name ie.(FetaQA ... ))-yes-no-chunked"
 
     print("Starting stripping and chunking process...")
-    process_and_chunk_json_files(input_folder_path, output_folder_path)
+    process_and_chunk_json_files(input_folder_path, output_folder_path, yes_no_output_path or None)
     print("All files processed.")
 
@@ -1,8 +1,9 @@
 import json
 import os
 from tqdm import tqdm
+from src.chunk_plan import plan_rows
 
-MAX_ROWS = 30  # Rows per chunk
+MAX_ROWS = 30  # Max rows per chunk; same plan as strip_chunking_data.py
 
 def create_yes_no(data):
     """Create a Yes/No version of the input JSON data."""
@@ -17,9 +18,7 @@ def create_yes_no(data):
 
 def chunk_json_file(data, base_name, output_folder_path):
     """Chunk the JSON data into separate files with a maximum of MAX_ROWS rows."""
-    total_rows = len(data)
-    for start in range(0, total_rows, MAX_ROWS):
-        end = min(start + MAX_ROWS, total_rows)
+    for start, end in plan_rows(len(data), MAX_ROWS):
         chunk = data[start:end]
         chunk_file_name = f"{base_name}_chunk_{start}_{end}.json"
         chunk_file_path = os.path.join(output_folder_path, chunk_file_name)
@@ -0,0 +1,135 @@
+# ── batch_poller.py ─────────────────────────────────────────────────────────
+
+import time
+import random
+import asyncio
+import logging
+import typing
+
+# One poller shared by every outstanding batch job of a run. Instead of a
+# blocking loop per job with a fixed sleep, each job waits on the poller,
+# which schedules its next status call adaptively:
+#
+#   - with provider-reported progress (requests completed / total), the
+#     next poll is half the estimated time left, so polls close in on the
+#     expected finish instead of ticking past it;
+#   - without progress, the interval grows with the job's age (a job that
+#     has run for an hour will not finish in the next 30 s) and backs off
+#     while the reported state stays the same;
+#   - every interval is clamped to [min_interval, max_interval] and
+#     jittered, so hundreds of jobs do not hit the API in lockstep.
+#
+# At most `max_concurrent` status calls run at once (they are blocking SDK
+# calls, each in a worker thread). wait() returns as soon as the job ends,
+# so the caller can start downloading / postprocessing it right away.
+
+MIN_INTERVAL = 5        # seconds
+MAX_INTERVAL = 600
+AGE_FRACTION = 0.1      # without progress, poll no more often than every 10% of the job's age
+BACKOFF = 1.5           # interval growth per poll that saw no change
+JITTER = 0.2            # +-20%
+
+
+class JobStatus(typing.NamedTuple):
+    state: str                 # provider state, e.g. "in_progress", "JOB_STATE_RUNNING"
+    ended: bool
+    succeeded: bool
+    completed: int = None      # requests done (succeeded + failed), if the provider reports it
+    total: int = None
+
+
+class _Progress:
+    """What the poller remembers about one job between polls."""
+
+    def __init__(self, submitted_at: float):
+        self.submitted_at = submitted_at
+        self.unchanged = 0
+        self.last = None           # last JobStatus
+        self.first_seen = None     # (time, completed) of the first poll that reported progress
+
+    def update(self, status: JobStatus, now: float):
+        if self.last is not None and (status.state, status.completed) == (self.last.state, self.last.completed):
+            self.unchanged += 1
+        else:
+            self.unchanged = 0
+        if status.completed and status.total and self.first_seen is None:
+            self.first_seen = (now, status.completed)
+        self.last = status
+
+    def eta(self, now: float) -> float:
+        """Seconds until the job is done at its observed rate, or None if unknown."""
+        status = self.last
+        if self.first_seen is None or not status.total:
+            return None
+        since, done_then = self.first_seen
+        start, done = (since, done_then) if status.completed > done_then else (self.submitted_at, 0)
+        if now <= start or status.completed <= done:
+            return None
+        rate = (status.completed - done) / (now - start)
+        return max(status.total - status.completed, 0) / rate
+
+
+def next_interval(progress: _Progress, now: float, min_interval: float = MIN_INTERVAL,
+                  max_interval: float = MAX_INTERVAL, jitter: float = JITTER, rng=random) -> float:
+    """Delay before the next status call of a job."""
+    eta = progress.eta(now)
+    if eta is not None:
+        delay = eta / 2
+    else:
+        age = max(now - progress.submitted_at, 0)
+        delay = max(min_interval * BACKOFF ** progress.unchanged, age * AGE_FRACTION)
+    delay = min(max(delay, min_interval), max_interval)
+    return delay * rng.uniform(1 - jitter, 1 + jitter)
+
+
+class BatchPoller:
+    """
+    Usage:
+        poller = BatchPoller(min_interval=30)
+        status = await poller.wait(str(exp), lambda: backend.poll(handle), submitted_at=time.time())
+        if status.succeeded:
+            ...collect and postprocess...
+    """
+
+    def __init__(self, min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL,
+                 max_concurrent: int = 8, jitter: float = JITTER, logger: logging.Logger = None):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.jitter = jitter
+        self.logger = logger or logging.getLogger(__name__)
+        self.n_polls = 0
+        self.n_errors = 0
+        self._max_concurrent = max_concurrent
+        self._calls = None  # semaphore, created inside the running loop
+
+    async def wait(self, name: str, poll: typing.Callable, submitted_at: float = None,
+                   on_update: typing.Callable = None) -> JobStatus:
+        """
+        Poll `poll()` (blocking, returns a JobStatus) until the job ends and
+        return its final status. `on_update(status)` is called on the event
+        loop after every successful poll. Failed polls are logged and retried
+        at the backed-off interval.
+        """
+        if self._calls is None:
+            self._calls = asyncio.Semaphore(self._max_concurrent)
+        progress = _Progress(submitted_at if submitted_at is not None else time.time())
+        while True:
+            await asyncio.sleep(next_interval(progress, time.time(), self.min_interval,
+                                              self.max_interval, self.jitter))
+            async with self._calls:
+                self.n_polls += 1
+                try:
+                    status = await asyncio.to_thread(poll)
+                except Exception as e:
+                    self.n_errors += 1
+                    progress.unchanged += 1
+                    self.logger.warning(f"{name}: poll failed, retrying: {e}")
+                    continue
+            progress.update(status, time.time())
+            if on_update is not None:
+                on_update(status)
+            if status.ended:
+                return status
+
+    def summary(self) -> str:
+        return f"Poller: {self.n_polls} status calls ({self.n_errors} failed)"
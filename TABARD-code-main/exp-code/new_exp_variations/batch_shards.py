@@ -0,0 +1,151 @@
+# ── batch_shards.py ─────────────────────────────────────────────────────────
+
+import os
+import glob
+import json
+import typing
+
+# Streaming writer for batch-request JSONL files. Requests are serialized
+# and written one at a time (nothing is held in memory), and the output is
+# split into shards whenever the next request would exceed the provider's
+# per-file limits.
+#
+# Naming: while everything fits in one file it is written as <name>.jsonl,
+# exactly as before. Once a second shard is needed the first one is renamed
+# <name>.part001.jsonl and the following ones are <name>.part002.jsonl, ...
+# Either way <name>.shards.json lists the files written, in order.
+SHARD_MANIFEST_SUFFIX = ".shards.json"
+
+
+class ShardLimits(typing.NamedTuple):
+    max_requests: int
+    max_bytes: int
+
+
+# Per-input-file limits of each provider's batch API (check the current
+# quotas before raising them):
+#   openai : Batch API, 50,000 requests and 200 MB per input file
+#   vertex : Vertex AI batch prediction (Gemini, and Llama served on Vertex),
+#            200,000 requests and 1 GB per JSONL input file
+PROVIDER_LIMITS = {
+    "openai": ShardLimits(max_requests=50_000, max_bytes=200 * 1024 * 1024),
+    "vertex": ShardLimits(max_requests=200_000, max_bytes=1024 * 1024 * 1024),
+}
+
+
+def request_id(request: dict) -> str:
+    """custom_id (OpenAI / Llama) or id (Gemini) of a batch request."""
+    return request.get("custom_id", request.get("id"))
+
+
+def shard_manifest_path(output_jsonl_path: str) -> str:
+    return os.path.splitext(output_jsonl_path)[0] + SHARD_MANIFEST_SUFFIX
+
+
+def read_shard_manifest(output_jsonl_path: str) -> list:
+    """Shard paths written for `output_jsonl_path`, or [output_jsonl_path] if it was never sharded."""
+    path = shard_manifest_path(output_jsonl_path)
+    if not os.path.exists(path):
+        return [output_jsonl_path]
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    folder = os.path.dirname(path)
+    return [os.path.join(folder, shard["file"]) for shard in manifest["shards"]]
+
+
+class ShardedJsonlWriter:
+    """
+    Writes batch requests to <name>.jsonl, rolling over to a new shard before
+    a request would push the current one past `limits`.
+
+    Usage:
+        with ShardedJsonlWriter(os.path.join(out_dir, "Value.jsonl"), provider="openai") as out:
+            for file in files:
+                out.write(create_gpt4o_message(...))
+        print(out.summary())
+    """
+
+    def __init__(self, output_jsonl_path: str, provider: str = "openai", limits: ShardLimits = None):
+        self.output_jsonl_path = output_jsonl_path
+        self.provider = provider
+        self.limits = limits or PROVIDER_LIMITS[provider]
+        self.shards = []  # {"file", "requests", "bytes", "first_id", "last_id"}
+        self._f = None
+        self._base = os.path.splitext(output_jsonl_path)[0]
+        if os.path.dirname(output_jsonl_path):
+            os.makedirs(os.path.dirname(output_jsonl_path), exist_ok=True)
+
+    @property
+    def n_requests(self) -> int:
+        return sum(shard["requests"] for shard in self.shards)
+
+    def _shard_path(self, number: int) -> str:
+        return f"{self._base}.part{number:03d}.jsonl"
+
+    def _open_shard(self):
+        if not self.shards:
+            # Shards left over from an earlier, larger run of the same file
+            for stale in glob.glob(glob.escape(self._base) + ".part[0-9][0-9][0-9].jsonl"):
+                os.remove(stale)
+        elif len(self.shards) == 1:
+            # A second shard is needed: the first one gets a numbered name too
+            first = self.shards[0]
+            os.replace(self.output_jsonl_path, self._shard_path(1))
+            first["file"] = os.path.basename(self._shard_path(1))
+        path = self.output_jsonl_path if not self.shards else self._shard_path(len(self.shards) + 1)
+        self._f = open(path, "wb")
+        self.shards.append({"file": os.path.basename(path), "requests": 0, "bytes": 0,
+                            "first_id": None, "last_id": None})
+
+    def write(self, request: dict):
+        """Serialize one request and append it to the current shard."""
+        line = (json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8")
+        if len(line) > self.limits.max_bytes:
+            raise ValueError(
+                f"Request {request_id(request)} is {len(line)} bytes, over the "
+                f"{self.provider} limit of {self.limits.max_bytes} bytes per file"
+            )
+        shard = self.shards[-1] if self.shards else None
+        if (shard is None
+                or shard["requests"] >= self.limits.max_requests
+                or shard["bytes"] + len(line) > self.limits.max_bytes):
+            if self._f is not None:
+                self._f.close()
+            self._open_shard()
+            shard = self.shards[-1]
+        self._f.write(line)
+        shard["requests"] += 1
+        shard["bytes"] += len(line)
+        if shard["first_id"] is None:
+            shard["first_id"] = request_id(request)
+        shard["last_id"] = request_id(request)
+
+    def close(self):
+        """Close the last shard and write the shard manifest (nothing is written if no request was)."""
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        if not self.shards:
+            return
+        manifest = {
+            "provider": self.provider,
+            "limits": self.limits._asdict(),
+            "requests": self.n_requests,
+            "shards": self.shards,
+        }
+        path = shard_manifest_path(self.output_jsonl_path)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def summary(self) -> str:
+        if len(self.shards) <= 1:
+            return f"{self.n_requests} requests → {self.output_jsonl_path}"
+        return f"{self.n_requests} requests in {len(self.shards)} shards → {self._base}.part*.jsonl"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
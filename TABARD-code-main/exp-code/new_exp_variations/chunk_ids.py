@@ -0,0 +1,160 @@
+# ── chunk_ids.py ────────────────────────────────────────────────────────────
+
+import os
+import re
+import typing
+
+from src.chunk_store import ChunkPack, is_pack, resolve_chunk_source
+
+# Canonical chunk identifiers for batch requests, and the index that maps a
+# response back to its ground-truth file.
+#
+# Every request carries its chunk as a structured id:
+#
+#   tbc1|<category>|<variation>|<table>|<start>|<end>
+#
+# where <table> is the table id without its "_updated" / "_yes_no" suffix and
+# <start>/<end> are the chunk's row range (empty for an unchunked table). The
+# raw, stripped and yes/no files of one chunk all reduce to the same
+# (table, start, end) key, so postprocessing matches a response to its GT
+# file with one dict lookup instead of rebuilding the filename with
+# .replace() chains and scanning the GT directory.
+#
+# Ids written before this scheme ("tableA_updated_chunk_0_60",
+# "<category>/tableA_updated_chunk_0_60.json_yes_no.json", ...) are reduced
+# to the same key, so older batch outputs still match.
+ID_PREFIX = "tbc1"
+_SEP = "|"
+
+_CHUNK = re.compile(r"(.+)_chunk_(\d+)_(\d+)")
+# Role suffixes, only at the end of the table part (before "_chunk_" or ".json"):
+# "foo_updated_bar" is its own table, not "foo_bar"
+_ROLE = re.compile(r"(?:_(?:updated|yes_no))+$")
+
+
+def table_key(name: str) -> str:
+    """Table id shared by a table's perturbed and yes/no files ("tableA_updated" -> "tableA")."""
+    return _ROLE.sub("", name)
+
+
+class ChunkId(typing.NamedTuple):
+    table: str
+    start: int = None
+    end: int = None
+    category: str = ""      # anomaly category / batch the request belongs to
+    variation: str = ""     # dataset fold or prompt variation
+
+    @property
+    def key(self) -> tuple:
+        """(category, table, start, end): what a GT file is looked up by."""
+        return self.category, self.table, self.start, self.end
+
+    def __str__(self):
+        return format_chunk_id(self)
+
+    @classmethod
+    def of(cls, filename: str, category: str = "", variation: str = "") -> "ChunkId":
+        """Id of the chunk (or table) stored in `filename`."""
+        return chunk_id_of(filename)._replace(category=category, variation=variation)
+
+
+def format_chunk_id(chunk: ChunkId) -> str:
+    for field in (chunk.category, chunk.variation):
+        if _SEP in field:
+            raise ValueError(f"{_SEP!r} is not allowed in a chunk id field: {field!r}")
+    bound = lambda n: "" if n is None else str(n)
+    return _SEP.join((ID_PREFIX, chunk.category, chunk.variation, chunk.table, bound(chunk.start), bound(chunk.end)))
+
+
+def parse_chunk_id(request_id: str) -> ChunkId:
+    """ChunkId of a canonical id, or None if `request_id` is not one."""
+    if not request_id.startswith(ID_PREFIX + _SEP):
+        return None
+    parts = request_id.split(_SEP, 3)
+    if len(parts) < 4:
+        return None
+    _, category, variation, rest = parts
+    bounds = rest.rsplit(_SEP, 2)
+    if len(bounds) < 3:
+        return None
+    table, start, end = bounds
+    try:
+        start = int(start) if start else None
+        end = int(end) if end else None
+    except ValueError:
+        return None
+    return ChunkId(table, start, end, category, variation)
+
+
+def chunk_id_of(request_id: str) -> ChunkId:
+    """ChunkId of a canonical id, or of a legacy id / chunk or table filename."""
+    chunk = parse_chunk_id(request_id)
+    if chunk is not None:
+        return chunk
+    name = os.path.basename(request_id)
+    m = _CHUNK.search(name)
+    if m:
+        return ChunkId(table_key(m.group(1)), int(m.group(2)), int(m.group(3)))
+    return ChunkId(table_key(name.replace(".json", "")))
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# GT INDEX
+# ────────────────────────────────────────────────────────────────────────────
+class GTIndex:
+    """
+    (category, table, start, end) -> GT filename for one ground-truth
+    directory, built once from its file list so each response is matched
+    with a dict lookup.
+
+    With a `category`, canonical ids of another category never match; ids
+    without one (legacy ids) are looked up under the index's category. Two
+    files with the same key would make matching ambiguous, so they raise
+    ValueError.
+
+    Usage:
+        gt_index = GTIndex.of_dir(gt_dir, category)  # or GTIndex(load_gt_dir(gt_dir).keys(), category)
+        for gt_name, anomalies in iter_predictions(path, key=gt_index.lookup):
+            if gt_name is None:
+                ...                                  # response for a chunk this GT dir lacks
+    """
+
+    def __init__(self, filenames: typing.Iterable, category: str = ""):
+        self.category = category
+        self._names = {}
+        duplicates = []
+        for filename in filenames:
+            if not filename.endswith(".json"):
+                continue
+            key = chunk_id_of(filename)._replace(category=category).key
+            if key in self._names:
+                duplicates.append(f"{filename} / {self._names[key]}")
+            else:
+                self._names[key] = filename
+        if duplicates:
+            raise ValueError(f"GT files share a chunk id: {', '.join(duplicates)}")
+
+    @classmethod
+    def of_dir(cls, gt_dir: str, category: str = "") -> "GTIndex":
+        """Index of a GT folder or chunk pack (`gt_dir` + ".chunks" is used if the folder is gone)."""
+        source = resolve_chunk_source(gt_dir)
+        if is_pack(source):
+            with ChunkPack(source) as pack:
+                return cls(pack.names(), category)
+        return cls(os.listdir(source), category)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, request_id):
+        return self.lookup(request_id) is not None
+
+    def names(self) -> set:
+        return set(self._names.values())
+
+    def lookup(self, request_id: str) -> str:
+        """GT filename a request id (canonical or legacy) belongs to, or None."""
+        chunk = chunk_id_of(request_id)
+        if not self.category or not chunk.category:
+            chunk = chunk._replace(category=self.category)
+        return self._names.get(chunk.key)
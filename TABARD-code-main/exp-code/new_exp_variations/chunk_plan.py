@@ -0,0 +1,155 @@
+# ── chunk_plan.py ───────────────────────────────────────────────────────────
+
+import os
+import json
+import math
+from bisect import bisect_right
+
+# Chunk planning shared by the chunkers. A plan maps each table id to the
+# row ranges [start, end) it is cut into; the raw, stripped, label and yes/no
+# writers all cut from the same plan, so their _chunk_<start>_<end> files
+# always line up.
+#
+# Tables are split into the fewest chunks that fit the budget, and the rows
+# are then spread so those chunks are as even as possible, instead of
+# filling every chunk greedily and leaving a small remainder at the end.
+PLAN_NAME = "chunk_plan.json"
+
+# Tokens the ", " between two rows adds when a chunk is serialized as one
+# JSON list (per-row counts only cover the row itself)
+ROW_SEPARATOR_TOKENS = 1
+
+
+def row_budget(context_tokens: int, template_tokens: int, reply_tokens: int) -> int:
+    """
+    Tokens left for table rows once the prompt template (PromptTemplate.fixed_tokens,
+    see src/prompt_templates.py) and the reply are reserved.
+    """
+    budget = context_tokens - template_tokens - reply_tokens
+    if budget <= 0:
+        raise ValueError(f"No room for rows: {context_tokens} context tokens - {template_tokens} "
+                         f"template tokens - {reply_tokens} reply tokens")
+    return budget
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# PLANNING
+# ────────────────────────────────────────────────────────────────────────────
+def plan_rows(n_rows: int, max_rows: int) -> list:
+    """Fewest chunks of at most `max_rows` rows, sizes differing by at most one."""
+    if n_rows <= 0:
+        return []
+    k = math.ceil(n_rows / max_rows)
+    base, extra = divmod(n_rows, k)
+    ranges, start = [], 0
+    for i in range(k):
+        end = start + base + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _cut(prefix: list, cap: int, max_rows: int = None) -> list:
+    """Greedy cut: each chunk takes as many rows as fit in `cap` (at least one)."""
+    n = len(prefix) - 1
+    ranges, start = [], 0
+    while start < n:
+        end = bisect_right(prefix, prefix[start] + cap, lo=start + 1) - 1
+        end = max(end, start + 1)  # a row larger than the cap gets a chunk of its own
+        if max_rows:
+            end = min(end, start + max_rows)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def plan_tokens(row_tokens: list, budget: int, max_rows: int = None,
+                separator_tokens: int = ROW_SEPARATOR_TOKENS) -> list:
+    """
+    Split rows with the given token counts into the fewest chunks whose cost
+    (rows + separators) stays within `budget`, balanced so that the largest
+    chunk is as small as that number of chunks allows.
+    """
+    if not row_tokens:
+        return []
+    prefix = [0]
+    for tokens in row_tokens:
+        prefix.append(prefix[-1] + tokens + separator_tokens)
+
+    # Greedy filling gives the minimum number of chunks ...
+    k = len(_cut(prefix, budget, max_rows))
+
+    # ... then the smallest cap that still needs no more than k chunks evens them out
+    # (never above the budget: rows larger than it are kept on their own)
+    lo = min(max(tokens + separator_tokens for tokens in row_tokens), budget)
+    hi = budget
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if len(_cut(prefix, mid, max_rows)) <= k:
+            hi = mid
+        else:
+            lo = mid + 1
+    return _cut(prefix, lo, max_rows)
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# PLAN FILE
+# ────────────────────────────────────────────────────────────────────────────
+class ChunkPlan:
+    """
+    Table id -> list of (start, end) row ranges, saved as JSON next to the
+    chunks it describes.
+
+    Usage:
+        plan = ChunkPlan(budget=3800)
+        plan.add("table_1", plan_tokens(row_tokens, 3800))
+        plan.save(os.path.join(chunked_folder, PLAN_NAME))
+        ...
+        for start, end in ChunkPlan.load(path).ranges("table_1"):
+            ...
+    """
+
+    def __init__(self, budget: int = None, max_rows: int = None, tokenizer: str = None):
+        self.budget = budget
+        self.max_rows = max_rows
+        self.tokenizer = tokenizer
+        self.tables = {}
+
+    def add(self, table_id: str, ranges: list):
+        self.tables[table_id] = [(int(start), int(end)) for start, end in ranges]
+
+    def ranges(self, table_id: str):
+        """Row ranges of a table, or None if the plan does not cover it."""
+        return self.tables.get(table_id)
+
+    def __contains__(self, table_id):
+        return table_id in self.tables
+
+    def __len__(self):
+        return len(self.tables)
+
+    def n_chunks(self) -> int:
+        return sum(len(ranges) for ranges in self.tables.values())
+
+    def save(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = {
+            "budget": self.budget,
+            "max_rows": self.max_rows,
+            "tokenizer": self.tokenizer,
+            "tables": {table_id: [list(r) for r in ranges] for table_id, ranges in sorted(self.tables.items())},
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ChunkPlan":
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        plan = cls(payload.get("budget"), payload.get("max_rows"), payload.get("tokenizer"))
+        for table_id, ranges in payload["tables"].items():
+            plan.add(table_id, ranges)
+        return plan
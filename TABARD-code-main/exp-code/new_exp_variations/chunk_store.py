@@ -0,0 +1,274 @@
+# ── chunk_store.py ──────────────────────────────────────────────────────────
+
+import os
+import re
+import json
+import mmap
+import struct
+
+# Packed chunk store: all chunks of one fold/category folder in a single file
+# (<folder>.chunks) instead of one small JSON file per chunk, so listing and
+# opening a fold costs one open() and one mmap on any filesystem.
+#
+# Layout:
+#   MAGIC
+#   chunk payloads: each chunk's rows as one compact UTF-8 JSON array
+#   index: JSON {"suffix": ..., "chunks": [[table_id, start, end, offset, length], ...]}
+#   trailer: index offset and length (two little-endian uint64) + TRAILER_MAGIC
+#
+# A chunk is addressed by (table_id, start, end) or by the filename it would
+# have in a chunk folder, f"{table_id}_chunk_{start}_{end}{suffix}.json", so
+# code keyed on chunk filenames works unchanged on either layout.
+PACK_SUFFIX = ".chunks"
+
+MAGIC = b"TABARD-CHUNKS-1\n"
+TRAILER_MAGIC = b"TBCKIDX1"
+_TRAILER = struct.Struct("<QQ")
+
+_CHUNK_NAME = re.compile(r"(.+)_chunk_(\d+)_(\d+)(.*)\.json$")
+
+
+def chunk_filename(table_id: str, start: int, end: int, suffix: str = "") -> str:
+    return f"{table_id}_chunk_{start}_{end}{suffix}.json"
+
+
+def parse_chunk_filename(filename: str):
+    """(table_id, start, end, suffix) of a chunk filename, or None."""
+    m = _CHUNK_NAME.match(filename)
+    if not m:
+        return None
+    return m.group(1), int(m.group(2)), int(m.group(3)), m.group(4)
+
+
+def pack_path(folder: str) -> str:
+    return folder.rstrip("/\\") + PACK_SUFFIX
+
+
+def is_pack(path: str) -> bool:
+    return path.endswith(PACK_SUFFIX) and os.path.isfile(path)
+
+
+def resolve_chunk_source(path: str) -> str:
+    """`path` if it is a chunk folder or a pack, else its pack if that exists, else `path`."""
+    if os.path.isdir(path) or is_pack(path):
+        return path
+    if is_pack(pack_path(path)):
+        return pack_path(path)
+    return path
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# WRITE
+# ────────────────────────────────────────────────────────────────────────────
+class ChunkPackWriter:
+    """
+    Streams chunks into a new pack; the file appears at `path` only once
+    close() has written the index.
+
+    Usage:
+        with ChunkPackWriter(pack_path(labels_dir), suffix="_labels") as pack:
+            for start, end in ranges:
+                pack.add(base_name, start, end, labels[start:end])
+    """
+
+    def __init__(self, path: str, suffix: str = ""):
+        self.path = path
+        self.suffix = suffix
+        self._chunks = []
+        self._seen = set()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._tmp_path = f"{path}.{os.getpid()}.tmp"
+        self._f = open(self._tmp_path, "wb")
+        self._f.write(MAGIC)
+
+    def add(self, table_id: str, start: int, end: int, rows: list):
+        self.add_bytes(table_id, start, end, json.dumps(rows, ensure_ascii=False).encode("utf-8"))
+
+    def add_bytes(self, table_id: str, start: int, end: int, payload: bytes):
+        key = (table_id, int(start), int(end))
+        if key in self._seen:
+            raise ValueError(f"Chunk {chunk_filename(*key, self.suffix)} added twice to {self.path}")
+        self._seen.add(key)
+        offset = self._f.tell()
+        self._f.write(payload)
+        self._chunks.append([table_id, key[1], key[2], offset, len(payload)])
+
+    def close(self):
+        if self._f is None:
+            return
+        index = json.dumps({"suffix": self.suffix, "chunks": self._chunks}, ensure_ascii=False).encode("utf-8")
+        index_offset = self._f.tell()
+        self._f.write(index)
+        self._f.write(_TRAILER.pack(index_offset, len(index)))
+        self._f.write(TRAILER_MAGIC)
+        self._f.close()
+        self._f = None
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# READ
+# ────────────────────────────────────────────────────────────────────────────
+class ChunkPack:
+    """
+    Read-only, memory-mapped view of a pack.
+
+    Usage:
+        pack = ChunkPack(".../Merged-chunked/Merged.chunks")
+        rows = pack.read("tableA_updated", 0, 60)
+        for filename, rows in pack.items():      # in table / start order
+            ...
+        full_table = pack.merged("tableA_updated")
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            tail = len(TRAILER_MAGIC) + _TRAILER.size
+            if size < len(MAGIC) + tail:
+                raise ValueError(f"{path} is not a chunk pack")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC or self._mm[size - len(TRAILER_MAGIC):] != TRAILER_MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a chunk pack (or was not closed)")
+        index_offset, index_length = _TRAILER.unpack(self._mm[size - tail:size - len(TRAILER_MAGIC)])
+        index = json.loads(self._mm[index_offset:index_offset + index_length])
+
+        self.suffix = index["suffix"]
+        self.mtime_ns = os.stat(path).st_mtime_ns
+        self._index = {}
+        self._tables = {}   # table_id -> [(start, end, (offset, length))] in start order
+        for table_id, start, end, offset, length in index["chunks"]:
+            self._index[(table_id, start, end)] = (offset, length)
+            self._tables.setdefault(table_id, []).append((start, end, (offset, length)))
+        for chunks in self._tables.values():
+            chunks.sort()
+        self._by_name = {chunk_filename(*key, self.suffix): key for key in self._index}
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, item):
+        return (item in self._by_name) if isinstance(item, str) else (tuple(item) in self._index)
+
+    def keys(self) -> list:
+        """(table_id, start, end) of every chunk, sorted by table and start row."""
+        return sorted(self._index)
+
+    def names(self) -> list:
+        return [chunk_filename(*key, self.suffix) for key in self.keys()]
+
+    def tables(self) -> list:
+        return sorted(self._tables)
+
+    def ranges(self, table_id: str) -> list:
+        return [(start, end) for start, end, _ in self._tables.get(table_id, ())]
+
+    def read_bytes(self, table_id: str, start: int, end: int) -> bytes:
+        offset, length = self._index[(table_id, start, end)]
+        return self._mm[offset:offset + length]
+
+    def read(self, table_id: str, start: int, end: int) -> list:
+        return json.loads(self.read_bytes(table_id, start, end))
+
+    def key_of(self, filename: str) -> tuple:
+        return self._by_name[filename]
+
+    def size_of(self, filename: str) -> int:
+        return self._index[self._by_name[filename]][1]
+
+    def read_name(self, filename: str) -> list:
+        return self.read(*self._by_name[filename])
+
+    def items(self):
+        for key in self.keys():
+            yield chunk_filename(*key, self.suffix), self.read(*key)
+
+    def merged(self, table_id: str) -> list:
+        """All rows of a table, its chunks concatenated in start order."""
+        rows = []
+        for _, _, (offset, length) in self._tables.get(table_id, ()):
+            rows.extend(json.loads(self._mm[offset:offset + length]))
+        return rows
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_chunk_source(path: str):
+    """
+    Yield (filename, rows) for every chunk in a chunk folder (its *.json
+    files, sorted by name) or in a pack (sorted by table and start row).
+    """
+    path = resolve_chunk_source(path)
+    if is_pack(path):
+        with ChunkPack(path) as pack:
+            yield from pack.items()
+        return
+    for filename in sorted(os.listdir(path)):
+        file_path = os.path.join(path, filename)
+        if filename.endswith(".json") and os.path.isfile(file_path):
+            with open(file_path, "r", encoding="utf-8") as f:
+                yield filename, json.load(f)
+
+
+def pack_folder(folder: str, path: str = None) -> str:
+    """
+    Pack an existing folder of _chunk_<start>_<end> files (copied byte for
+    byte) and return the pack path. Files that are not chunks are skipped.
+    """
+    path = path or pack_path(folder)
+    parsed = []
+    for filename in sorted(os.listdir(folder)):
+        key = parse_chunk_filename(filename)
+        if key is not None:
+            parsed.append((key, filename))
+    suffixes = {suffix for (_, _, _, suffix), _ in parsed}
+    if len(suffixes) > 1:
+        raise ValueError(f"{folder} mixes chunk kinds {sorted(suffixes)}; pack them separately")
+
+    with ChunkPackWriter(path, suffix=suffixes.pop() if suffixes else "") as pack:
+        for (table_id, start, end, _), filename in sorted(parsed):
+            with open(os.path.join(folder, filename), "rb") as f:
+                pack.add_bytes(table_id, start, end, f.read())
+    return path
+
+
+def merge_pack(path: str, output_folder: str, **dump_kwargs) -> list:
+    """
+    Write every table of a pack to output_folder/<table_id>.json (its chunks
+    concatenated in start order), the way the chunk-folder mergers do.
+    Returns the written paths.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    written = []
+    with ChunkPack(path) as pack:
+        for table_id in pack.tables():
+            out_path = os.path.join(output_folder, f"{table_id}.json")
+            with open(out_path, "w", encoding="utf-8") as f:
+                json.dump(pack.merged(table_id), f, **dump_kwargs)
+            written.append(out_path)
+    return written
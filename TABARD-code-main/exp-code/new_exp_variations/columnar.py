@@ -0,0 +1,286 @@
+# ── columnar.py ─────────────────────────────────────────────────────────────
+
+import os
+import json
+from collections import defaultdict
+import numpy as np
+from tqdm.auto import tqdm
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional backend; the JSON layout keeps working without it
+    pa = pq = None
+
+from src.labels import MARKER
+
+# One Parquet dataset per fold, hive-partitioned by category:
+#   <dataset_dir>/category=<name>/part-0.parquet
+#
+# Tables are stored one cell per record, so column names are dictionary
+# encoded instead of being repeated in every row:
+#   table_id      source JSON file name without ".json"
+#   row_index     0-based row position in the table
+#   column_index  position of the key inside its row (keeps key order)
+#   column        key name
+#   value         cell value as text (None for JSON null)
+#   kind          how to turn `value` back into its JSON type (see _KINDS)
+#   anomaly       True for "@@@_" cells, or for "Yes" cells in yes/no tables
+PARTITION_FILE = "part-0.parquet"
+
+KIND_STR, KIND_INT, KIND_FLOAT, KIND_BOOL, KIND_NULL, KIND_JSON = range(6)
+
+MASK_MARKERS = "markers"   # perturbed tables / chunks
+MASK_YES = "yes"           # yes/no tables and predictions
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("The columnar dataset backend needs pyarrow: pip install pyarrow")
+
+
+def _schema():
+    return pa.schema([
+        ("table_id", pa.string()),
+        ("row_index", pa.int32()),
+        ("column_index", pa.int16()),
+        ("column", pa.string()),
+        ("value", pa.string()),
+        ("kind", pa.int8()),
+        ("anomaly", pa.bool_()),
+    ])
+
+
+def partition_path(dataset_dir: str, category: str) -> str:
+    return os.path.join(dataset_dir, f"category={category}", PARTITION_FILE)
+
+
+def is_partition(path: str) -> bool:
+    """True if `path` is one category partition directory (<dataset_dir>/category=<name>)."""
+    name = os.path.basename(os.path.normpath(path))
+    return name.startswith("category=") and os.path.isfile(os.path.join(path, PARTITION_FILE))
+
+
+def split_partition(path: str):
+    """(dataset_dir, category) of a partition directory."""
+    path = os.path.normpath(path)
+    return os.path.dirname(path), os.path.basename(path).split("=", 1)[1]
+
+
+def partition_mask(dataset_dir: str, category: str) -> str:
+    """MASK_MARKERS or MASK_YES: what the `anomaly` column of a partition was derived from."""
+    _require_pyarrow()
+    metadata = pq.read_schema(partition_path(dataset_dir, category)).metadata or {}
+    return metadata.get(b"mask", MASK_MARKERS.encode()).decode()
+
+
+def list_categories(dataset_dir: str) -> list:
+    """Return the category names stored in a fold dataset."""
+    if not os.path.isdir(dataset_dir):
+        return []
+    return sorted(
+        name.split("=", 1)[1]
+        for name in os.listdir(dataset_dir)
+        if name.startswith("category=") and os.path.isfile(os.path.join(dataset_dir, name, PARTITION_FILE))
+    )
+
+
+# ─── VALUE ENCODING ──────────────────────────────────────────────────────────
+def _encode_value(value):
+    if value is None:
+        return None, KIND_NULL
+    if isinstance(value, str):
+        return value, KIND_STR
+    if isinstance(value, bool):
+        return ("true" if value else "false"), KIND_BOOL
+    if isinstance(value, int):
+        return str(value), KIND_INT
+    if isinstance(value, float):
+        return repr(value), KIND_FLOAT
+    return json.dumps(value, ensure_ascii=False), KIND_JSON
+
+
+def _decode_value(text, kind):
+    if kind == KIND_STR:
+        return text
+    if kind == KIND_NULL:
+        return None
+    if kind == KIND_INT:
+        return int(text)
+    if kind == KIND_FLOAT:
+        return float(text)
+    if kind == KIND_BOOL:
+        return text == "true"
+    return json.loads(text)
+
+
+def _is_anomaly(value, mask: str) -> bool:
+    if not isinstance(value, str):
+        return False
+    if mask == MASK_YES:
+        return value == "Yes"
+    return value.startswith(MARKER)
+
+
+# ─── WRITERS ─────────────────────────────────────────────────────────────────
+def write_tables(dataset_dir: str, category: str, tables: dict, mask: str = MASK_MARKERS) -> str:
+    """
+    Write {table_id: rows} as the `category` partition of a fold dataset,
+    replacing that partition if it already exists. Returns the file path.
+    """
+    _require_pyarrow()
+    columns = defaultdict(list)
+    row_counts = {}
+    for table_id, rows in tables.items():
+        row_counts[table_id] = len(rows)
+        for row_index, row in enumerate(rows):
+            for column_index, (key, value) in enumerate(row.items()):
+                text, kind = _encode_value(value)
+                columns["table_id"].append(table_id)
+                columns["row_index"].append(row_index)
+                columns["column_index"].append(column_index)
+                columns["column"].append(key)
+                columns["value"].append(text)
+                columns["kind"].append(kind)
+                columns["anomaly"].append(_is_anomaly(value, mask))
+
+    schema = _schema().with_metadata({
+        # Row counts keep empty tables and empty rows round-trippable
+        "row_counts": json.dumps(row_counts, ensure_ascii=False),
+        "mask": mask,
+    })
+    table = pa.table({name: columns[name] for name in schema.names}, schema=schema)
+
+    out_path = partition_path(dataset_dir, category)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = out_path + ".tmp"
+    pq.write_table(
+        table,
+        tmp_path,
+        compression="zstd",
+        use_dictionary=["table_id", "column", "value"],
+    )
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def import_json_folder(json_dir: str, dataset_dir: str, category: str, mask: str = MASK_MARKERS) -> str:
+    """Convert a folder of JSON tables (list of dicts) into one category partition."""
+    tables = {}
+    json_files = [f for f in sorted(os.listdir(json_dir)) if f.endswith(".json")]
+    for file_name in tqdm(json_files, desc=f"Reading {category}", unit="file"):
+        with open(os.path.join(json_dir, file_name), "r", encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                print(f"Error reading {file_name}: {e}")
+                continue
+        if not isinstance(data, list):
+            print(f"[Skip] {file_name} is not a list of objects")
+            continue
+        tables[file_name[:-len(".json")]] = data
+    return write_tables(dataset_dir, category, tables, mask=mask)
+
+
+def import_json_tree(json_root: str, dataset_dir: str, mask: str = MASK_MARKERS):
+    """
+    Convert the existing one-folder-per-category JSON layout
+    (<json_root>/<category>/*.json) into a fold dataset.
+    """
+    for category in sorted(os.listdir(json_root)):
+        folder = os.path.join(json_root, category)
+        if os.path.isdir(folder):
+            import_json_folder(folder, dataset_dir, category, mask=mask)
+
+
+# ─── READERS ─────────────────────────────────────────────────────────────────
+def _read_partition(dataset_dir: str, category: str, table_ids=None, columns=None):
+    _require_pyarrow()
+    path = partition_path(dataset_dir, category)
+    filters = [("table_id", "in", list(table_ids))] if table_ids is not None else None
+    table = pq.read_table(path, columns=columns, filters=filters, read_dictionary=["table_id", "column"])
+    metadata = pq.read_schema(path).metadata or {}
+    row_counts = json.loads(metadata.get(b"row_counts", b"{}"))
+    if table_ids is not None:
+        wanted = set(table_ids)
+        row_counts = {t: n for t, n in row_counts.items() if t in wanted}
+    return table, row_counts
+
+
+def _sorted_columns(table, names):
+    order = np.lexsort((
+        table.column("column_index").to_numpy(),
+        table.column("row_index").to_numpy(),
+        table.column("table_id").to_numpy(zero_copy_only=False).astype(str),
+    ))
+    table = table.take(pa.array(order))
+    return [table.column(name).to_pylist() for name in names]
+
+
+def read_tables(dataset_dir: str, category: str, table_ids=None) -> dict:
+    """Return {table_id: rows} for one category, rows rebuilt exactly as in the JSON layout."""
+    table, row_counts = _read_partition(dataset_dir, category, table_ids)
+    tables = {table_id: [{} for _ in range(n_rows)] for table_id, n_rows in row_counts.items()}
+    if table.num_rows:
+        names = ["table_id", "row_index", "column", "value", "kind"]
+        for table_id, row_index, column, text, kind in zip(*_sorted_columns(table, names)):
+            tables[table_id][row_index][column] = _decode_value(text, kind)
+    return tables
+
+
+def read_table(dataset_dir: str, category: str, table_id: str) -> list:
+    return read_tables(dataset_dir, category, [table_id]).get(table_id, [])
+
+
+def read_anomaly_masks(dataset_dir: str, category: str, table_ids=None) -> dict:
+    """
+    Return {table_id: (columns, present, anomaly)} using only the key and
+    mask columns (cell values are never read). `present` and `anomaly` are
+    bool (rows, cols) matrices, as in labels.label_planes.
+    """
+    table, row_counts = _read_partition(
+        dataset_dir, category, table_ids,
+        columns=["table_id", "row_index", "column_index", "column", "anomaly"],
+    )
+    cells = defaultdict(list)
+    if table.num_rows:
+        names = ["table_id", "row_index", "column", "anomaly"]
+        for table_id, row_index, column, anomaly in zip(*_sorted_columns(table, names)):
+            cells[table_id].append((row_index, column, anomaly))
+
+    masks = {}
+    for table_id, n_rows in row_counts.items():
+        columns = list(dict.fromkeys(column for _, column, _ in cells[table_id]))
+        col_pos = {column: i for i, column in enumerate(columns)}
+        present = np.zeros((n_rows, len(columns)), dtype=bool)
+        anomaly = np.zeros((n_rows, len(columns)), dtype=bool)
+        for row_index, column, flag in cells[table_id]:
+            present[row_index, col_pos[column]] = True
+            anomaly[row_index, col_pos[column]] = flag
+        masks[table_id] = (columns, present, anomaly)
+    return masks
+
+
+def export_json_folder(dataset_dir: str, category: str, json_dir: str, indent: int = 4):
+    """Write one category back out in the JSON layout (<table_id>.json files)."""
+    os.makedirs(json_dir, exist_ok=True)
+    tables = read_tables(dataset_dir, category)
+    for table_id, rows in tqdm(tables.items(), desc=f"Writing {category}", unit="file"):
+        with open(os.path.join(json_dir, f"{table_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=indent, ensure_ascii=False)
+
+
+def export_json_tree(dataset_dir: str, json_root: str, indent: int = 4):
+    """Inverse of import_json_tree."""
+    for category in list_categories(dataset_dir):
+        export_json_folder(dataset_dir, category, os.path.join(json_root, category), indent=indent)
+
+
+if __name__ == "__main__":
+    # Convert one fold of perturbed tables (<category>/*.json) to Parquet and back
+    FOLD = "FetaQA"
+    json_root   = rf"....dataset\{FOLD}_Perturbed_Tables"
+    dataset_dir = rf"....dataset\parquet\{FOLD}"
+
+    import_json_tree(json_root, dataset_dir)
+    # export_json_tree(dataset_dir, rf"....dataset\{FOLD}_Perturbed_Tables-from-parquet")
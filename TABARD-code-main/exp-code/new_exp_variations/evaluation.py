@@ -0,0 +1,172 @@
+# ── evaluation.py ───────────────────────────────────────────────────────────
+
+import os
+import csv
+import json
+import itertools
+import typing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm.auto import tqdm
+
+from src.scoring import TableBatch, precision_recall_f1
+from src.gt_cache import load_gt_dir
+from src.sparse_predictions import SparsePredictions, is_sparse, resolve_prediction_source
+
+
+class EvalJob(typing.NamedTuple):
+    """One (ground-truth dir, prediction dir) pair plus the labels it is reported under."""
+    gt_dir: str
+    pred_dir: str
+    labels: dict
+
+
+# ─── JOB DISCOVERY ───────────────────────────────────────────────────────────
+def expand_jobs(gt_pattern: str, pred_pattern: str, **axes) -> list:
+    """
+    Build one EvalJob per combination of the given axes.
+
+    Patterns are str.format templates over the axis names, e.g.
+        expand_jobs(
+            os.path.join(GT_ROOT, "{fold}", "Merged-yes-no"),
+            os.path.join(PRED_ROOT, "{fold}", "{batch}", "predicted-merged", "predicted-yes-no"),
+            fold=FOLDS, batch=BATCHS,
+        )
+    A prediction directory may also be stored as its sparse file
+    (<pred_dir>.sparse.json, see src/sparse_predictions.py). Combinations
+    with neither are skipped.
+    """
+    names = list(axes)
+    jobs = []
+    for values in itertools.product(*(axes[name] for name in names)):
+        labels = dict(zip(names, values))
+        pred_dir = pred_pattern.format(**labels)
+        source = resolve_prediction_source(pred_dir)
+        if not (os.path.isdir(source) or is_sparse(source)):
+            print(f"[Skip] No predictions at {pred_dir}")
+            continue
+        jobs.append(EvalJob(gt_pattern.format(**labels), pred_dir, labels))
+    return jobs
+
+
+# ─── WORKER ──────────────────────────────────────────────────────────────────
+def _load_ground_truth(gt_dir: str, from_markers: bool = False):
+    """Return the cached {filename: GTTable} view of gt_dir (empty if missing)."""
+    if not os.path.isdir(gt_dir):
+        print(f"[Skip] Ground-truth directory not found: {gt_dir}")
+        return {}
+    return load_gt_dir(gt_dir, from_markers)
+
+
+def _score_job(ground_truth: dict, job: EvalJob):
+    batch = TableBatch()
+    missing = []
+    source = resolve_prediction_source(job.pred_dir)
+    sparse = SparsePredictions.load(source).merged() if is_sparse(source) else None
+    for filename, gt_table in ground_truth.items():
+        if sparse is not None:
+            cells = sparse.get(filename)
+            if cells is None:
+                missing.append(filename)
+            else:
+                batch.add(filename, *gt_table.align_sparse(cells))
+            continue
+        pred_path = os.path.join(job.pred_dir, filename)
+        if not os.path.exists(pred_path):
+            missing.append(filename)
+            continue
+        with open(pred_path, "r", encoding="utf-8") as f:
+            pred_rows = json.load(f)
+        batch.add(filename, *gt_table.align(pred_rows))
+
+    per_file = []
+    for filename, tp, fp, fn in batch.score():
+        per_file.append({**job.labels, "file": filename, **_metrics(tp, fp, fn)})
+
+    tp, fp, fn = (int(c.sum()) for c in batch.counts())
+    summary = {**job.labels, "files": len(batch), "missing": len(missing), **_metrics(tp, fp, fn)}
+    return summary, per_file
+
+
+def _score_group(gt_dir: str, jobs: list, from_markers: bool = False):
+    """Load one ground-truth directory and score every job that shares it."""
+    ground_truth = _load_ground_truth(gt_dir, from_markers)
+    return [_score_job(ground_truth, job) for job in jobs]
+
+
+def _metrics(tp: int, fp: int, fn: int) -> dict:
+    precision, recall, f1 = precision_recall_f1(tp, fp, fn)
+    return {
+        "TP": tp,
+        "FP": fp,
+        "FN": fn,
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "f1": round(f1, 4),
+    }
+
+
+def _split_groups(jobs: list, max_workers: int) -> list:
+    """
+    Group jobs by ground-truth directory so each directory is parsed once per
+    task, then split large groups so every worker still has something to do.
+    """
+    groups = defaultdict(list)
+    for job in jobs:
+        groups[job.gt_dir].append(job)
+
+    tasks = []
+    for gt_dir, group in groups.items():
+        n_parts = max(1, min(len(group), round(max_workers * len(group) / len(jobs))))
+        size = -(-len(group) // n_parts)
+        for start in range(0, len(group), size):
+            tasks.append((gt_dir, group[start:start + size]))
+    return tasks
+
+
+# ─── DRIVER ──────────────────────────────────────────────────────────────────
+def run_evaluation(jobs: list, results_path: str, per_file_path: str = None, max_workers: int = None,
+                   from_markers: bool = False) -> list:
+    """
+    Score every job over a process pool and write one consolidated CSV
+    (one row per job) to `results_path`. Per-table rows go to
+    `per_file_path` when given. With `from_markers`, each job's gt_dir is a
+    folder of perturbed tables and labels come from their "@@@_" markers.
+    A gt_dir may also be a category partition of a Parquet fold dataset
+    (src/columnar.py), whose labels are read from its anomaly column.
+    Returns the list of summary rows.
+    """
+    if not jobs:
+        print("No evaluation jobs to run.")
+        return []
+
+    max_workers = max_workers or os.cpu_count() or 1
+    tasks = _split_groups(jobs, max_workers)
+
+    summaries, per_file_rows = [], []
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks))) as pool:
+        futures = [pool.submit(_score_group, gt_dir, group, from_markers) for gt_dir, group in tasks]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Evaluating", unit="task"):
+            for summary, per_file in future.result():
+                summaries.append(summary)
+                per_file_rows.extend(per_file)
+
+    # Keep the table in job order regardless of completion order
+    order = {tuple(job.labels.items()): i for i, job in enumerate(jobs)}
+    label_names = list(jobs[0].labels)
+    summaries.sort(key=lambda row: order[tuple((k, row[k]) for k in label_names)])
+
+    _write_csv(results_path, summaries)
+    if per_file_path:
+        _write_csv(per_file_path, per_file_rows)
+    return summaries
+
+
+def _write_csv(path: str, rows: list):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    fieldnames = list(rows[0]) if rows else []
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,491 @@
+# ── experiment_matrix.py ────────────────────────────────────────────────────
+
+import os
+import json
+import time
+import asyncio
+import logging
+import itertools
+import typing
+
+from src.batch_shards import read_shard_manifest
+from src.batch_poller import BatchPoller, JobStatus
+from src.job_registry import SUBMITTING, SUCCEEDED as JOB_SUCCEEDED, FAILED as JOB_FAILED, sha256_files
+
+# Runs a whole experiment matrix (models x prompts x folds x variations x
+# categories) as batch jobs. Up to `max_in_flight` jobs are in flight at
+# once; all of them are polled by one shared BatchPoller (adaptive, jittered
+# intervals), and a job's output is collected and handed to postprocessing
+# the moment it ends, while the other jobs keep running. The SDK calls are
+# blocking, so each one runs in a worker thread.
+#
+# Paths and URIs are templates filled from the experiment's fields, e.g.
+#   "..Batchfiles/gpt4o/{variation}/{fold}/{prompt}/output.jsonl"
+# An experiment whose local output already exists is skipped. With a
+# JobRegistry (src/job_registry.py), jobs recorded as running are reattached
+# and jobs recorded as succeeded are not submitted again, as long as their
+# input is unchanged.
+
+SKIPPED, SUCCEEDED, FAILED = "skipped", "succeeded", "failed"
+
+
+class Experiment(typing.NamedTuple):
+    model: str
+    prompt: str                  # prompt level / batch name, e.g. "l1_cot", "museve"
+    fold: str
+    variation: str = None        # e.g. "variation_1"; None for the merged folds
+    category: str = None         # anomaly category, for per-category batch files
+
+    def format(self, template: str) -> str:
+        return template.format(**self._asdict())
+
+    @property
+    def key(self) -> str:
+        """Stable id of the experiment (job registry key, batch metadata)."""
+        return "|".join(part or "" for part in self)
+
+    def __str__(self):
+        return "/".join(part for part in self if part)
+
+
+def expand_matrix(models: list, prompts: list, folds: list,
+                  variations: list = None, categories: list = None) -> list:
+    """Every combination of the given axes (variations / categories are optional)."""
+    return [
+        Experiment(model, prompt, fold, variation, category)
+        for model, variation, fold, prompt, category in itertools.product(
+            models, variations or [None], folds, prompts, categories or [None])
+    ]
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# BACKENDS
+# ────────────────────────────────────────────────────────────────────────────
+# A backend knows how to run one experiment as a batch job:
+#   provider             -> name recorded in the job registry
+#   output_path(exp)     -> local file whose existence means the experiment is done
+#                           (None: never skipped)
+#   fingerprint(exp)     -> hash of the experiment's input
+#   submit(exp, fingerprint) -> handle
+#   job_ids(handle) / attach(job_ids) -> provider job ids and back
+#   poll(handle)         -> JobStatus (src/batch_poller.py), with request counts
+#                           when the provider reports them
+#   collect(exp, handle) -> local output path (or None)
+# and optionally find(exp, fingerprint) -> job ids of a job submitted for
+# this input that the registry never heard back about (or None).
+class OpenAIBatchBackend:
+    """
+    OpenAI Batch API. Sharded inputs (see src/batch_shards.py) are submitted
+    as one batch per shard and their outputs concatenated in shard order.
+    """
+
+    provider = "openai"
+    ENDED = ("completed", "failed", "cancelled", "expired")
+    # Most recent batches find() looks through
+    FIND_SCAN_LIMIT = 1000
+
+    def __init__(self, client, input_path: str, output_path: str,
+                 endpoint: str = "/v1/chat/completions", completion_window: str = "24h"):
+        self.client = client
+        self.input_path = input_path
+        self._output_path = output_path
+        self.endpoint = endpoint
+        self.completion_window = completion_window
+
+    def output_path(self, exp: Experiment) -> str:
+        return exp.format(self._output_path)
+
+    def fingerprint(self, exp: Experiment) -> str:
+        return sha256_files(read_shard_manifest(exp.format(self.input_path)))
+
+    def submit(self, exp: Experiment, fingerprint: str = "") -> list:
+        handle = []
+        for shard, shard_path in enumerate(read_shard_manifest(exp.format(self.input_path))):
+            with open(shard_path, "rb") as f:
+                batch_input_file = self.client.files.create(file=f, purpose="batch")
+            batch = self.client.batches.create(
+                input_file_id=batch_input_file.id,
+                endpoint=self.endpoint,
+                completion_window=self.completion_window,
+                metadata={
+                    "description": f"{exp} - anomaly-detection-batch-job",
+                    "tabard_key": exp.key[:512],
+                    "input_sha256": fingerprint,
+                    "shard": str(shard),
+                },
+            )
+            handle.append(batch.id)
+        return handle
+
+    def job_ids(self, handle: list) -> list:
+        return list(handle)
+
+    def attach(self, job_ids: list) -> list:
+        return list(job_ids)
+
+    def find(self, exp: Experiment, fingerprint: str) -> list:
+        """Batch ids (in shard order) submitted for this input, if all shards are there."""
+        n_shards = len(read_shard_manifest(exp.format(self.input_path)))
+        found = {}
+        for n, batch in enumerate(self.client.batches.list(limit=100)):
+            if n >= self.FIND_SCAN_LIMIT:
+                break
+            metadata = batch.metadata or {}
+            if metadata.get("tabard_key") == exp.key[:512] and metadata.get("input_sha256") == fingerprint:
+                found.setdefault(int(metadata.get("shard", 0)), batch.id)  # newest first
+        if len(found) != n_shards:
+            return None
+        return [found[shard] for shard in range(n_shards)]
+
+    def poll(self, handle: list) -> JobStatus:
+        batches = [self.client.batches.retrieve(batch_id) for batch_id in handle]
+        states = [b.status for b in batches]
+        ended = all(state in self.ENDED for state in states)
+        succeeded = ended and all(b.status == "completed" and b.output_file_id for b in batches)
+        counts = [b.request_counts for b in batches]
+        if all(c is not None and c.total for c in counts):
+            completed = sum(c.completed + c.failed for c in counts)
+            total = sum(c.total for c in counts)
+        else:
+            completed = total = None  # still validating
+        return JobStatus(",".join(states), ended, succeeded, completed, total)
+
+    def collect(self, exp: Experiment, handle: list) -> str:
+        output_path = self.output_path(exp)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for batch_id in handle:
+                batch = self.client.batches.retrieve(batch_id)
+                text = self.client.files.content(batch.output_file_id).text
+                f.write(text if text.endswith("\n") or not text else text + "\n")
+        os.replace(tmp_path, output_path)
+        return output_path
+
+
+class VertexBatchBackend:
+    """
+    Vertex AI batch prediction (Gemini, and Llama MaaS). `download(exp)` is
+    the script's own function that copies the prediction files from the
+    output bucket to `output_path`; without one, results stay in the bucket
+    and collect() returns the job's output location. vertexai.init() must
+    have been called.
+    """
+
+    provider = "vertex"
+
+    def __init__(self, source_model: str, input_uri: str, output_uri: str,
+                 output_path: str = None, download: typing.Callable = None):
+        self.source_model = source_model
+        self.input_uri = input_uri
+        self.output_uri = output_uri
+        self._output_path = output_path
+        self.download = download
+
+    def output_path(self, exp: Experiment) -> str:
+        return exp.format(self._output_path) if self._output_path else None
+
+    def fingerprint(self, exp: Experiment) -> str:
+        """MD5 of the input object as reported by GCS (the URI itself if it cannot be read)."""
+        uri = exp.format(self.input_uri)
+        try:
+            from google.cloud import storage
+
+            bucket, _, name = uri[len("gs://"):].partition("/")
+            blob = storage.Client().bucket(bucket).get_blob(name)
+            if blob is not None and blob.md5_hash:
+                return f"md5:{blob.md5_hash}"
+        except Exception:
+            pass
+        return f"uri:{uri}"
+
+    def submit(self, exp: Experiment, fingerprint: str = ""):
+        from vertexai.batch_prediction import BatchPredictionJob
+
+        return BatchPredictionJob.submit(
+            source_model=self.source_model,
+            input_dataset=exp.format(self.input_uri),
+            output_uri_prefix=exp.format(self.output_uri),
+        )
+
+    def job_ids(self, job) -> list:
+        return [job.resource_name]
+
+    def attach(self, job_ids: list):
+        from vertexai.batch_prediction import BatchPredictionJob
+
+        return BatchPredictionJob(job_ids[0])
+
+    def poll(self, job) -> JobStatus:
+        job.refresh()
+        completed = total = None
+        stats = getattr(getattr(job, "_gca_resource", None), "completion_stats", None)
+        if stats is not None:
+            completed = stats.successful_count + stats.failed_count
+            total = completed + stats.incomplete_count or None
+        return JobStatus(job.state.name, job.has_ended, job.has_ended and job.has_succeeded, completed, total)
+
+    def collect(self, exp: Experiment, job) -> str:
+        if self.download is None:
+            return job.output_location
+        self.download(exp)
+        return self.output_path(exp)
+
+
+class FakeBatchBackend:
+    """
+    Local stand-in for a batch provider, for dry runs of a matrix and for
+    exercising the runner and job registry without an API. Jobs are JSON
+    files under `state_dir`, so they outlive the driver like real ones;
+    a job is "validating", then "in_progress" until `latency` seconds after
+    submission, then "completed" (or "failed" where `fail(exp)` is true).
+    Every request of the input is answered with `reply` in the OpenAI batch
+    output format.
+    """
+
+    provider = "fake"
+
+    def __init__(self, state_dir: str, input_path: str, output_path: str, latency: float = 5.0,
+                 reply: str = "[]", fail: typing.Callable = None):
+        self.state_dir = state_dir
+        self.input_path = input_path
+        self._output_path = output_path
+        self.latency = latency
+        self.reply = reply
+        self.fail = fail
+        os.makedirs(state_dir, exist_ok=True)
+
+    @property
+    def n_submitted(self) -> int:
+        return sum(1 for name in os.listdir(self.state_dir) if name.endswith(".json"))
+
+    def output_path(self, exp: Experiment) -> str:
+        return exp.format(self._output_path)
+
+    def fingerprint(self, exp: Experiment) -> str:
+        return sha256_files(read_shard_manifest(exp.format(self.input_path)))
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def submit(self, exp: Experiment, fingerprint: str = "") -> list:
+        job_id = f"fake-{time.time_ns()}"
+        job = {
+            "key": exp.key,
+            "input_sha256": fingerprint,
+            "inputs": read_shard_manifest(exp.format(self.input_path)),
+            "submitted_at": time.time(),
+            "fail": bool(self.fail and self.fail(exp)),
+        }
+        with open(self._job_path(job_id), "w", encoding="utf-8") as f:
+            json.dump(job, f)
+        return [job_id]
+
+    def job_ids(self, handle: list) -> list:
+        return list(handle)
+
+    def attach(self, job_ids: list) -> list:
+        return list(job_ids)
+
+    def find(self, exp: Experiment, fingerprint: str) -> list:
+        for name in sorted(os.listdir(self.state_dir), reverse=True):
+            with open(os.path.join(self.state_dir, name), "r", encoding="utf-8") as f:
+                job = json.load(f)
+            if job["key"] == exp.key and job["input_sha256"] == fingerprint:
+                return [name[:-len(".json")]]
+        return None
+
+    def status(self, handle: list) -> dict:
+        """Provider-style status: state plus request counts, like an OpenAI batch object."""
+        with open(self._job_path(handle[0]), "r", encoding="utf-8") as f:
+            job = json.load(f)
+        total = 0
+        for path in job["inputs"]:
+            with open(path, "rb") as f:
+                total += sum(1 for _ in f)
+        age = time.time() - job["submitted_at"]
+        if age < self.latency * 0.1:
+            state, done = "validating", 0
+        elif age < self.latency:
+            state, done = "in_progress", int(total * age / self.latency)
+        else:
+            state, done = ("failed" if job["fail"] else "completed"), total
+        return {"status": state, "request_counts": {"total": total, "completed": done, "failed": 0}}
+
+    def poll(self, handle: list) -> JobStatus:
+        status = self.status(handle)
+        state, counts = status["status"], status["request_counts"]
+        return JobStatus(state, state in ("completed", "failed"), state == "completed",
+                         counts["completed"] + counts["failed"], counts["total"])
+
+    def collect(self, exp: Experiment, handle: list) -> str:
+        with open(self._job_path(handle[0]), "r", encoding="utf-8") as f:
+            job = json.load(f)
+        output_path = self.output_path(exp)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as out:
+            n = 0
+            for path in job["inputs"]:
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        request = json.loads(line)
+                        n += 1
+                        out.write(json.dumps({
+                            "id": f"batch_req_{n}",
+                            "custom_id": request.get("custom_id", request.get("id")),
+                            "response": {"status_code": 200, "body": {"choices": [
+                                {"index": 0, "message": {"role": "assistant", "content": self.reply}}]}},
+                            "error": None,
+                        }) + "\n")
+        return output_path
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# RUNNER
+# ────────────────────────────────────────────────────────────────────────────
+async def run_matrix_async(experiments: list, backends: dict, max_in_flight: int = 8,
+                           poll_interval: float = 30, on_complete: typing.Callable = None,
+                           logger: logging.Logger = None, registry=None,
+                           max_poll_interval: float = 600) -> dict:
+    """
+    Run every experiment on `backends[exp.model]` and return {exp: status}.
+    Jobs are polled no more often than every `poll_interval` seconds and at
+    least every `max_poll_interval` seconds (see src/batch_poller.py).
+    `on_complete(exp, output_path)` is called (in a worker thread) for each
+    experiment whose job succeeded, as soon as its output is collected.
+    With a `registry`, every job is recorded there and known jobs are
+    reattached or skipped instead of being submitted again.
+    """
+    logger = logger or logging.getLogger(__name__)
+    poller = BatchPoller(min_interval=poll_interval, max_interval=max_poll_interval,
+                         max_concurrent=max_in_flight, logger=logger)
+    slots = asyncio.Semaphore(max_in_flight)
+    results = {}
+    fingerprints = {}   # exp -> input fingerprint
+    jobs = []           # coroutines, one per experiment that is not skipped
+
+    async def finish(exp, handle):
+        backend = backends[exp.model]
+        try:
+            output_path = await asyncio.to_thread(backend.collect, exp, handle)
+            logger.info(f"{exp}: output saved to {output_path}")
+            if registry is not None:
+                registry.finished(exp.key, JOB_SUCCEEDED, output_location=output_path)
+            if on_complete is not None:
+                await asyncio.to_thread(on_complete, exp, output_path)
+            results[exp] = SUCCEEDED
+        except Exception as e:
+            logger.error(f"{exp}: collecting / postprocessing failed: {e}")
+            results[exp] = FAILED
+        logger.info(f"Matrix: {len(results)}/{len(experiments)} done")
+
+    async def wait(exp, handle, submitted_at=None):
+        backend = backends[exp.model]
+
+        def on_update(status):
+            if registry is not None:
+                registry.progress(exp.key, status.state)
+
+        return await poller.wait(str(exp), lambda: backend.poll(handle), submitted_at, on_update)
+
+    async def settle(exp, handle, status):
+        if status.succeeded:
+            logger.info(f"{exp}: job finished ({status.state})")
+            await finish(exp, handle)
+            return
+        logger.error(f"{exp}: job ended with state {status.state}; no output saved")
+        if registry is not None:
+            registry.finished(exp.key, JOB_FAILED, error=f"job ended with state {status.state}")
+        results[exp] = FAILED
+
+    async def fingerprint(exp):
+        if exp not in fingerprints:
+            fingerprints[exp] = await asyncio.to_thread(backends[exp.model].fingerprint, exp)
+        return fingerprints[exp]
+
+    async def resume(exp, record):
+        """Reattach to / skip a job the registry knows; returns False if it must be submitted."""
+        backend = backends[exp.model]
+        if record.input_sha256 != await fingerprint(exp):
+            logger.info(f"{exp}: input changed since job {record.job_ids}, submitting again")
+            return False
+        job_ids = record.job_ids
+        if record.state == SUBMITTING and hasattr(backend, "find"):
+            job_ids = await asyncio.to_thread(backend.find, exp, record.input_sha256)
+            if job_ids:
+                registry.submitted(exp.key, job_ids)
+        if record.state == SUBMITTING and not job_ids:
+            logger.warning(f"{exp}: driver stopped while submitting and the job cannot be found; submitting again")
+        if record.state == JOB_FAILED or not job_ids:
+            return False
+        handle = backend.attach(job_ids)
+        if record.state == JOB_SUCCEEDED:
+            output_path = backend.output_path(exp)
+            if output_path is None or os.path.exists(output_path):
+                logger.info(f"Skipping {exp}: job {job_ids} already succeeded")
+                results[exp] = SKIPPED
+            else:
+                logger.info(f"{exp}: job {job_ids} already succeeded, collecting its output again")
+                jobs.append(finish(exp, handle))
+            return True
+        logger.info(f"{exp}: reattached to job {job_ids}")
+        jobs.append(reattach_and_watch(exp, handle, record.submitted_at))
+        return True
+
+    async def reattach_and_watch(exp, handle, submitted_at):
+        async with slots:
+            status = await wait(exp, handle, submitted_at)
+        await settle(exp, handle, status)
+
+    async def submit_and_watch(exp):
+        backend = backends[exp.model]
+        async with slots:
+            try:
+                if registry is not None:
+                    registry.begin(exp.key, backend.provider, await fingerprint(exp))
+                handle = await asyncio.to_thread(backend.submit, exp, fingerprints.get(exp, ""))
+            except Exception as e:
+                logger.error(f"{exp}: submit failed: {e}")
+                if registry is not None:
+                    registry.finished(exp.key, JOB_FAILED, error=f"submit: {e}")
+                results[exp] = FAILED
+                return
+            if registry is not None:
+                registry.submitted(exp.key, backend.job_ids(handle))
+            logger.info(f"{exp}: submitted")
+            status = await wait(exp, handle, time.time())
+        # The slot is free again while the output is collected and postprocessed
+        await settle(exp, handle, status)
+
+    pending = []
+    for exp in experiments:
+        output_path = backends[exp.model].output_path(exp)
+        record = registry.get(exp.key) if registry is not None else None
+        if output_path and os.path.exists(output_path) and (record is None or record.state == JOB_SUCCEEDED):
+            logger.info(f"Skipping {exp}: output already exists")
+            results[exp] = SKIPPED
+        elif record is None or not await resume(exp, record):
+            pending.append(exp)
+
+    # Reattached jobs go first so they get their slots back before new submissions
+    jobs.extend(submit_and_watch(exp) for exp in pending)
+    await asyncio.gather(*jobs)
+    logger.info(poller.summary())
+    return results
+
+
+def run_matrix(experiments: list, backends: dict, max_in_flight: int = 8,
+               poll_interval: float = 30, on_complete: typing.Callable = None,
+               logger: logging.Logger = None, registry=None, max_poll_interval: float = 600) -> dict:
+    """Blocking wrapper around run_matrix_async; logs a summary when done."""
+    logger = logger or logging.getLogger(__name__)
+    started = time.time()
+    results = asyncio.run(run_matrix_async(
+        experiments, backends, max_in_flight, poll_interval, on_complete, logger, registry,
+        max_poll_interval))
+    counts = {status: sum(1 for s in results.values() if s == status) for status in (SUCCEEDED, SKIPPED, FAILED)}
+    logger.info(f"Matrix finished in {time.time() - started:.0f}s: "
+                + ", ".join(f"{n} {status}" for status, n in counts.items()))
+    if registry is not None:
+        logger.info(registry.summary())
+    return results
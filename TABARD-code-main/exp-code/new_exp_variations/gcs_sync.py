@@ -0,0 +1,424 @@
+# ── gcs_sync.py ─────────────────────────────────────────────────────────────
+
+import os
+import json
+import base64
+import hashlib
+import logging
+import threading
+import typing
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Bulk, resumable download of batch prediction files from GCS.
+#
+#   - Every object of a sync goes through one thread pool. Objects larger
+#     than `parallel_threshold` are split into `chunk_size` byte ranges that
+#     are fetched concurrently and written in place into <file>.part; the
+#     ranges already written are recorded in <file>.part.json, so an
+#     interrupted download resumes where it stopped (as long as the object's
+#     generation is unchanged).
+#   - Each local directory keeps an index (.gcs_sync.json) of the objects
+#     synced into it: generation, size and checksum of the object, plus size
+#     and mtime of the local file. A file whose index entry still matches is
+#     skipped without reading it; a file that exists but is not indexed is
+#     checked by size and checksum (MD5, or CRC32C for composite objects) and
+#     only downloaded again if they differ. New entries are written to the
+#     index every INDEX_FLUSH_EVERY files and at the end of the directory's
+#     pass, not once per file.
+#   - Every download, whole or ranged, is checked against the object's size
+#     and checksum before it is moved into place, so a truncated transfer is
+#     never indexed as synced.
+#   - Files are stored under their basename (what the postprocessing reads);
+#     two objects of one job with the same basename (e.g. the
+#     prediction-model-*/predictions.jsonl of two runs under one prefix) are
+#     an error instead of overwriting each other.
+#   - sync_many() lists the common parent prefix of all its jobs once instead
+#     of once per job.
+#
+# Buckets: GCSBucket wraps google-cloud-storage (which honours
+# STORAGE_EMULATOR_HOST, so it also runs against a local emulator), and
+# LocalBucket serves a directory tree as a bucket for tests and dry runs.
+
+INDEX_NAME = ".gcs_sync.json"
+CHUNK_SIZE = 32 * 1024 * 1024
+PARALLEL_THRESHOLD = 64 * 1024 * 1024
+INDEX_FLUSH_EVERY = 64   # files per index write; an interrupted sync loses at most this many entries
+
+
+class RemoteObject(typing.NamedTuple):
+    name: str
+    size: int
+    generation: str
+    md5: str = None       # base64, as GCS reports it (absent for composite objects)
+    crc32c: str = None    # base64 of the big-endian CRC32C
+
+
+class SyncResult(typing.NamedTuple):
+    files: list           # local paths of every matching object, downloaded or not
+    downloaded: int
+    skipped: int
+    bytes: int            # bytes transferred
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# CHECKSUMS
+# ────────────────────────────────────────────────────────────────────────────
+def _crc32c_table() -> list:
+    table = []
+    for n in range(256):
+        c = n
+        for _ in range(8):
+            c = (c >> 1) ^ 0x82F63B78 if c & 1 else c >> 1
+        table.append(c)
+    return table
+
+
+_CRC32C_TABLE = None
+
+
+def _crc32c_update(crc: int, data: bytes) -> int:
+    """Pure-Python CRC32C, only used when google-crc32c is not installed."""
+    global _CRC32C_TABLE
+    if _CRC32C_TABLE is None:
+        _CRC32C_TABLE = _crc32c_table()
+    table = _CRC32C_TABLE
+    crc ^= 0xFFFFFFFF
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+def file_checksum(path: str, kind: str) -> str:
+    """base64 "md5" or "crc32c" of a local file, in the format GCS reports."""
+    if kind == "md5":
+        h = hashlib.md5()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return base64.b64encode(h.digest()).decode("ascii")
+    try:
+        import google_crc32c
+
+        h = google_crc32c.Checksum()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return base64.b64encode(h.digest()).decode("ascii")
+    except ImportError:
+        crc = 0
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                crc = _crc32c_update(crc, block)
+        return base64.b64encode(crc.to_bytes(4, "big")).decode("ascii")
+
+
+def _checksum_kind(obj: RemoteObject) -> str:
+    return "md5" if obj.md5 else "crc32c" if obj.crc32c else None
+
+
+def _verify(obj: RemoteObject, path: str):
+    """Raise IOError if the downloaded file at `path` differs from `obj` in size or checksum."""
+    size = os.path.getsize(path)
+    if size != obj.size:
+        raise IOError(f"size mismatch after download: {size} of {obj.size} bytes")
+    kind = _checksum_kind(obj)
+    if kind is not None and file_checksum(path, kind) != getattr(obj, kind):
+        raise IOError(f"{kind} mismatch after download")
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# BUCKETS
+# ────────────────────────────────────────────────────────────────────────────
+class GCSBucket:
+    """A GCS bucket (or one on the emulator at STORAGE_EMULATOR_HOST)."""
+
+    def __init__(self, bucket_name: str, client=None):
+        self.bucket_name = bucket_name
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google.cloud import storage
+
+            self._client = storage.Client()
+        return self._client
+
+    def uri(self, name: str) -> str:
+        return f"gs://{self.bucket_name}/{name}"
+
+    def list(self, prefix: str) -> list:
+        return [
+            RemoteObject(blob.name, blob.size, str(blob.generation), blob.md5_hash, blob.crc32c)
+            for blob in self.client.list_blobs(self.bucket_name, prefix=prefix)
+        ]
+
+    def _blob(self, obj: RemoteObject):
+        return self.client.bucket(self.bucket_name).blob(obj.name, generation=int(obj.generation))
+
+    def download(self, obj: RemoteObject, path: str):
+        self._blob(obj).download_to_filename(path)
+
+    def read_range(self, obj: RemoteObject, start: int, end: int) -> bytes:
+        """Bytes [start, end) of the object's pinned generation."""
+        return self._blob(obj).download_as_bytes(start=start, end=end - 1, checksum=None)
+
+
+class LocalBucket:
+    """
+    A directory served as a bucket: object names are paths relative to `root`.
+
+    Usage:
+        syncer = PredictionSync(LocalBucket("/tmp/fake-bucket"))
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def uri(self, name: str) -> str:
+        return f"file://{os.path.join(self.root, name)}"
+
+    def list(self, prefix: str) -> list:
+        objects = []
+        for folder, _, files in os.walk(self.root):
+            for filename in files:
+                path = os.path.join(folder, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    stat = os.stat(path)
+                    objects.append(RemoteObject(name, stat.st_size, str(stat.st_mtime_ns),
+                                                md5=file_checksum(path, "md5")))
+        return sorted(objects)
+
+    def download(self, obj: RemoteObject, path: str):
+        with open(path, "wb") as f:
+            f.write(self.read_range(obj, 0, obj.size))
+
+    def read_range(self, obj: RemoteObject, start: int, end: int) -> bytes:
+        with open(os.path.join(self.root, obj.name), "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# SYNC
+# ────────────────────────────────────────────────────────────────────────────
+def _load_json(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _dump_json(data: dict, path: str):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _index_entry(obj: RemoteObject, path: str) -> dict:
+    return {
+        "object": obj.name,
+        "generation": obj.generation,
+        "size": obj.size,
+        "md5": obj.md5,
+        "crc32c": obj.crc32c,
+        "mtime_ns": os.stat(path).st_mtime_ns,
+    }
+
+
+class PredictionSync:
+    """
+    Usage:
+        syncer = PredictionSync(GCSBucket("my-output-bucket"), max_workers=16, logger=logger)
+        result = syncer.sync("gemini/output_folder-FetaQA/l1_cot/", "predicitons/gemini/FetaQA/l1_cot",
+                             match=lambda filename: filename.startswith("predictions.jsonl"))
+        print(result.files, result.downloaded, result.skipped)
+    """
+
+    def __init__(self, bucket, max_workers: int = 16, chunk_size: int = CHUNK_SIZE,
+                 parallel_threshold: int = PARALLEL_THRESHOLD, logger: logging.Logger = None):
+        self.bucket = bucket
+        self.chunk_size = chunk_size
+        self.parallel_threshold = max(parallel_threshold, chunk_size)
+        self.logger = logger or logging.getLogger(__name__)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._index_locks = {}   # local dir -> lock guarding its index file
+        self._locks_lock = threading.Lock()
+
+    def close(self):
+        self._pool.shutdown()
+
+    def sync(self, prefix: str, local_dir: str, match: typing.Callable = None) -> SyncResult:
+        """Download every object under `prefix` whose basename passes `match` into `local_dir`."""
+        return self.sync_many([(prefix, local_dir)], match)[0]
+
+    def sync_many(self, jobs: list, match: typing.Callable = None) -> list:
+        """
+        Sync several (prefix, local_dir) pairs with one listing of their
+        common parent prefix; returns one SyncResult per pair. Raises
+        ValueError, before downloading anything, if two matching objects of
+        one pair share a basename.
+        """
+        parent = os.path.commonprefix([prefix for prefix, _ in jobs])
+        listing = self.bucket.list(parent)
+        plans = []
+        for prefix, local_dir in jobs:
+            objects = [obj for obj in listing if obj.name.startswith(prefix)
+                       and not obj.name.endswith("/")
+                       and (match is None or match(os.path.basename(obj.name)))]
+            plans.append(self._plan(local_dir, objects))
+        results = []
+        for local_dir, todo, files, skipped, entries in plans:
+            futures = [(obj, path, self._download(obj, path)) for obj, path in todo]
+            downloaded, transferred = 0, 0
+            try:
+                for obj, path, parts in futures:
+                    wait(parts)  # let every range settle, so a retry resumes from all of them
+                    try:
+                        transferred += sum(part.result() for part in parts)
+                        self._finish(obj, path)
+                        entries[os.path.basename(path)] = _index_entry(obj, path)
+                        downloaded += 1
+                    except Exception as e:
+                        self.logger.error(f"Downloading {self.bucket.uri(obj.name)} failed: {e}")
+                        files.remove(path)
+                    if len(entries) >= INDEX_FLUSH_EVERY:
+                        self._flush_index(local_dir, entries)
+            finally:
+                self._flush_index(local_dir, entries)
+            results.append(SyncResult(files, downloaded, skipped, transferred))
+            self.logger.info(f"Synced {local_dir}: {downloaded} downloaded ({transferred} bytes), "
+                             f"{skipped} up to date")
+        return results
+
+    # ── planning ────────────────────────────────────────────────────────────
+    def _index_lock(self, local_dir: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._index_locks.setdefault(os.path.abspath(local_dir), threading.Lock())
+
+    def _plan(self, local_dir: str, objects: list) -> tuple:
+        """
+        Split `objects` into those to download and those already in `local_dir`;
+        also returns the index entries of files found up to date by checksum.
+        """
+        by_name = {}
+        for obj in objects:
+            by_name.setdefault(os.path.basename(obj.name), []).append(obj.name)
+        clashes = [names for names in by_name.values() if len(names) > 1]
+        if clashes:
+            raise ValueError(f"Objects would overwrite each other in {local_dir}: "
+                             + "; ".join(", ".join(names) for names in clashes))
+        os.makedirs(local_dir, exist_ok=True)
+        with self._index_lock(local_dir):
+            index = _load_json(os.path.join(local_dir, INDEX_NAME))
+        todo, files, skipped, entries = [], [], 0, {}
+        for obj in objects:
+            path = os.path.join(local_dir, os.path.basename(obj.name))
+            files.append(path)
+            if self._up_to_date(obj, path, index.get(os.path.basename(path)), entries):
+                skipped += 1
+            else:
+                todo.append((obj, path))
+        return local_dir, todo, files, skipped, entries
+
+    def _up_to_date(self, obj: RemoteObject, path: str, entry: dict, entries: dict) -> bool:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+        if stat.st_size != obj.size:
+            return False
+        if (entry and entry["object"] == obj.name and entry["generation"] == obj.generation
+                and entry["mtime_ns"] == stat.st_mtime_ns):
+            return True
+        # Present but not (or no longer) indexed: compare contents
+        kind = _checksum_kind(obj)
+        if kind is None or file_checksum(path, kind) != getattr(obj, kind):
+            return False
+        entries[os.path.basename(path)] = _index_entry(obj, path)
+        return True
+
+    # ── transfer ────────────────────────────────────────────────────────────
+    def _download(self, obj: RemoteObject, path: str) -> list:
+        """Queue the transfer of `obj`; returns futures that yield bytes transferred."""
+        if obj.size <= self.parallel_threshold:
+            return [self._pool.submit(self._download_whole, obj, path)]
+
+        part_path = path + ".part"
+        state_path = part_path + ".json"
+        state = _load_json(state_path)
+        if (state.get("object") != obj.name or state.get("generation") != obj.generation
+                or state.get("chunk_size") != self.chunk_size or not os.path.exists(part_path)):
+            state = {"object": obj.name, "generation": obj.generation,
+                     "chunk_size": self.chunk_size, "done": []}
+            with open(part_path, "wb") as f:
+                f.truncate(obj.size)
+            _dump_json(state, state_path)
+        elif state["done"]:
+            self.logger.info(f"Resuming {self.bucket.uri(obj.name)}: "
+                             f"{len(state['done'])} ranges already downloaded")
+        done = set(state["done"])
+        lock = threading.Lock()
+        n_ranges = -(-obj.size // self.chunk_size)
+        return [self._pool.submit(self._download_range, obj, part_path, state, state_path, lock, i)
+                for i in range(n_ranges) if i not in done]
+
+    def _download_whole(self, obj: RemoteObject, path: str) -> int:
+        tmp_path = path + ".tmp"
+        self.bucket.download(obj, tmp_path)
+        try:
+            _verify(obj, tmp_path)
+        except IOError:
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+        return obj.size
+
+    def _download_range(self, obj, part_path, state, state_path, lock, i) -> int:
+        start = i * self.chunk_size
+        end = min(start + self.chunk_size, obj.size)
+        data = self.bucket.read_range(obj, start, end)
+        if len(data) != end - start:
+            raise IOError(f"range {start}-{end} returned {len(data)} bytes")
+        fd = os.open(part_path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, start)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        with lock:
+            state["done"].append(i)
+            _dump_json(state, state_path)
+        return len(data)
+
+    def _finish(self, obj: RemoteObject, path: str):
+        """Verify an assembled ranged download and move it into place (whole downloads already are)."""
+        part_path = path + ".part"
+        if obj.size > self.parallel_threshold:
+            try:
+                _verify(obj, part_path)
+            except IOError:
+                os.remove(part_path)
+                os.remove(part_path + ".json")
+                raise
+            os.replace(part_path, path)
+            os.remove(part_path + ".json")
+        else:
+            for leftover in (part_path, part_path + ".json"):  # from an earlier, larger generation
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        self.logger.info(f"Downloaded {self.bucket.uri(obj.name)} -> {path}")
+
+    def _flush_index(self, local_dir: str, entries: dict):
+        """Merge `entries` into local_dir's index file (re-read, so concurrent syncs keep theirs) and clear them."""
+        if not entries:
+            return
+        with self._index_lock(local_dir):
+            index_path = os.path.join(local_dir, INDEX_NAME)
+            index = _load_json(index_path)
+            index.update(entries)
+            _dump_json(index, index_path)
+        entries.clear()
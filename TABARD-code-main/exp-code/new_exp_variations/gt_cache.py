@@ -0,0 +1,374 @@
+# ── gt_cache.py ─────────────────────────────────────────────────────────────
+
+import os
+import json
+import hashlib
+import typing
+import numpy as np
+
+from src.scoring import YES, NO, OTHER, encode_table, table_columns
+from src.labels import label_planes, planes_to_codes, yes_no_name
+from src.chunk_store import ChunkPack, is_pack
+from src.columnar import MASK_MARKERS, is_partition, partition_mask, read_anomaly_masks, split_partition
+
+# Where cached folds live. One sub-directory per ground-truth directory,
+# named after a hash of its absolute path.
+GT_CACHE_ROOT = os.environ.get(
+    "TABARD_GT_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "tabard-gt"),
+)
+CACHE_VERSION = 2
+
+# Temporary code for keys that are absent from a row (only used while encoding)
+_ABSENT = -2
+
+# Bit planes stored per cell
+_PRESENT, _YES, _NO = 0, 1, 2
+
+
+class GTTable(typing.NamedTuple):
+    """
+    One ground-truth yes/no table decoded from the cache.
+
+    codes   : int8 (rows, cols) matrix of YES / NO / OTHER (absent keys are OTHER)
+    present : bool (rows, cols) matrix, True where the row actually has the key
+    """
+    columns: list
+    codes: np.ndarray
+    present: np.ndarray
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def align(self, pred_rows: list):
+        """Return aligned (gt_codes, pred_codes), like scoring.align_tables."""
+        n_rows = min(len(self.codes), len(pred_rows))
+        pred_codes = encode_table(pred_rows[:n_rows], self.columns, missing=NO)
+        return self.codes[:n_rows], pred_codes
+
+    def prediction_rows(self, anomalies: list) -> list:
+        """
+        Build a prediction table shaped like this one: every key "No",
+        then "Yes" for each (row_idx, field) in anomalies that exists.
+        """
+        rows = [
+            {col: "No" for col, has in zip(self.columns, mask) if has}
+            for mask in self.present.tolist()
+        ]
+        for row_idx, field in anomalies:
+            if 0 <= row_idx < len(rows) and field in rows[row_idx]:
+                rows[row_idx][field] = "Yes"
+        return rows
+
+    def valid_cells(self, anomalies: list) -> list:
+        """
+        The (row_idx, field) pairs of anomalies that exist in this table,
+        sorted and de-duplicated: the cells prediction_rows would set to "Yes".
+        """
+        index = {col: j for j, col in enumerate(self.columns)}
+        n_rows = len(self.codes)
+        return sorted({
+            (row_idx, field) for row_idx, field in anomalies
+            if 0 <= row_idx < n_rows and field in index and self.present[row_idx, index[field]]
+        })
+
+    def align_sparse(self, cells: list):
+        """
+        Return aligned (gt_codes, pred_codes) for a sparse prediction: every
+        cell "No" except the (row_idx, field) cells, which are "Yes".
+        Scores the same as align(self.prediction_rows(cells)).
+        """
+        pred_codes = np.full(self.codes.shape, NO, dtype=np.int8)
+        index = {col: j for j, col in enumerate(self.columns)}
+        n_rows = len(self.codes)
+        for row_idx, field in cells:
+            j = index.get(field)
+            if j is not None and 0 <= row_idx < n_rows:
+                pred_codes[row_idx, j] = YES
+        return self.codes, pred_codes
+
+
+# ─── HELPERS ─────────────────────────────────────────────────────────────────
+def _cache_dir(gt_dir: str, from_markers: bool) -> str:
+    source = os.path.abspath(gt_dir) + ("#markers" if from_markers else "")
+    key = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(GT_CACHE_ROOT, key)
+
+
+def _encode_planes(rows: list):
+    """Return (columns, uint8 (3, rows*cols) bit-plane matrix) for one table."""
+    columns = table_columns(rows)
+    codes = encode_table(rows, columns, missing=_ABSENT).ravel()
+    planes = np.stack([codes != _ABSENT, codes == YES, codes == NO])
+    return columns, planes.astype(np.uint8)
+
+
+def _marker_planes(rows: list):
+    """Same as _encode_planes, but for a perturbed table labelled by its "@@@_" markers."""
+    columns, present, marked = label_planes(rows)
+    present, marked = present.ravel(), marked.ravel()
+    return columns, np.stack([present, marked, present & ~marked]).astype(np.uint8)
+
+
+def _atomic_write(path: str, write):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+class GTCache:
+    """
+    Read-only view over one cached ground-truth directory.
+
+    Behaves like a dict of {filename: GTTable}; tables are decoded lazily from
+    a memory-mapped array of bit-packed planes, so opening a fold is cheap.
+    Tables built from "@@@_" markers are keyed by their yes/no filename.
+    """
+
+    def __init__(self, gt_dir: str, index: dict, data: np.ndarray):
+        self.gt_dir = gt_dir
+        self._files = {entry["name"]: entry for entry in index["files"].values()}
+        self._column_sets = index["column_sets"]
+        self._data = data
+
+    def __len__(self):
+        return len(self._files)
+
+    def __contains__(self, filename):
+        return filename in self._files
+
+    def __iter__(self):
+        return iter(self._files)
+
+    def keys(self):
+        return self._files.keys()
+
+    def get(self, filename: str, default=None):
+        entry = self._files.get(filename)
+        if entry is None:
+            return default
+        n_rows, n_cols = entry["rows"], entry["cols"]
+        n_cells = n_rows * n_cols
+        start = entry["offset"]
+        packed = self._data[:, start:start + (n_cells + 7) // 8]
+        bits = np.unpackbits(packed, axis=1, count=n_cells).astype(bool)
+        present = bits[_PRESENT].reshape(n_rows, n_cols)
+        codes = np.full(n_cells, OTHER, dtype=np.int8)
+        codes[bits[_YES]] = YES
+        codes[bits[_NO]] = NO
+        return GTTable(self._column_sets[entry["columns"]], codes.reshape(n_rows, n_cols), present)
+
+    def __getitem__(self, filename: str) -> GTTable:
+        table = self.get(filename)
+        if table is None:
+            raise KeyError(filename)
+        return table
+
+    def items(self):
+        for filename in self._files:
+            yield filename, self.get(filename)
+
+
+# ─── BUILD / LOAD ────────────────────────────────────────────────────────────
+def _read_cache(cache_dir: str):
+    try:
+        with open(os.path.join(cache_dir, "index.json"), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != CACHE_VERSION:
+            return None, None
+        data = np.load(os.path.join(cache_dir, index["data"]), mmap_mode="r")
+        return index, data
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+
+def _build(gt_dir: str, cache_dir: str, index: dict, data, from_markers: bool = False):
+    """
+    Bring the cache for `gt_dir` up to date and return (index, data).
+
+    With `from_markers`, `gt_dir` holds perturbed tables and the labels are
+    derived from their "@@@_" markers instead of being read from
+    materialized yes/no JSON files; a directory with no markers at all is
+    an error (ValueError).
+
+    A file is reused without parsing when its size and mtime are unchanged,
+    or when its content hash still matches (e.g. after a copy or checkout).
+    Only new or modified files are parsed. Nothing is written if the
+    directory is unchanged.
+
+    `gt_dir` may also be a chunk pack; its chunks are listed under their
+    chunk filenames with the pack's mtime, so rewriting the pack only
+    re-parses the chunks whose bytes changed.
+    """
+    old_files = index["files"] if index else {}
+    old_sets = index["column_sets"] if index else []
+
+    pack = ChunkPack(gt_dir) if is_pack(gt_dir) else None
+    stats = {}  # filename -> (size, mtime_ns)
+    if pack is not None:
+        for filename in pack.names():
+            stats[filename] = (pack.size_of(filename), pack.mtime_ns)
+    else:
+        for filename in sorted(os.listdir(gt_dir)):
+            if filename.endswith(".json"):
+                st = os.stat(os.path.join(gt_dir, filename))
+                stats[filename] = (st.st_size, st.st_mtime_ns)
+
+    changed = set(old_files) != set(stats)
+    entries, chunks, column_sets, set_ids = {}, [], [], {}
+    names = {}  # GT key -> filename it came from
+    any_marked = False
+    offset = 0
+    for filename, (size, mtime_ns) in stats.items():
+        old = old_files.get(filename)
+        stat_match = old is not None and old["size"] == size and old["mtime_ns"] == mtime_ns
+
+        if stat_match:
+            digest = old["sha1"]
+        elif pack is not None:
+            raw = pack.read_bytes(*pack.key_of(filename))
+            digest = hashlib.sha1(raw).hexdigest()
+        else:
+            with open(os.path.join(gt_dir, filename), "rb") as f:
+                raw = f.read()
+            digest = hashlib.sha1(raw).hexdigest()
+
+        if old is not None and old["sha1"] == digest:
+            columns = old_sets[old["columns"]]
+            n_cells = old["rows"] * old["cols"]
+            planes = np.asarray(data[:, old["offset"]:old["offset"] + (n_cells + 7) // 8])
+            n_rows, n_cols = old["rows"], old["cols"]
+        else:
+            try:
+                rows = json.loads(raw)
+                if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                    raise ValueError("expected a list of row objects")
+            except ValueError as e:
+                print(f"[ERROR] Reading GT file {os.path.join(gt_dir, filename)}: {e}")
+                changed = True
+                continue
+            columns, bits = _marker_planes(rows) if from_markers else _encode_planes(rows)
+            n_rows = len(rows)
+            planes = np.packbits(bits, axis=1)
+            n_cols = len(columns)
+
+        name = yes_no_name(filename) if from_markers else filename
+        if name in names:
+            raise ValueError(f"{names[name]} and {filename} in {gt_dir} both map to GT table {name}")
+        names[name] = filename
+
+        changed = changed or not stat_match
+        any_marked = any_marked or bool(planes[_YES].any())
+        key = tuple(columns)
+        if key not in set_ids:
+            set_ids[key] = len(column_sets)
+            column_sets.append(columns)
+
+        entries[filename] = {
+            "name": name,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "sha1": digest,
+            "rows": n_rows,
+            "cols": n_cols,
+            "columns": set_ids[key],
+            "offset": offset,
+        }
+        chunks.append(planes)
+        offset += planes.shape[1]
+
+    if pack is not None:
+        pack.close()
+    if from_markers and entries and not any_marked:
+        # Single chunks may be clean, but a whole fold without markers means the
+        # "@@@_" prefixes were never written (e.g. preprocessing_yes_no_value_anomaly.py
+        # was not run before merging): every cell would silently score as "No"
+        raise ValueError(f"No '@@@_' markers in any table of {gt_dir}; "
+                         f"score against the materialized yes/no files instead (from_markers=False)")
+    if index and not changed:
+        return index, data
+
+    packed = np.concatenate(chunks, axis=1) if chunks else np.zeros((3, 0), dtype=np.uint8)
+    token = hashlib.sha1("".join(e["sha1"] for e in entries.values()).encode("utf-8")).hexdigest()[:16]
+    new_index = {
+        "version": CACHE_VERSION,
+        "gt_dir": os.path.abspath(gt_dir),
+        "from_markers": from_markers,
+        "data": f"planes-{token}.npy",
+        "column_sets": column_sets,
+        "files": entries,
+    }
+
+    os.makedirs(cache_dir, exist_ok=True)
+    _atomic_write(os.path.join(cache_dir, new_index["data"]), lambda f: np.save(f, packed))
+    _atomic_write(
+        os.path.join(cache_dir, "index.json"),
+        lambda f: f.write(json.dumps(new_index).encode("utf-8")),
+    )
+
+    # Drop stale plane files; another process may still have one mapped
+    for name in os.listdir(cache_dir):
+        if name.startswith("planes-") and name != new_index["data"]:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+    return new_index, np.load(os.path.join(cache_dir, new_index["data"]), mmap_mode="r")
+
+
+def _load_partition(partition_dir: str) -> dict:
+    """
+    {filename: GTTable} for one category partition of a Parquet fold dataset
+    (see src/columnar.py), built from its key and anomaly columns only; cell
+    values are never read, so a yes/no cell that is neither "Yes" nor "No"
+    counts as "No". Tables of a "markers" partition are keyed by their yes/no
+    filename, as with `from_markers`.
+    """
+    dataset_dir, category = split_partition(partition_dir)
+    from_markers = partition_mask(dataset_dir, category) == MASK_MARKERS
+    tables = {}
+    for table_id, (columns, present, anomaly) in read_anomaly_masks(dataset_dir, category).items():
+        filename = f"{table_id}.json"
+        name = yes_no_name(filename) if from_markers else filename
+        if name in tables:
+            raise ValueError(f"Two tables of {partition_dir} map to GT table {name}")
+        tables[name] = GTTable(columns, planes_to_codes(present, anomaly), present)
+    return tables
+
+
+_OPEN = {}
+
+
+def load_gt_dir(gt_dir: str, from_markers: bool = False) -> GTCache:
+    """
+    Return the cached view of every *.json yes/no table in `gt_dir` (a folder or a chunk pack),
+    building or refreshing the on-disk cache first if needed.
+    With `from_markers`, `gt_dir` is a folder of perturbed tables (e.g.
+    Merged/ or Merged-chunked/Merged/) and no yes/no files are needed.
+    `gt_dir` may also be a category partition of a Parquet fold dataset
+    (<dataset_dir>/category=<name>); its labels are read straight from the
+    anomaly column and its mask decides `from_markers`.
+    The result is memoised per process.
+    """
+    key = (os.path.abspath(gt_dir), from_markers)
+    if key in _OPEN:
+        return _OPEN[key]
+    if is_partition(gt_dir):
+        _OPEN[key] = _load_partition(gt_dir)
+        return _OPEN[key]
+    cache_dir = _cache_dir(gt_dir, from_markers)
+    index, data = _read_cache(cache_dir)
+    index, data = _build(gt_dir, cache_dir, index, data, from_markers)
+    _OPEN[key] = GTCache(gt_dir, index, data)
+    return _OPEN[key]
+
+
+def load_gt_table(gt_path: str, from_markers: bool = False) -> GTTable:
+    """
+    Return the cached GTTable for one file, or None if it is not a readable GT table.
+    With `from_markers`, `gt_path` is the yes/no filename inside a perturbed-table folder.
+    """
+    gt_dir, filename = os.path.split(gt_path)
+    return load_gt_dir(gt_dir or ".", from_markers).get(filename)
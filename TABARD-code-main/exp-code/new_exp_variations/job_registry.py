@@ -0,0 +1,130 @@
+# ── job_registry.py ─────────────────────────────────────────────────────────
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import typing
+
+# Local record of every batch job the experiment runner submits, so a
+# restarted driver reattaches to jobs that are still running and skips jobs
+# that already succeeded instead of submitting (and paying for) them again.
+#
+# One row per experiment key. A job is recorded as SUBMITTING before the
+# provider is called and as RUNNING with its provider job ids right after,
+# so a crash can at worst leave a SUBMITTING row; backends that can look a
+# job up by its metadata recover those as well (see experiment_matrix.py).
+# A row is reused only while the input fingerprint is unchanged; new input
+# means a new job.
+
+SUBMITTING, RUNNING, SUCCEEDED, FAILED = "submitting", "running", "succeeded", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key             TEXT PRIMARY KEY,
+    provider        TEXT NOT NULL,
+    input_sha256    TEXT NOT NULL,
+    job_ids         TEXT NOT NULL DEFAULT '[]',
+    state           TEXT NOT NULL,
+    provider_state  TEXT,
+    output_location TEXT,
+    error           TEXT,
+    submitted_at    REAL,
+    updated_at      REAL NOT NULL
+)
+"""
+
+
+class JobRecord(typing.NamedTuple):
+    key: str
+    provider: str
+    input_sha256: str
+    job_ids: list
+    state: str
+    provider_state: str
+    output_location: str
+    error: str
+    submitted_at: float
+    updated_at: float
+
+
+def sha256_files(paths: list) -> str:
+    """One digest over the contents of `paths`, in order (streamed, so large inputs stay out of memory)."""
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class JobRegistry:
+    """
+    SQLite-backed job registry. Use it from one thread (the runner's event
+    loop); several drivers may share the file, SQLite serializes writers.
+
+    Usage:
+        registry = JobRegistry("log/batch_jobs.sqlite")
+        run_matrix(experiments, backends, registry=registry)
+        print(registry.summary())
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+
+    def _row(self, row) -> JobRecord:
+        row = list(row)
+        row[3] = json.loads(row[3])
+        return JobRecord(*row)
+
+    def get(self, key: str) -> JobRecord:
+        row = self._db.execute(
+            "SELECT key, provider, input_sha256, job_ids, state, provider_state, output_location, "
+            "error, submitted_at, updated_at FROM jobs WHERE key = ?", (key,)).fetchone()
+        return self._row(row) if row else None
+
+    def records(self, state: str = None) -> list:
+        query = ("SELECT key, provider, input_sha256, job_ids, state, provider_state, output_location, "
+                 "error, submitted_at, updated_at FROM jobs")
+        rows = self._db.execute(query + " WHERE state = ? ORDER BY key", (state,)) if state \
+            else self._db.execute(query + " ORDER BY key")
+        return [self._row(row) for row in rows]
+
+    def begin(self, key: str, provider: str, input_sha256: str):
+        """Record that `key` is about to be submitted (replaces any earlier job for it)."""
+        now = time.time()
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (key, provider, input_sha256, job_ids, state, submitted_at, updated_at) "
+                "VALUES (?, ?, ?, '[]', ?, ?, ?)", (key, provider, input_sha256, SUBMITTING, now, now))
+
+    def submitted(self, key: str, job_ids: list):
+        self._update(key, state=RUNNING, job_ids=json.dumps(list(job_ids)))
+
+    def progress(self, key: str, provider_state: str):
+        self._update(key, provider_state=provider_state)
+
+    def finished(self, key: str, state: str, output_location: str = None, error: str = None):
+        self._update(key, state=state, output_location=output_location, error=error)
+
+    def _update(self, key: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._db:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE key = ?", (*fields.values(), key))
+
+    def summary(self) -> str:
+        counts = dict(self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+        parts = [f"{counts.get(state, 0)} {state}" for state in (RUNNING, SUBMITTING, SUCCEEDED, FAILED)]
+        return f"Job registry {self.path}: " + ", ".join(parts)
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,71 @@
+# ── labels.py ───────────────────────────────────────────────────────────────
+
+import re
+import numpy as np
+
+from src.scoring import YES, NO, OTHER, table_columns
+
+# Yes/no labels of a perturbed table, derived from its "@@@_" markers. The GT
+# cache (src/gt_cache.py, from_markers=True) stores them as bit-packed planes,
+# so scoring and postprocessing need no materialized yes/no files.
+
+# Perturbed cells are written as "@@@_<value>" by the anomaly generators
+MARKER = "@@@_"
+
+# The "_updated" role suffix of a table id, before any chunk range and extension
+_UPDATED = re.compile(r"_updated((?:_chunk_\d+_\d+)?(?:\.json)?)$")
+
+
+# ─── DERIVING LABELS ─────────────────────────────────────────────────────────
+def yes_no_name(filename: str) -> str:
+    """
+    Map a perturbed table id / chunk filename to its yes/no name: only the
+    trailing "_updated" role suffix is replaced, so "a_updated_x_updated.json"
+    becomes "a_updated_x_yes_no.json", and names without it are unchanged.
+    """
+    return _UPDATED.sub(r"_yes_no\1", filename)
+
+
+def strip_markers(rows: list) -> list:
+    """Copy of `rows` with the "@@@_" prefix removed from every marked value."""
+    return [
+        {key: (value[len(MARKER):] if isinstance(value, str) and value.startswith(MARKER) else value)
+         for key, value in row.items()}
+        for row in rows
+    ]
+
+
+def yes_no_rows(rows: list) -> list:
+    """The {"col": "Yes"/"No"} rows create_yes_no writes for a perturbed table."""
+    return [
+        {key: "Yes" if isinstance(value, str) and value.startswith(MARKER) else "No"
+         for key, value in row.items()}
+        for row in rows
+    ]
+
+
+def label_planes(rows: list, columns: list = None):
+    """
+    Return (columns, present, marked) for a perturbed table, where `present`
+    and `marked` are bool (rows, cols) matrices: the row has the key, and the
+    value is a string starting with "@@@_".
+    """
+    if columns is None:
+        columns = table_columns(rows)
+    flat = [
+        (isinstance(row[col], str) and row[col].startswith(MARKER)) if col in row else None
+        for row in rows
+        for col in columns
+    ]
+    shape = (len(rows), len(columns))
+    present = np.fromiter((v is not None for v in flat), dtype=bool, count=len(flat)).reshape(shape)
+    marked = np.fromiter((v is True for v in flat), dtype=bool, count=len(flat)).reshape(shape)
+    return columns, present, marked
+
+
+def planes_to_codes(present: np.ndarray, marked: np.ndarray) -> np.ndarray:
+    """YES where marked, NO where present but unmarked, OTHER where the key is absent."""
+    codes = np.full(present.shape, OTHER, dtype=np.int8)
+    codes[present] = NO
+    codes[marked] = YES
+    return codes
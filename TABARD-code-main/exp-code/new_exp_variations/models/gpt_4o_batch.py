@@ -1,9 +1,8 @@
 from openai import OpenAI
-import time 
-from tqdm.auto import tqdm
 import logging
-import os
 from src.logger import setup_custom_logger
+from src.experiment_matrix import OpenAIBatchBackend, expand_matrix, run_matrix
+from src.job_registry import JobRegistry
 
 logger = setup_custom_logger(
     logfile_name="gpt4o_batch_prediction_job_merged.log",
@@ -18,60 +17,35 @@ logger.info("Started batch job")
 
 # folder = ['FetaQA-merged','Spider_Beaver-merged','wikiTQ-merged'] ## UnComment this out while running for Merged folder
 # List = ['l1_cot','l1_wcot','l2_cot','l2_wcot','l4_cot','l4_wcot','museve','sevcot'] ## UnComment this out while running for Merged folder
+# DIR = None ## UnComment this out while running for Merged folder
 
 DIR = ["variation_1","variation_2","variation_3"] ## UnComment this out while running for Variation folder
 folder = ["FetaQA", "Spider_Beaver", "WikiTQ"] ## UnComment this out while running for Variation folder
 List = ['museve','sevcot'] ## UnComment this out while running for Variation folder
-for dir in tqdm(DIR,desc="Processing DIR"): ## UnComment this out while running for Variation folder
-    for fold in tqdm(folder,desc="Processing Folder"):
-        for i in tqdm(List, desc="Processing batches"):
-            logger.info(f"Starting the batch prediction {fold}.")
-            # input_jsonl_path = f"..Batchfiles/gpt4o/{fold}/{i}/output.jsonl" ## UnComment this out while running for Merged folder
-            # output_jsonl_path = f"..predicitons/gpt4o/{fold}/{i}/predictions.jsonl" ## UnComment this out while running for Merged folder
 
-            input_jsonl_path = f"..Batchfiles/gpt4o/{dir}/{fold}/{i}/output.jsonl" ## UnComment this out while running for Variation folder
-            output_jsonl_path = f"..predicitons/gpt4o/{dir}/{fold}/{i}/predictions.jsonl" ## UnComment this out while running for Variation folder
-            
-            if not os.path.exists(output_jsonl_path):
-                try:
-                    logger.info(f"Starting batch for: {i}")
-                    batch_input_file = client.files.create(
-                        file=open(input_jsonl_path, "rb"),
-                        purpose="batch"
-                    )
-                    logger.info(f"Uploaded input file: {batch_input_file.id}")
-
-                    batch = client.batches.create(
-                        input_file_id=batch_input_file.id,
-                        endpoint="/v1/chat/completions",
-                        completion_window="24h",
-                        metadata={"description": f"{i} - anomaly-detection-batch-job"}
-                    )
-                    logger.info(f"Created batch: {batch.id}")
-
-                    def wait_for_batch(batch_id, interval=30):
-                        while True:
-                            b = client.batches.retrieve(batch_id)
-                            logger.info(f"Batch {batch_id} status: {b.status}")
-                            if b.status in ["completed", "failed", "cancelled", "expired"]:
-                                return b
-                            time.sleep(interval)
-
-                    batch = wait_for_batch(batch.id)
-
-                    if batch.status == "completed" and batch.output_file_id:
-                        result_file = client.files.content(batch.output_file_id)
-
-                        output_dir = os.path.dirname(output_jsonl_path)
-                        os.makedirs(output_dir, exist_ok=True)
-
-                        with open(output_jsonl_path, "w", encoding="utf-8") as f:
-                            f.write(result_file.text)
-                        logger.info(f"Batch output saved to {output_jsonl_path}")
-                    else:
-                        logger.warning(f"Batch {batch.id} finished with status: {batch.status}. No output saved.")
-
-                except Exception as e:
-                    logger.error(f"Error in processing {i}: {str(e)}")
-            else:
-                logger.info(f"Skiping the batch prediction for {fold}: {i}..........")
+# Jobs in flight at once; one shared poller checks each of them at most every
+# POLL_INTERVAL seconds, backing off adaptively up to MAX_POLL_INTERVAL
+MAX_IN_FLIGHT = 16
+POLL_INTERVAL = 30
+MAX_POLL_INTERVAL = 600
+
+# Record of submitted jobs: a rerun reattaches to running jobs and skips
+# succeeded ones instead of submitting them again
+REGISTRY_PATH = "log/gpt4o_batch_jobs.sqlite"
+
+# input_jsonl_path = "..Batchfiles/gpt4o/{fold}/{prompt}/output.jsonl" ## UnComment this out while running for Merged folder
+# output_jsonl_path = "..predicitons/gpt4o/{fold}/{prompt}/predictions.jsonl" ## UnComment this out while running for Merged folder
+input_jsonl_path = "..Batchfiles/gpt4o/{variation}/{fold}/{prompt}/output.jsonl" ## UnComment this out while running for Variation folder
+output_jsonl_path = "..predicitons/gpt4o/{variation}/{fold}/{prompt}/predictions.jsonl" ## UnComment this out while running for Variation folder
+
+# Called with (experiment, predictions path) as soon as a job's output is saved,
+# e.g. to run postprocess/gpt4o/merge_jsonl_prediction.postprocess_fold_batch on it
+ON_COMPLETE = None
+
+backends = {"gpt-4o": OpenAIBatchBackend(client, input_jsonl_path, output_jsonl_path)}
+experiments = expand_matrix(["gpt-4o"], List, folder, variations=DIR)
+logger.info(f"Running {len(experiments)} experiments, up to {MAX_IN_FLIGHT} at a time")
+registry = JobRegistry(REGISTRY_PATH)
+run_matrix(experiments, backends, max_in_flight=MAX_IN_FLIGHT, poll_interval=POLL_INTERVAL,
+           max_poll_interval=MAX_POLL_INTERVAL,
+           on_complete=ON_COMPLETE, logger=logger, registry=registry)
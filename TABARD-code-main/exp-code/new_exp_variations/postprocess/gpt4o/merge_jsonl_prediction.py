@@ -1,10 +1,11 @@
 import os
-import json
-import ast
-import re
 import logging
-from collections import defaultdict
 from tqdm.auto import tqdm
+from src.gt_cache import load_gt_dir
+from src.chunk_store import is_pack, resolve_chunk_source
+from src.response_parser import ParseStats, iter_predictions
+from src.chunk_ids import GTIndex
+from src.sparse_predictions import KIND_TABLES, SparsePredictions, sparse_path
 
 # ─── LOGGER SETUP ───────────────────────────────────────────────────────────
 logger = logging.getLogger(__name__)
@@ -20,67 +21,12 @@ logger.addHandler(handler)
 GROUNDTRUTH_ROOT = r"..dataset"
 GPT_OUTPUT_ROOT = r"gpt-output"
 
-# ─── HELPERS ─────────────────────────────────────────────────────────────────
-def extract_base_and_range(filename: str):
-    m = re.match(r"(.+)_chunk_(\d+)_(\d+)\.json", filename)
-    if m:
-        return m.group(1), int(m.group(2))
-    return None, None
-
-
-def merge_chunks_in_folder(folder_path: str, output_folder: str):
-    for root, _, files in os.walk(folder_path):
-        grouped = defaultdict(list)
-        for fname in files:
-            if fname.endswith(".json") and "_chunk_" in fname:
-                base, start = extract_base_and_range(fname)
-                if base is not None:
-                    full = os.path.join(root, fname)
-                    grouped[(base, root)].append((start, full))
-
-        for (base, subdir), chunks in grouped.items():
-            sorted_chunks = sorted(chunks, key=lambda x: x[0])
-            merged = []
-            for _, path in sorted_chunks:
-                with open(path, "r", encoding="utf-8") as f:
-                    merged.extend(json.load(f))
-
-            rel_sub = os.path.relpath(subdir, folder_path)
-            save_dir = os.path.join(output_folder, rel_sub)
-            os.makedirs(save_dir, exist_ok=True)
-
-            out_fname = f"{base}.json"
-            out_path = os.path.join(save_dir, out_fname)
-            with open(out_path, "w", encoding="utf-8") as outf:
-                json.dump(merged, outf, indent=4, ensure_ascii=False)
-            logger.info(f"Merged chunks into {out_path}")
-
-
-# ─── TRANSFORM SINGLE CHUNK ─────────────────────────────────────────────────
-def transform_file(gt_path: str, anomalies: list, output_path: str):
-    try:
-        with open(gt_path, "r", encoding="utf-8") as f:
-            gt_data = json.load(f)
-    except Exception as e:
-        logger.error(f"Reading GT file {gt_path}: {e}")
-        return
-
-    # Initialize all fields to "No"
-    for row in gt_data:
-        for key in row:
-            row[key] = "No"
-    # Apply predicted anomalies
-    for row_idx, field in anomalies:
-        if 0 <= row_idx < len(gt_data) and field in gt_data[row_idx]:
-            gt_data[row_idx][field] = "Yes"
-
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    try:
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(gt_data, f, indent=4)
-    except Exception as e:
-        logger.error(f"Saving prediction chunk {output_path}: {e}")
-
+# Ground-truth labels come from the materialized Merged-yes-no chunks. True derives
+# them from the "@@@_" markers of the perturbed chunks in Merged-chunked/Merged
+# instead, which only matches Merged-yes-no if preprocessing_yes_no_value_anomaly.py
+# ran before merging.
+GT_FROM_MARKERS = False
+GT_LABEL_DIR = "Merged" if GT_FROM_MARKERS else "Merged-yes-no"
 
 # ─── POSTPROCESS GPT PREDICTIONS ─────────────────────────────────────────────
 def postprocess_fold_batch(fold: str, batch: str):
@@ -94,81 +40,43 @@ def postprocess_fold_batch(fold: str, batch: str):
         GROUNDTRUTH_ROOT,
         fold,
         "Merged-chunked",
-        "Merged-yes-no",
+        GT_LABEL_DIR,
         batch
     )
-    output_dir = os.path.join(
+    merged_dir = os.path.join(
         GPT_OUTPUT_ROOT,
-        f"gpt-prediction-chunks/{fold}/{batch}"
+        f"gpt-prediction-merged/{fold}/{batch}/predicted-chunked/predicted-yes-no"
     )
-    os.makedirs(output_dir, exist_ok=True)
-
-    prediction_dict = {}
-    if os.path.isfile(llama_jsonl):
-        with open(llama_jsonl, "r", encoding="utf-8") as f:
-            for idx, line in enumerate(f, start=1):
-                try:
-                    data = json.loads(line)
-                    # Extract base filename
-                    custom_id = data.get("custom_id", "")
-                    base_filename = os.path.basename(custom_id)
-
-                    # Normalize GT filename
-                    if base_filename.endswith("_updated.json_yes_no.json"):
-                        gt_filename = base_filename.replace("_updated.json_yes_no.json", "_yes_no.json")
-                    elif base_filename.endswith("_updated.json"):
-                        gt_filename = base_filename.replace("_updated.json", "_yes_no.json")
-                    elif "chunk" in base_filename:
-                        gt_filename = base_filename.replace("_updated_", "_yes_no_")
-                        if gt_filename.endswith(".json_yes_no.json"):
-                            gt_filename = gt_filename.replace(".json_yes_no.json", ".json")
-                    else:
-                        gt_filename = base_filename.replace(".json", "_yes_no.json")
-
-                    # Extract response text
-                    gpt_resp = (
-                        data.get("response", {})
-                        .get("body", {})
-                        .get("choices", [])[0]
-                        .get("message", {})
-                        .get("content", "")
-                    )
-
-                    # Parse anomalies
-                    # Try tuple pattern
-                    matches = re.findall(r"\(\s*(\d+)\s*,\s*['\"](.+?)['\"]\s*\)", gpt_resp)
-                    if matches:
-                        anomalies = [(int(i), label.strip()) for i, label in matches]
-                        prediction_dict[gt_filename] = anomalies
-                    else:
-                        # Fallback to list literal
-                        m = re.search(r"\[.*\]", gpt_resp, re.DOTALL)
-                        if m:
-                            try:
-                                lst = ast.literal_eval(m.group())
-                                anomalies = [(int(i), str(label).strip()) for i, label in lst]
-                                prediction_dict[gt_filename] = anomalies
-                            except Exception as e:
-                                logger.error(f"Parsing list on line {idx}: {e}")
-                        else:
-                            logger.warning(f"Unrecognized format in line {idx}: {gpt_resp}")
-                except Exception as e:
-                    logger.error(f"Error processing line {idx} of {llama_jsonl}: {e}")
-    else:
+    if not os.path.isfile(llama_jsonl):
         logger.warning(f"No JSONL found at {llama_jsonl}")
         return
-
-    # Apply to each GT chunk
-    if os.path.isdir(gt_dir):
-        for gt_fname in os.listdir(gt_dir):
-            if not gt_fname.endswith(".json"):
-                continue
-            gt_path = os.path.join(gt_dir, gt_fname)
-            out_path = os.path.join(output_dir, gt_fname)
-            anomalies = prediction_dict.get(gt_fname, [])
-            transform_file(gt_path, anomalies, out_path)
-    else:
+    gt_dir = resolve_chunk_source(gt_dir)
+    if not (os.path.isdir(gt_dir) or is_pack(gt_dir)):
         logger.warning(f"GT directory not found: {gt_dir}")
+        return
+    gt_tables = load_gt_dir(gt_dir, GT_FROM_MARKERS)
+    gt_index = GTIndex(gt_tables.keys(), batch)  # canonical ids of another batch never match
+
+    # One pass: each response's cells are shifted by its chunk's start row and
+    # added to its table, so the merged predictions come straight out of the parse
+    preds = SparsePredictions(KIND_TABLES)
+    predicted, n_unmatched = set(), 0
+    stats = ParseStats()
+    for gt_fname, anomalies in iter_predictions(llama_jsonl, key=gt_index.lookup, stats=stats, logger=logger):
+        if gt_fname is None:
+            n_unmatched += 1
+            continue
+        preds.add_chunk(gt_fname, gt_tables.get(gt_fname).valid_cells(anomalies))
+        predicted.add(gt_fname)
+    if n_unmatched:
+        logger.warning(f"{n_unmatched} responses in {llama_jsonl} match no GT chunk in {gt_dir}")
+
+    # GT chunks without a prediction: every field "No"
+    for gt_fname in gt_tables:
+        preds.add_chunk(gt_fname)
+    preds.save(sparse_path(merged_dir))
+    logger.info(f"{llama_jsonl}: {stats}; {len(predicted)}/{len(gt_tables)} GT chunks predicted, "
+                f"{preds.n_cells()} cells in {len(preds)} tables -> {sparse_path(merged_dir)}")
 
 
 # ─── CONFIGURATION ──────────────────────────────────────────────────────────
@@ -188,31 +96,7 @@ def main():
             postprocess_fold_batch(fold, batch)
             # postprocess_fold_batch(dir,fold, batch)
 
-    # Merge GPT-predicted chunks into full JSON per table
-    # for dir in tqdm(DIR, desc="Postprocessing DIR", unit="fold"):
-    for fold in tqdm(FOLDS, desc="Merging Fold Predictions"):
-        for batch in BATCHES:
-            # chunk_folder = os.path.join(
-            #     GPT_OUTPUT_ROOT,
-            #     f"gpt-prediction-chunks/{dir}/{fold}/{batch}/predicted-chunked/predicted-yes-no"
-            # )
-            # merged_folder = os.path.join(
-            #     GPT_OUTPUT_ROOT,
-            #     f"gpt-prediction-merged/{dir}/{fold}/{batch}/predicted-chunked/predicted-yes-no"
-            # )
-
-            chunk_folder = os.path.join(
-                GPT_OUTPUT_ROOT,
-                f"gpt-prediction-chunks/{fold}/{batch}/predicted-chunked/predicted-yes-no"
-            )
-            merged_folder = os.path.join(
-                GPT_OUTPUT_ROOT,
-                f"gpt-prediction-merged/{fold}/{batch}/predicted-chunked/predicted-yes-no"
-            )
-            if os.path.isdir(chunk_folder):
-                merge_chunks_in_folder(chunk_folder, merged_folder)
-
-    logger.info("GPT postprocessing and merge completed.")
+    logger.info("GPT postprocessing completed.")
 
 if __name__ == "__main__":
     main()
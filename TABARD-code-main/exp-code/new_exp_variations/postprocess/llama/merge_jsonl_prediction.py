@@ -1,13 +1,14 @@
 # ── main_full_pipeline.py ────────────────────────────────────────────────────
 
 import os
-import json
-import re
 import logging
-from collections import defaultdict
 from tqdm.auto import tqdm
-import ast
 from src.logger import setup_custom_logger
+from src.gt_cache import load_gt_dir
+from src.chunk_store import is_pack, resolve_chunk_source
+from src.response_parser import ParseStats, iter_predictions
+from src.chunk_ids import GTIndex
+from src.sparse_predictions import KIND_TABLES, SparsePredictions, sparse_path
 
 # ─── LOGGER SETUP ───────────────────────────────────────────────────────────
 logger = setup_custom_logger(
@@ -29,191 +30,76 @@ BATCHS = ['l1_cot','l1_wcot','l2_cot','l2_wcot','l4_cot','l4_wcot','museve','sev
 GROUNDTRUTH_ROOT = r"dataset"  # contains <batch> subfolders
 LLAMA_OUTPUT_ROOT = r"predicitons\llama"             # contains output_folder-<fold>/<batch>.jsonl
 
-# ─── HELPERS ─────────────────────────────────────────────────────────────────
-
-def extract_base_and_range(filename: str):
-    """
-    From a filename like "tableA_yes_no_chunk_0_30.json", returns ("tableA_yes_no", 0).
-    """
-    m = re.match(r"(.+)_chunk_(\d+)_(\d+)\.json", filename)
-    if m:
-        return m.group(1), int(m.group(2))
-    return None, None
-
-
-def merge_chunks_in_folder(folder_path: str, output_folder: str):
-    """
-    Merge all chunked JSONs under `folder_path` into single JSONs under `output_folder`.
-    Chunk filenames look like <base>_chunk_<start>_<end>.json (e.g. tableA_yes_no_chunk_0_30.json).
-    The merged output is <base>.json (e.g. tableA_yes_no.json).
-    """
-    for root, _, files in os.walk(folder_path):
-        grouped = defaultdict(list)
-        for fname in files:
-            if fname.endswith(".json") and "_chunk_" in fname:
-                base, start = extract_base_and_range(fname)
-                if base is not None:
-                    full = os.path.join(root, fname)
-                    grouped[(base, root)].append((start, full))
-
-        for (base, subdir), chunks in grouped.items():
-            sorted_chunks = sorted(chunks, key=lambda x: x[0])
-            merged = []
-            for _, path in sorted_chunks:
-                with open(path, "r", encoding="utf-8") as f:
-                    merged.extend(json.load(f))
-
-            # Determine relative subdirectory under folder_path
-            rel_sub = os.path.relpath(subdir, folder_path)
-            save_dir = os.path.join(output_folder, rel_sub)
-            os.makedirs(save_dir, exist_ok=True)
-
-            out_fname = f"{base}.json"  # e.g. tableA_yes_no.json
-            out_path = os.path.join(save_dir, out_fname)
-            with open(out_path, "w", encoding="utf-8") as outf:
-                json.dump(merged, outf, indent=4, ensure_ascii=False)
-            logger.info(f"Merged chunks into {out_path}")
-
-
-def transform_file(gt_path: str, anomalies: list, output_path: str):
-    """
-    Read a ground-truth yes/no chunk (list of dicts). Set all fields to "No",
-    then set to "Yes" where anomalies indicate. Write result to output_path.
-    """
-    try:
-        with open(gt_path, "r", encoding="utf-8") as f:
-            gt_data = json.load(f)
-    except Exception as e:
-        logger.error(f"[ERROR] Reading GT file {gt_path}: {e}")
-        return
-
-    for row in gt_data:
-        for key in row:
-            row[key] = "No"
-    for row_idx, field in anomalies:
-        if 0 <= row_idx < len(gt_data) and field in gt_data[row_idx]:
-            gt_data[row_idx][field] = "Yes"
-
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    try:
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(gt_data, f, indent=4)
-    except Exception as e:
-        logger.error(f"[ERROR] Saving prediction chunk {output_path}: {e}")
+# Ground-truth labels come from the materialized Merged-yes-no chunks. True derives
+# them from the "@@@_" markers of the perturbed chunks in Merged-chunked/Merged
+# instead, which only matches Merged-yes-no if preprocessing_yes_no_value_anomaly.py
+# ran before merging.
+GT_FROM_MARKERS = False
+GT_LABEL_DIR = "Merged" if GT_FROM_MARKERS else "Merged-yes-no"
 
+# ─── POSTPROCESS PREDICTIONS ─────────────────────────────────────────────────
 
 def postprocess_fold_batch(dir,fold: str, batch: str):
     """
-    1) Read predictions/<fold>/<batch>/prediction.jsonl, build mapping
-       of ground-truth chunk filename → anomalies list.
-    2) For each ground-truth chunk in
-         <fold>/Merged-chunked/Merged-yes-no/<batch>/,
-       apply anomalies and write predicted chunk to
-         gemini-prediction-chunks/prediction-<fold>/<batch>/<gt_filename>.
+    1) Stream predictions/<fold>/<batch>/prediction.jsonl; for each response,
+       keep the anomalies that exist in the matching ground-truth chunk in
+         <fold>/Merged-chunked/Merged-yes-no/<batch>/
+    2) Record every ground-truth chunk without a prediction as all "No".
+    3) Shift each chunk's cells by its start row onto its table and save the
+       merged predictions as one sparse file, <merged_dir>.sparse.json
+       (see src/sparse_predictions.py); no chunk files or merge step.
     """
     # gemini_jsonl = os.path.join(LLAMA_OUTPUT_ROOT,f"{dir}" ,f"{fold}", f"{batch}","000000000000.jsonl")
-    # output_dir   = os.path.join(LLAMA_OUTPUT_ROOT,f"{dir}" ,f"{fold}", f"{batch}","predicted-chunked", "predicted-yes-no")
-    # gt_dir       = os.path.join(GROUNDTRUTH_ROOT,dir,fold, "Merged-chunked", "Merged-yes-no")
+    # merged_dir   = os.path.join(LLAMA_OUTPUT_ROOT,f"{dir}" ,f"{fold}", f"{batch}","predicted-merged", "predicted-yes-no")
+    # gt_dir       = os.path.join(GROUNDTRUTH_ROOT,dir,fold, "Merged-chunked", GT_LABEL_DIR)
 
     # Paths
     gemini_jsonl = os.path.join(LLAMA_OUTPUT_ROOT, f"{fold}", f"{batch}","000000000000.jsonl")
-    output_dir   = os.path.join(LLAMA_OUTPUT_ROOT, f"{fold}", f"{batch}","predicted-chunked", "predicted-yes-no")
-    gt_dir       = os.path.join(GROUNDTRUTH_ROOT,fold, "Merged-chunked", "Merged-yes-no")
-
-    os.makedirs(output_dir, exist_ok=True)
-
-    prediction_dict = {}
-    if os.path.isfile(gemini_jsonl):
-        with open(gemini_jsonl, "r", encoding="utf-8") as f:
-            for idx, line in enumerate(f, start=1):
-                try:
-                    data = json.loads(line)
-                    gemini_id = data.get("custom_id", "")
-                    
-
-                    gt_fname = gemini_id.replace("_updated_","_yes_no_")+ ".json"
-                    text = data.get("response", {}).get("choices", [])[0].get("message", {}).get("content", "")
-                    
-
-                    tuple_matches = re.findall(
-                        r'\(\s*(\d+)\s*,\s*[\'"](.+?)[\'"]\s*\)', 
-                        text
-                    )
-
-                    if tuple_matches:
-                        # Convert to list of (int, str) tuples
-                        anomalies = [(int(idx), str(label).strip()) for idx, label in tuple_matches]
-                        prediction_dict[gt_fname] = anomalies
-                    elif not tuple_matches:
-                        try:
-                            tuple_pattern = r'\(\s*(\d+)\s*,\s*[\'"](.+?)[\'"]\s*\)'
-                            matches = re.findall(tuple_pattern, text)
-                            
-                            anomalies = []
-                            for idx, label in matches:
-                                try:
-                                    anomalies.append((int(idx), label.strip()))
-                                except Exception as e:
-                                    print(f"[WARN] Skipped malformed tuple: ({idx}, {label}) due to: {e}")
-                            prediction_dict[gt_fname] = anomalies
-                        except Exception as e:   
-                            print(f"[ERROR] Malformed or unrecognized response in line {idx}: {gemini_jsonl}")
-                        
-                    else:
-                        match = re.search(r"\[.*\]", text, re.DOTALL)
-                        if match:
-                            try:
-                                output_list = ast.literal_eval(match.group())
-                                anomalies = [(int(idx), str(label).strip()) for idx, label in output_list]
-                                prediction_dict[gt_fname] = anomalies
-                            except Exception as e:
-                                print(f"[ERROR] Failed to parse list in line {i}: {e}")
-                        
-
-                except json.JSONDecodeError as jde:
-                    logger.error(f"[ERROR] JSON decode on line {idx} of {gemini_jsonl}: {jde}")
-                except Exception as e:
-                    logger.error(f"[ERROR] Unexpected on line {idx} of {gemini_jsonl}: {e}")
-    else:
+    merged_dir   = os.path.join(LLAMA_OUTPUT_ROOT, f"{fold}", f"{batch}","predicted-merged", "predicted-yes-no")
+    gt_dir       = os.path.join(GROUNDTRUTH_ROOT,fold, "Merged-chunked", GT_LABEL_DIR)
+
+    if not os.path.isfile(gemini_jsonl):
         logger.warning(f"No JSONL found at {gemini_jsonl}, skipping {fold}/{batch}")
         return
-
-    # Apply to each GT chunk
-    if os.path.isdir(gt_dir):
-        for gt_fname in os.listdir(gt_dir):
-            if not gt_fname.endswith(".json"):
-                continue
-            gt_path     = os.path.join(gt_dir, gt_fname)
-            out_path    = os.path.join(output_dir, gt_fname)
-            anomalies   = prediction_dict.get(gt_fname, [])
-            transform_file(gt_path, anomalies, out_path)
-    else:
+    gt_dir = resolve_chunk_source(gt_dir)
+    if not (os.path.isdir(gt_dir) or is_pack(gt_dir)):
         logger.warning(f"GT directory not found: {gt_dir}")
+        return
+    gt_tables = load_gt_dir(gt_dir, GT_FROM_MARKERS)
+    gt_index = GTIndex(gt_tables.keys(), batch)  # canonical ids of another batch never match
+
+    # One pass: each response's cells are shifted by its chunk's start row and
+    # added to its table, so the merged predictions come straight out of the parse
+    preds = SparsePredictions(KIND_TABLES)
+    predicted, n_unmatched = set(), 0
+    stats = ParseStats()
+    for gt_fname, anomalies in iter_predictions(gemini_jsonl, key=gt_index.lookup, stats=stats, logger=logger):
+        if gt_fname is None:
+            n_unmatched += 1
+            continue
+        preds.add_chunk(gt_fname, gt_tables.get(gt_fname).valid_cells(anomalies))
+        predicted.add(gt_fname)
+    if n_unmatched:
+        logger.warning(f"{n_unmatched} responses in {gemini_jsonl} match no GT chunk in {gt_dir}")
+
+    # GT chunks without a prediction: every field "No"
+    for gt_fname in gt_tables:
+        preds.add_chunk(gt_fname)
+    preds.save(sparse_path(merged_dir))
+    logger.info(f"{gemini_jsonl}: {stats}; {len(predicted)}/{len(gt_tables)} GT chunks predicted, "
+                f"{preds.n_cells()} cells in {len(preds)} tables -> {sparse_path(merged_dir)}")
 
 
 # ─── MAIN WORKFLOW ──────────────────────────────────────────────────────────
 
 def main():
-    # Step 1: Postprocess predictions to get chunked “Yes/No” files
+    # Postprocess predictions straight into merged, per-table sparse files
     # for dir in tqdm(DIR, desc="Postprocessing DIR", unit="fold"):
     for fold in tqdm(FOLDS, desc="Postprocessing Folds", unit="fold"):
         for batch in tqdm(BATCHS, desc=f" Processing batches in '{fold}'", unit="batch"):
             postprocess_fold_batch(dir,fold, batch)
 
-    # Step 2: Merge chunked predictions into a single JSON per base table
-    # for dir in tqdm(DIR, desc="Postprocessing DIR", unit="fold"):
-    for fold in tqdm(FOLDS, desc="Merging Fold Predictions", unit="fold"):
-        for batch in BATCHS:
-            chunk_folder = os.path.join(LLAMA_OUTPUT_ROOT, f"{fold}", f"{batch}","predicted-chunked", "predicted-yes-no")
-            merged_folder = os.path.join(LLAMA_OUTPUT_ROOT, f"{fold}", f"{batch}","predicted-merged", "predicted-yes-no")
-
-            # chunk_folder = os.path.join(LLAMA_OUTPUT_ROOT,f"{dir}" ,f"{fold}", f"{batch}","predicted-chunked", "predicted-yes-no")
-            # merged_folder = os.path.join(LLAMA_OUTPUT_ROOT,f"{dir}" ,f"{fold}", f"{batch}","predicted-merged", "predicted-yes-no")
-            
-            if os.path.isdir(chunk_folder):
-                merge_chunks_in_folder(chunk_folder, merged_folder)
-
-    logger.info("All steps (postprocess + merge) completed.")
+    logger.info("Postprocessing completed.")
 
 
 if __name__ == "__main__":
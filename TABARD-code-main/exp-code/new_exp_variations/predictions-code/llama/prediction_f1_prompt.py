@@ -1,95 +1,5 @@
 import os
-import json
-import logging
-from tqdm.auto import tqdm
-
-
-def get_logger(log_path):
-    log_dir = os.path.dirname(log_path)
-    os.makedirs(log_dir, exist_ok=True)
-
-    logger = logging.getLogger(log_path)  # unique logger per file
-    logger.setLevel(logging.INFO)
-
-    # Prevent duplicate handlers if this logger is reused
-    if logger.hasHandlers():
-        logger.handlers.clear()
-
-    handler = logging.FileHandler(log_path, mode='w', encoding='utf-8')
-    formatter = logging.Formatter('%(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
-
-    return logger
-
-
-def compute_metrics(gt_items, pred_items):
-    tp = fp = fn = 0
-    for gt_row, pred_row in zip(gt_items, pred_items):
-        for key in gt_row:
-            gt_val = gt_row[key]
-            pred_val = pred_row.get(key, "No")
-            if gt_val == "Yes" and pred_val == "Yes":
-                tp += 1
-            elif gt_val == "No" and pred_val == "Yes":
-                fp += 1
-            elif gt_val == "Yes" and pred_val == "No":
-                fn += 1
-    return tp, fp, fn
-
-
-def evaluate_predictions(gt_dir, pred_dir, fold_name, batch_name, folder_logger):
-    total_tp = total_fp = total_fn = 0
-    folder_logger.info("Filename, TP, FP, FN, Precision, Recall, F1")
-    for filename in os.listdir(gt_dir):
-        if not filename.endswith(".json"):
-            continue
-
-        gt_path = os.path.join(gt_dir, filename)
-        pred_path = os.path.join(pred_dir, filename)
-
-        if not os.path.exists(pred_path):
-            folder_logger.warning(f"{filename} not found in predictions directory.")
-            continue
-
-        with open(gt_path, "r", encoding="utf-8") as f:
-            gt_data = json.load(f)
-        with open(pred_path, "r", encoding="utf-8") as f:
-            pred_data = json.load(f)
-
-        tp, fp, fn = compute_metrics(gt_data, pred_data)
-        precision = tp / (tp + fp) if (tp + fp) else 0.0
-        recall = tp / (tp + fn) if (tp + fn) else 0.0
-        f1 = (2 * precision * recall) / (precision + recall) if (precision + recall) else 0.0
-
-        total_tp += tp
-        total_fp += fp
-        total_fn += fn
-
-        folder_logger.info(f"{filename}, {tp}, {fp}, {fn}, {precision:.4f}, {recall:.4f}, {f1:.4f}")
-
-    overall_precision = total_tp / (total_tp + total_fp) if (total_tp + total_fp) else 0.0
-    overall_recall = total_tp / (total_tp + total_fn) if (total_tp + total_fn) else 0.0
-    overall_f1 = (2 * overall_precision * overall_recall) / (overall_precision + overall_recall) if (overall_precision + overall_recall) else 0.0
-
-    folder_logger.info("\n=== Overall Results ===")
-    folder_logger.info(f"Total TP: {total_tp}")
-    folder_logger.info(f"Total FP: {total_fp}")
-    folder_logger.info(f"Total FN: {total_fn}")
-    folder_logger.info(f"Precision: {overall_precision:.4f}")
-    folder_logger.info(f"Recall: {overall_recall:.4f}")
-    folder_logger.info(f"F1 Score: {overall_f1:.4f}")
-
-    return {
-        "fold": fold_name,
-        "batch": batch_name,
-        "TP": total_tp,
-        "FP": total_fp,
-        "FN": total_fn,
-        "precision": overall_precision,
-        "recall": overall_recall,
-        "f1": overall_f1
-    }
+from src.evaluation import expand_jobs, run_evaluation
 
 
 if __name__ == "__main__":
@@ -102,72 +12,45 @@ if __name__ == "__main__":
     FOLDS = ["FetaQA", "Spider_Beaver", "wikiTQ"]
     BATCHS = ['museve','sevcot']
 
+    # Scores against the materialized <fold>\Merged-yes-no files. True derives the labels
+    # from the "@@@_" markers of the perturbed tables in <fold>\Merged instead, which only
+    # matches Merged-yes-no if preprocessing_yes_no_value_anomaly.py ran before merging.
+    GT_FROM_MARKERS = False
+    GT_LABEL_DIR = "Merged" if GT_FROM_MARKERS else "Merged-yes-no"
+
     # Ground-truth base: each fold has "Merged-chunked/Merged-yes-no/<batch>/"
     GROUNDTRUTH_ROOT = r"....dataset"
 
+    # True reads the ground truth from a Parquet fold dataset instead (src/columnar.py),
+    # with <GT_LABEL_DIR> imported as partition <PARQUET_ROOT>\<dir>\<fold>\category=<GT_LABEL_DIR>
+    GT_FROM_PARQUET = False
+    PARQUET_ROOT = os.path.join(GROUNDTRUTH_ROOT, "parquet")
+
     # Gemini predictions root: "predictions\gemini\<fold>\<batch>\predicted-merged\predicted-yes-no\"
     GEMINI_OUTPUT_ROOT = r"....predicitons\llama"
 
-    # Output global summary
-    summary_log_path = r"....predicitons\llama\global_summary_variation.log"
-    os.makedirs(os.path.dirname(summary_log_path), exist_ok=True)
-
-    with open(summary_log_path, "w", encoding="utf-8") as summary_file:
-        for dir in tqdm(DIR, desc="Processing DIR", unit="fold"):
-            summary_file.write(f"\n\n########## DIR: {dir} ##########\n")
-            for fold in tqdm(FOLDS, desc="Processing Folds", unit="fold"):
-                summary_file.write(f"\n\n########## Fold: {fold} ##########\n")
-                for batch in BATCHS:
-                    # Build ground-truth directory:
-                    #   <GROUNDTRUTH_ROOT>\<fold>\Merged-chunked\Merged-yes-no\<batch>\
-                    # gt_dir = os.path.join(
-                    #     GROUNDTRUTH_ROOT,
-                    #     fold,
-                    #     "Merged-yes-no"
-                    # )
-
-                    gt_dir = os.path.join(
-                        GROUNDTRUTH_ROOT,
-                        dir,
-                        fold,
-                        "Merged-yes-no"
-                    )
-
-                    # Build prediction directory:
-                    #   <GEMINI_OUTPUT_ROOT>\<fold>\<batch>\predicted-merged\predicted-yes-no\
-                    # pred_dir = os.path.join(
-                    #     GEMINI_OUTPUT_ROOT,
-                    #     fold,
-                    #     batch,
-                    #     "predicted-merged",
-                    #     "predicted-yes-no"
-                    # )
-
-                    pred_dir = os.path.join(
-                        GEMINI_OUTPUT_ROOT,
-                        dir,
-                        fold,
-                        batch,
-                        "predicted-merged",
-                        "predicted-yes-no"
-                    )
-
-                    # Ensure the output directory for this batch’s log exists
-                    os.makedirs(pred_dir, exist_ok=True)
-                    folder_log_path = os.path.join(pred_dir, "evaluation_log.log")
-                    folder_logger = get_logger(folder_log_path)
-
-                    # Evaluate
-                    result = evaluate_predictions(gt_dir, pred_dir, fold, batch, folder_logger)
-
-                    # Write batch summary to the global summary file
-                    summary_file.write(f"\n=== Overall Results - {batch} ===\n")
-                    summary_file.write(f"TP       : {result['TP']}\n")
-                    summary_file.write(f"FP       : {result['FP']}\n")
-                    summary_file.write(f"FN       : {result['FN']}\n")
-                    summary_file.write(f"Precision: {result['precision']:.4f}\n")
-                    summary_file.write(f"Recall   : {result['recall']:.4f}\n")
-                    summary_file.write(f"F1 Score : {result['f1']:.4f}\n")
-                    summary_file.write("--------------------------------------------------\n")
-
-    print(f"✅ Global summary written to: {summary_log_path}")
+    # One consolidated results table for every dir × fold × batch combination
+    results_path = r"....predicitons\llama\evaluation_results_variation.csv"
+    per_file_path = r"....predicitons\llama\evaluation_per_file_variation.csv"
+
+    # Merged layout:
+    #   gt:   <GROUNDTRUTH_ROOT>\<fold>\<GT_LABEL_DIR>
+    #   pred: <GEMINI_OUTPUT_ROOT>\<fold>\<batch>\predicted-merged\predicted-yes-no
+    # jobs = expand_jobs(
+    #     os.path.join(GROUNDTRUTH_ROOT, "{fold}", GT_LABEL_DIR),
+    #     os.path.join(GEMINI_OUTPUT_ROOT, "{fold}", "{batch}", "predicted-merged", "predicted-yes-no"),
+    #     fold=FOLDS, batch=BATCHS,
+    # )
+
+    # Ground truth: <GROUNDTRUTH_ROOT>\<dir>\<fold>\<GT_LABEL_DIR>\ (shared by every batch of a fold)
+    # Predictions:  <GEMINI_OUTPUT_ROOT>\<dir>\<fold>\<batch>\predicted-merged\predicted-yes-no\
+    gt_pattern = (os.path.join(PARQUET_ROOT, "{dir}", "{fold}", f"category={GT_LABEL_DIR}") if GT_FROM_PARQUET
+                  else os.path.join(GROUNDTRUTH_ROOT, "{dir}", "{fold}", GT_LABEL_DIR))
+    jobs = expand_jobs(
+        gt_pattern,
+        os.path.join(GEMINI_OUTPUT_ROOT, "{dir}", "{fold}", "{batch}", "predicted-merged", "predicted-yes-no"),
+        dir=DIR, fold=FOLDS, batch=BATCHS,
+    )
+    run_evaluation(jobs, results_path, per_file_path=per_file_path, from_markers=GT_FROM_MARKERS)
+
+    print(f"✅ Evaluation results written to: {results_path}")
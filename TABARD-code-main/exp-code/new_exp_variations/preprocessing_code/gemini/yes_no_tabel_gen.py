@@ -2,6 +2,8 @@ import json
 import sys
 from tqdm import tqdm
 import os
+from src.chunk_store import ChunkPack, ChunkPackWriter, is_pack, pack_path, resolve_chunk_source
+from src.labels import yes_no_name, yes_no_rows
 
 def create_yes_no(input_folder_path, output_folder_path):
     files = sorted(os.listdir(input_folder_path))
@@ -35,7 +37,17 @@ def create_yes_no(input_folder_path, output_folder_path):
                 print(f"Error reading {file_name}: {e}")
         # break
 
+def create_yes_no_pack(input_pack_path, output_pack_path):
+    """Same as create_yes_no, for a packed chunk folder (see src/chunk_store.py)."""
+    with ChunkPack(input_pack_path) as pack, ChunkPackWriter(output_pack_path) as out:
+        for table_id, start, end in tqdm(pack.keys(), desc="Processing chunks", unit="chunk"):
+            out.add(yes_no_name(table_id), start, end, yes_no_rows(pack.read(table_id, start, end)))
+
 def run(input_folder_path,output_folder_path):
+    source = resolve_chunk_source(input_folder_path)
+    if is_pack(source):
+        create_yes_no_pack(source, pack_path(output_folder_path))
+        return
     in_fold = os.path.join(input_folder_path)
     out_fold= os.path.join(output_folder_path)
     create_yes_no(in_fold, out_fold)
@@ -1,6 +1,7 @@
 # ── main.py ─────────────────────────────────────────────────────────
 
 import os
+from src.chunk_store import is_pack, pack_path
 
 # Step 1: chunk merged JSONs with labels
 from strip_chunking_data import process_json_files_with_labels
@@ -8,6 +9,16 @@ from strip_chunking_data import process_json_files_with_labels
 # Step 2: generate yes/no JSONs from (step 1) chunked data
 from yes_no_tabel_gen import run as create_yes_no_run
 
+# Scoring and postprocessing read the materialized yes/no JSONs by default
+# (GT_FROM_MARKERS = False). Step 1 writes them in the same pass; step 2 only
+# fills them in for chunks produced by an earlier run without them. Set to
+# False only when scoring derives labels from the "@@@_" markers.
+MATERIALIZE_YES_NO = True
+
+# Write each chunk folder of step 1 as one packed file (Merged.chunks, ...)
+# instead of one JSON file per chunk; step 3 and postprocessing read either.
+PACK_CHUNKS = False
+
 # Step 3: produce JSONL payloads for gpt4o from (step 2) output
 from genreate_batch_files import main as generate_jsonl_payloads
 
@@ -16,7 +27,7 @@ def main():
     """
     Run all three steps in sequence:
       1) Chunk merged JSON + label pairs under a single 'chunked' folder.
-      2) From those chunks, produce a yes/no version of each JSON.
+      2) From those chunks, produce a yes/no version of each JSON (only if MATERIALIZE_YES_NO).
       3) Produce a set of .jsonl files suitable for batch‐sending to Gemini.
     """
     FOLDS = ["FetaQA-merged", "Spider_Beaver-merged", "wikiTQ-merged"] ### Uncomment Merged
@@ -39,15 +50,18 @@ def main():
         merged_subdir = os.path.join(chunked_folder, "Merged")
         labels_subdir = os.path.join(chunked_folder, "labels")
 
-        if os.path.isdir(merged_subdir) and os.listdir(merged_subdir) and \
-        os.path.isdir(labels_subdir) and os.listdir(labels_subdir):
+        if (os.path.isdir(merged_subdir) and os.listdir(merged_subdir) and \
+        os.path.isdir(labels_subdir) and os.listdir(labels_subdir)) or \
+        (is_pack(pack_path(merged_subdir)) and is_pack(pack_path(labels_subdir))):
             print("✔ STEP 1: Detected existing chunked output. Skipping Step 1.")
         else:
             print("─▶ STEP 1: Chunking merged JSONs + labels…")
             process_json_files_with_labels(
                 data_folder,
                 label_folder,
-                chunked_folder
+                chunked_folder,
+                yes_no=MATERIALIZE_YES_NO,
+                packed=PACK_CHUNKS
             )
             print("✔ Completed STEP 1: chunked JSONs are in:\n   ", chunked_folder, "\n")
 
@@ -57,7 +71,10 @@ def main():
         yesno_output = os.path.join(chunked_folder, "Merged-yes-no")
 
         # If yesno_output folder exists and has JSON files, skip Step 2
-        if os.path.isdir(yesno_output) and any(fn.endswith(".json") for fn in os.listdir(yesno_output)):
+        if not MATERIALIZE_YES_NO:
+            print("✔ STEP 2: Labels are derived from '@@@_' markers at scoring time. Skipping Step 2.")
+        elif (os.path.isdir(yesno_output) and any(fn.endswith(".json") for fn in os.listdir(yesno_output))) or \
+        is_pack(pack_path(yesno_output)):
             print("✔ STEP 2: Detected existing yes/no JSONs. Skipping Step 2.")
         else:
             print("─▶ STEP 2: Generating yes/no JSONs from chunked data…")
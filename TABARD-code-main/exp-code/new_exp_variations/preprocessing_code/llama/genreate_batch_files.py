@@ -3,6 +3,20 @@
 import os
 import json
 import typing
+from src.chunk_store import ChunkPack, is_pack, resolve_chunk_source
+from src.batch_shards import ShardedJsonlWriter
+from src.chunk_ids import ChunkId
+from src.prompt_templates import register_template
+from strip_chunking_data import token_counter
+
+# Batch-file limits to split at (src/batch_shards.PROVIDER_LIMITS)
+BATCH_PROVIDER = "vertex"
+
+# Template key (model, level, cot/wcot, anomaly type) and prompt order;
+# STATIC_FIRST_PROMPT=True puts the table after the instructions so the shared
+# prefix can be cached by the provider (changes the prompt, off by default)
+PROMPT_KEY = ("llama-3.1-70b-instruct", "merged", "cot", "all")
+STATIC_FIRST_PROMPT = False
 
 anomoly_schema = {
     "type": "object",
@@ -26,13 +40,8 @@ class Anomaly(typing.TypedDict):
 
 Anomalies = typing.List[Anomaly]
 
-def create_messages(img_data: typing.List[dict], id: str = None) -> dict:
-    """
-    Build the JSON payload (per llama’s format) embedding the table (img_data) plus the prompt.
-    """
-    json_string = json.dumps(img_data, ensure_ascii=False)
-
-    prompt_str = f"""
+# Prompt text with the table at {json_string}; compiled once (see src/prompt_templates.py)
+PROMPT_TEXT = """
                 ---
                 ### *📌 Important Clarification: Read This First*
                 **IMPORTANT:**
@@ -114,6 +123,15 @@ Here are a few examples of data consistency anomalies to help you identify them:
 ---
 ### Step 3: Generate the Anomalous Cells
 - Return the output in the format [(index, column_name), (index, column_name)] where index corresponds to the index in the list and column_name is the name of the column you think there is an anomaly. Just generate the list format output so I can easily parse it."""
+PROMPT = register_template(PROMPT_KEY, PROMPT_TEXT, static_first=STATIC_FIRST_PROMPT)
+
+def create_messages(img_data: typing.List[dict], id: str = None) -> dict:
+    """
+    Build the JSON payload (per llama’s format) embedding the table (img_data) plus the prompt.
+    """
+    json_string = json.dumps(img_data, ensure_ascii=False)
+
+    prompt_str = PROMPT.render(json_string)
 
     data = {
         "custom_id": id ,
@@ -130,13 +148,31 @@ Here are a few examples of data consistency anomalies to help you identify them:
     }
     return data
 
-def process_flat_directory(input_directory: str, output_jsonl_path: str):
+def process_flat_directory(input_directory: str, output_jsonl_path: str, category: str = "", variation: str = ""):
     """
-    Reads every .json file directly under input_directory,
-    calls create_messages(...) on its contents, and appends each result as a line in one JSONL.
+    Reads every .json file directly under input_directory (or every chunk of
+    its packed form, input_directory + ".chunks"), calls create_messages(...)
+    on its contents, and appends each result as a line in one JSONL. Each
+    line is written as soon as it is built, and the JSONL is split into
+    numbered shards if it would exceed the BATCH_PROVIDER limits. Each
+    request's id is the chunk's canonical id (src/chunk_ids.py), tagged with
+    `category` and `variation`.
     """
     # Ensure the output folder exists
     os.makedirs(os.path.dirname(output_jsonl_path), exist_ok=True)
+    print(PROMPT.summary(token_counter))
+
+    source = resolve_chunk_source(input_directory)
+    if is_pack(source):
+        with ChunkPack(source) as pack, ShardedJsonlWriter(output_jsonl_path, provider=BATCH_PROVIDER) as jsonl_file:
+            for file_name, img_data in pack.items():
+                message = create_messages(img_data, id=str(ChunkId.of(file_name, category, variation)))
+                try:
+                    jsonl_file.write(message)
+                except ValueError as e:
+                    print(f"[Skip] {e}")
+        print(f"→ Wrote JSONL payload: {jsonl_file.summary()}")
+        return
 
     # Find all .json files in the flat input_directory
     all_files = sorted(os.listdir(input_directory))
@@ -145,7 +181,7 @@ def process_flat_directory(input_directory: str, output_jsonl_path: str):
         if fn.lower().endswith(".json") and os.path.isfile(os.path.join(input_directory, fn))
     ]
 
-    with open(output_jsonl_path, "w", encoding="utf-8") as jsonl_file:
+    with ShardedJsonlWriter(output_jsonl_path, provider=BATCH_PROVIDER) as jsonl_file:
         for file_name in json_files:
             file_path = os.path.join(input_directory, file_name)
             try:
@@ -156,25 +192,28 @@ def process_flat_directory(input_directory: str, output_jsonl_path: str):
                     print(f"[Skip] {file_name} (not a list)")
                     continue
 
-                # Use file_name (without extension) as the `id` for clarity
-                base_name = os.path.splitext(file_name)[0]
-                message = create_messages(img_data, id=base_name)
+                message = create_messages(img_data, id=str(ChunkId.of(file_name, category, variation)))
 
                 # Write one JSON object per line
-                jsonl_file.write(json.dumps(message, ensure_ascii=False) + "\n")
+                jsonl_file.write(message)
 
             except json.JSONDecodeError as e:
                 print(f"[Error] Failed to parse {file_name}: {e}")
+            except ValueError as e:
+                print(f"[Skip] {e}")
             except Exception as e:
                 print(f"[Error] Unexpected issue with {file_name}: {e}")
 
-    print(f"→ Wrote JSONL payload to {output_jsonl_path}")
+    print(f"→ Wrote JSONL payload: {jsonl_file.summary()}")
 
 def main(input_directory: str, output_directory: str):
     """
     Entry point for this module. Creates `output_directory` if needed, then
     writes `output.jsonl` under it by processing all JSONs in `input_directory`.
+    Request ids carry the batch (output folder name) and its parent folder (the fold).
     """
     os.makedirs(output_directory, exist_ok=True)
     output_jsonl = os.path.join(output_directory, "output.jsonl")
-    process_flat_directory(input_directory, output_jsonl)
+    output_directory = os.path.normpath(output_directory)
+    process_flat_directory(input_directory, output_jsonl, category=os.path.basename(output_directory),
+                           variation=os.path.basename(os.path.dirname(output_directory)))
@@ -3,19 +3,44 @@
 import os
 import json
 from tqdm import tqdm
-from vertexai.preview import tokenization
+from src.token_counts import get_counter
+from src.chunk_plan import ChunkPlan, PLAN_NAME, plan_tokens, row_budget
+from src.labels import yes_no_name, yes_no_rows
+from src.chunk_store import ChunkPackWriter, pack_path
 
 # ─── Gemini tokenizer setup ───────────────────────────────────────────────
 MODEL_NAME = "gemini-1.5-pro-002"  # or gemini-1.0-pro-001, gemini-1.0-pro-002, gemini-1.5-pro-001, gemini-1.5-flash-001, gemini-1.5-flash-002, gemini-1.5-pro-002.
-tokenizer = tokenization.get_tokenizer_for_model(MODEL_NAME)
+# Gemini's tokenizer is loaded on first use: from the SentencePiece file in
+# GEMINI_TOKENIZER_MODEL when set (no Vertex SDK needed), else through Vertex
+# (see src/token_counts.py). True sizes chunks with a byte-length estimate.
+ESTIMATE_TOKENS = False
+token_counter = get_counter("estimate" if ESTIMATE_TOKENS else MODEL_NAME)
 MODEL_MAX_TOKENS           = 5000      # total context window for this model
 RESERVED_TOKENS_FOR_IO     = 1200      # e.g. prompt instructions + expected reply
 MAX_TOKENS_PER_CHUNK       = MODEL_MAX_TOKENS - RESERVED_TOKENS_FOR_IO  # = 3800
 
+# True sizes chunks from the batch prompt's measured fixed cost instead: the
+# context minus the template of genreate_batch_files.PROMPT (see
+# src/prompt_templates.py) minus REPLY_TOKENS. Off by default, but either
+# way boundaries (and the _chunk_<start>_<end> ids) differ from runs made
+# before src/chunk_plan.py: chunks are balanced and the ", " between rows is
+# counted. Re-chunk a fold rather than mixing its chunks with older outputs.
+BUDGET_FROM_TEMPLATE = False
+REPLY_TOKENS = 1000
+
 
 def count_tokens(text: str) -> int:
     """Return the total token count for a given text, using Gemini’s tokenizer."""
-    return tokenizer.count_tokens(text).total_tokens
+    return token_counter.count_tokens(text)
+
+
+def chunk_token_budget() -> int:
+    """Row tokens per chunk: MAX_TOKENS_PER_CHUNK, or derived from the prompt template (BUDGET_FROM_TEMPLATE)."""
+    if not BUDGET_FROM_TEMPLATE:
+        return MAX_TOKENS_PER_CHUNK
+    # Imported here: genreate_batch_files imports token_counter from this module
+    from genreate_batch_files import PROMPT
+    return row_budget(MODEL_MAX_TOKENS, PROMPT.fixed_tokens(token_counter), REPLY_TOKENS)
 
 
 def strip_prefix(data):
@@ -41,154 +66,169 @@ def chunk_data_in_parallel(
     merged_dir: str,
     merged_str_dir: str,
     labels_dir: str,
-    max_token_budget: int = MAX_TOKENS_PER_CHUNK
+    max_token_budget: int = MAX_TOKENS_PER_CHUNK,
+    yes_no_dir: str = None,
+    packs: dict = None
 ):
     """
     Given three parallel lists:
       - raw_data       : list of dicts (original JSON rows)
       - stripped_data  : list of dicts (prefixes removed)
       - labels         : list of dicts (label info)
-    Creates chunks under the same row‐boundaries (determined by token count
-    on stripped_data), and writes:
+    Creates chunks under the same row‐boundaries (planned from the token counts
+    of stripped_data, see src/chunk_plan.py), and writes:
       - merged_dir/<base_name>_chunk_<start>_<end>.json
       - merged_str_dir/<base_name>_chunk_<start>_<end>.json
       - labels_dir/<base_name>_chunk_<start>_<end>_labels.json
+      - yes_no_dir/<yes/no name of the chunk>.json   (only if yes_no_dir is given)
+    With `packs` ({"raw", "str", "labels"[, "yes_no"]} -> ChunkPackWriter) the
+    chunks are appended to those packs instead of written as files.
+    Returns the (start, end) row ranges.
     """
-    chunk_raw = []
-    chunk_str = []
-    chunk_lbl = []
-    token_count = 0
-    chunk_index = 0
-
-    total_rows = len(stripped_data)
-    for i in range(total_rows):
-        row_str = json.dumps(stripped_data[i], ensure_ascii=False)
-        row_tokens = count_tokens(row_str)
-
-        # If adding this row would exceed token budget, flush the current chunk
-        if token_count + row_tokens > max_token_budget and chunk_raw:
-            start = chunk_index
-            end = chunk_index + len(chunk_raw)
-
-            # 1) Save raw chunk
-            chunk_filename = f"{base_name}_chunk_{start}_{end}.json"
-            raw_path = os.path.join(merged_dir, chunk_filename)
-            with open(raw_path, 'w', encoding='utf-8') as f_raw:
-                json.dump(chunk_raw, f_raw, indent=2, ensure_ascii=False)
-
-            # 2) Save stripped chunk
-            stripped_path = os.path.join(merged_str_dir, chunk_filename)
-            with open(stripped_path, 'w', encoding='utf-8') as f_str:
-                json.dump(chunk_str, f_str, indent=2, ensure_ascii=False)
-
-            # 3) Save label chunk
-            label_filename = f"{base_name}_chunk_{start}_{end}_labels.json"
-            label_path = os.path.join(labels_dir, label_filename)
-            with open(label_path, 'w', encoding='utf-8') as f_lbl:
-                json.dump(chunk_lbl, f_lbl, indent=2, ensure_ascii=False)
-
-            # Reset for the next chunk
-            chunk_index += len(chunk_raw)
-            chunk_raw = []
-            chunk_str = []
-            chunk_lbl = []
-            token_count = 0
-
-        # Add current row to each list
-        chunk_raw.append(raw_data[i])
-        chunk_str.append(stripped_data[i])
-        chunk_lbl.append(labels[i])
-        token_count += row_tokens
-
-    # Flush any remaining rows as the final chunk
-    if chunk_raw:
-        start = chunk_index
-        end = chunk_index + len(chunk_raw)
+    # Fewest chunks under the budget, with rows spread evenly across them
+    row_token_counts = token_counter.count_rows(stripped_data)
+    ranges = plan_tokens(row_token_counts, max_token_budget)
+
+    for start, end in ranges:
+        if packs:
+            packs["raw"].add(base_name, start, end, raw_data[start:end])
+            packs["str"].add(base_name, start, end, stripped_data[start:end])
+            packs["labels"].add(base_name, start, end, labels[start:end])
+            if "yes_no" in packs:
+                packs["yes_no"].add(yes_no_name(base_name), start, end, yes_no_rows(raw_data[start:end]))
+            continue
 
+        # 1) Save raw chunk
         chunk_filename = f"{base_name}_chunk_{start}_{end}.json"
         raw_path = os.path.join(merged_dir, chunk_filename)
         with open(raw_path, 'w', encoding='utf-8') as f_raw:
-            json.dump(chunk_raw, f_raw, indent=2, ensure_ascii=False)
+            json.dump(raw_data[start:end], f_raw, indent=2, ensure_ascii=False)
 
+        # 2) Save stripped chunk
         stripped_path = os.path.join(merged_str_dir, chunk_filename)
         with open(stripped_path, 'w', encoding='utf-8') as f_str:
-            json.dump(chunk_str, f_str, indent=2, ensure_ascii=False)
+            json.dump(stripped_data[start:end], f_str, indent=2, ensure_ascii=False)
 
+        # 3) Save label chunk
         label_filename = f"{base_name}_chunk_{start}_{end}_labels.json"
         label_path = os.path.join(labels_dir, label_filename)
         with open(label_path, 'w', encoding='utf-8') as f_lbl:
-            json.dump(chunk_lbl, f_lbl, indent=2, ensure_ascii=False)
+            json.dump(labels[start:end], f_lbl, indent=2, ensure_ascii=False)
 
+        # 4) Save yes/no chunk, derived from the "@@@_" markers already in memory
+        if yes_no_dir:
+            yes_no_path = os.path.join(yes_no_dir, yes_no_name(chunk_filename))
+            with open(yes_no_path, 'w', encoding='utf-8') as f_yn:
+                json.dump(yes_no_rows(raw_data[start:end]), f_yn, indent=4)
 
-def process_json_files_with_labels(data_folder: str, label_folder: str, output_folder: str):
+    return ranges
+
+
+def process_json_files_with_labels(data_folder: str, label_folder: str, output_folder: str, yes_no: bool = False,
+                                   packed: bool = False):
     """
     For each JSON in `data_folder` (a list of dicts) and its matching label JSON
     in `label_folder` (same filename + "_labels.json"), do the following:
       1) Read the raw data and labels.
       2) Strip '@@@_' from each row and keep raw+stripped in memory.
       3) Chunk all three lists (raw, stripped, labels) under token budget.
-      4) Write chunks into:
+      4) Write chunks (each source table is read once; with yes_no=True the
+         yes/no chunks are written in the same pass) into:
            output_folder/merged-chunks/merged/
            output_folder/merged-chunks/merged-str/
            output_folder/merged-chunks/labels/
+           output_folder/Merged-yes-no/   (yes_no=True)
+       With packed=True each of those folders is a single pack file instead
+       (Merged.chunks, Merged-str.chunks, ..., see src/chunk_store.py).
     """
     # base_out = os.path.join(output_folder, "merged-chunks")
     merged_dir       = os.path.join(output_folder, "Merged")
     merged_str_dir   = os.path.join(output_folder, "Merged-str")
     labels_dir       = os.path.join(output_folder, "labels")
 
-    os.makedirs(merged_dir, exist_ok=True)
-    os.makedirs(merged_str_dir, exist_ok=True)
-    os.makedirs(labels_dir, exist_ok=True)
-
-    for file_name in tqdm(os.listdir(data_folder), desc="Chunking (raw/stripped/labels)", unit="file"):
-        if not file_name.endswith(".json"):
-            continue
-
-        base_name = os.path.splitext(file_name)[0]
-        data_path = os.path.join(data_folder, file_name)
-        label_path = os.path.join(label_folder, f"{base_name}_labels.json")
-
-        if not os.path.exists(label_path):
-            print(f"[Skip] No matching label file for {file_name}")
-            continue
-
-        try:
-            # 1) Load raw data
-            with open(data_path, 'r', encoding='utf-8') as f_data:
-                raw_data = json.load(f_data)
-            if not isinstance(raw_data, list):
-                print(f"[Skip] {file_name} is not a list of objects")
+    yes_no_dir = os.path.join(output_folder, "Merged-yes-no") if yes_no else None
+    packs = None
+    if packed:
+        packs = {
+            "raw": ChunkPackWriter(pack_path(merged_dir)),
+            "str": ChunkPackWriter(pack_path(merged_str_dir)),
+            "labels": ChunkPackWriter(pack_path(labels_dir), suffix="_labels"),
+        }
+        if yes_no_dir:
+            packs["yes_no"] = ChunkPackWriter(pack_path(yes_no_dir))
+    else:
+        os.makedirs(merged_dir, exist_ok=True)
+        os.makedirs(merged_str_dir, exist_ok=True)
+        os.makedirs(labels_dir, exist_ok=True)
+        if yes_no_dir:
+            os.makedirs(yes_no_dir, exist_ok=True)
+
+    # Row ranges of every table, saved for the writers and mergers that follow
+    plan_path = os.path.join(output_folder, PLAN_NAME)
+    plan = ChunkPlan.load(plan_path) if os.path.exists(plan_path) else ChunkPlan()
+    budget = chunk_token_budget()
+    plan.budget, plan.tokenizer = budget, token_counter.name
+
+    try:
+        for file_name in tqdm(os.listdir(data_folder), desc="Chunking (raw/stripped/labels)", unit="file"):
+            if not file_name.endswith(".json"):
                 continue
 
-            # 2) Load labels
-            with open(label_path, 'r', encoding='utf-8') as f_lbl:
-                labels = json.load(f_lbl)
-            if not isinstance(labels, list):
-                print(f"[Skip] {base_name}_labels.json is not a list")
-                continue
-            if len(labels) != len(raw_data):
-                print(f"[Skip] Length mismatch: {file_name} has {len(raw_data)} rows but labels has {len(labels)}")
+            base_name = os.path.splitext(file_name)[0]
+            data_path = os.path.join(data_folder, file_name)
+            label_path = os.path.join(label_folder, f"{base_name}_labels.json")
+
+            if not os.path.exists(label_path):
+                print(f"[Skip] No matching label file for {file_name}")
                 continue
 
-            # 3) Create stripped data (remove '@@@_' prefixes)
-            stripped_data = strip_prefix(raw_data)
-
-            # 4) Chunk all three lists in parallel
-            chunk_data_in_parallel(
-                raw_data,
-                stripped_data,
-                labels,
-                base_name,
-                merged_dir,
-                merged_str_dir,
-                labels_dir
-            )
-
-        except json.JSONDecodeError as e:
-            print(f"[Error] JSON decode issue in {file_name}: {e}")
-        except Exception as e:
-            print(f"[Error] Unexpected issue in {file_name}: {e}")
+            try:
+                # 1) Load raw data
+                with open(data_path, 'r', encoding='utf-8') as f_data:
+                    raw_data = json.load(f_data)
+                if not isinstance(raw_data, list):
+                    print(f"[Skip] {file_name} is not a list of objects")
+                    continue
+
+                # 2) Load labels
+                with open(label_path, 'r', encoding='utf-8') as f_lbl:
+                    labels = json.load(f_lbl)
+                if not isinstance(labels, list):
+                    print(f"[Skip] {base_name}_labels.json is not a list")
+                    continue
+                if len(labels) != len(raw_data):
+                    print(f"[Skip] Length mismatch: {file_name} has {len(raw_data)} rows but labels has {len(labels)}")
+                    continue
+
+                # 3) Create stripped data (remove '@@@_' prefixes)
+                stripped_data = strip_prefix(raw_data)
+
+                # 4) Chunk all three lists in parallel
+                ranges = chunk_data_in_parallel(
+                    raw_data,
+                    stripped_data,
+                    labels,
+                    base_name,
+                    merged_dir,
+                    merged_str_dir,
+                    labels_dir,
+                    max_token_budget=budget,
+                    yes_no_dir=yes_no_dir,
+                    packs=packs
+                )
+                plan.add(base_name, ranges)
+
+            except json.JSONDecodeError as e:
+                print(f"[Error] JSON decode issue in {file_name}: {e}")
+            except Exception as e:
+                print(f"[Error] Unexpected issue in {file_name}: {e}")
+    finally:
+        for pack in (packs or {}).values():
+            pack.close()
+
+    plan.save(plan_path)
+    print(token_counter.summary())
+    print(f"Chunk plan: {len(plan)} tables, {plan.n_chunks()} chunks → {plan_path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,90 @@
+# ── prompt_templates.py ─────────────────────────────────────────────────────
+
+import json
+
+# Prompt templates for the batch generators. A template is the full prompt
+# text with one TABLE_SLOT where the table's JSON goes; it is split around
+# the slot once, so rendering a request is two string concatenations
+# instead of re-evaluating a multi-KB f-string per chunk.
+#
+# Every template is registered once per process under a key such as
+# ("gpt-4o", "level4", "wcot", "Data_Consistency") and its fixed token cost
+# (everything but the table) is counted once per tokenizer.
+#
+# static_first=True moves the "Here is the JSON data: ..." line to the end of
+# the prompt, so every request of a template starts with the same instruction
+# block and providers that cache shared prompt prefixes (OpenAI prompt
+# caching, Gemini implicit caching) can reuse it. It changes the prompt the
+# model sees, so it is off by default and results are only comparable
+# between runs that use the same setting.
+TABLE_SLOT = "{json_string}"
+
+_TEMPLATES = {}  # key -> PromptTemplate
+
+
+class PromptTemplate:
+    """
+    Usage:
+        PROMPT = register_template(("gpt-4o", "level4", "wcot", "Value"), PROMPT_TEXT)
+        prompt_str = PROMPT.render(json.dumps(rows, ensure_ascii=False))
+        in_tokens = PROMPT.fixed_tokens(counter) + counter.count_tokens(json_string)
+    """
+
+    def __init__(self, text: str, key=None, static_first: bool = False):
+        if text.count(TABLE_SLOT) != 1:
+            raise ValueError(f"Prompt template {key!r} must contain {TABLE_SLOT} exactly once")
+        self.key = key
+        self.text = text
+        self.static_first = static_first
+        head, tail = text.split(TABLE_SLOT)
+        if static_first:
+            # Lift the whole line holding the slot to the end of the prompt
+            line_start = head.rfind("\n") + 1
+            line_end = tail.find("\n")
+            lead = head[line_start:]
+            trail = tail if line_end < 0 else tail[:line_end]
+            rest = "" if line_end < 0 else tail[line_end + 1:]
+            self._prefix = head[:line_start] + rest.rstrip() + "\n\n" + lead
+            self._suffix = trail
+        else:
+            self._prefix, self._suffix = head, tail
+        self._fixed_tokens = {}  # tokenizer name -> tokens
+
+    def render(self, json_string: str) -> str:
+        return self._prefix + json_string + self._suffix
+
+    def render_rows(self, rows: list) -> str:
+        return self.render(json.dumps(rows, ensure_ascii=False))
+
+    @property
+    def static_chars(self) -> int:
+        """Characters every request of this template repeats verbatim before the table."""
+        return len(self._prefix)
+
+    def fixed_tokens(self, counter) -> int:
+        """Tokens of the prompt without the table, counted once per tokenizer."""
+        if counter.name not in self._fixed_tokens:
+            self._fixed_tokens[counter.name] = counter.count_tokens(self._prefix + self._suffix)
+        return self._fixed_tokens[counter.name]
+
+    def summary(self, counter) -> str:
+        order = "static-first" if self.static_first else "original order"
+        return (f"Prompt {self.key}: {self.fixed_tokens(counter)} fixed tokens ({counter.name}), "
+                f"{order}, {self.static_chars} chars before the table")
+
+
+def register_template(key, text: str, static_first: bool = False) -> PromptTemplate:
+    """Compile `text` once per (key, static_first); later calls return the same template."""
+    cache_key = (key, static_first)
+    template = _TEMPLATES.get(cache_key)
+    if template is None or template.text != text:
+        template = _TEMPLATES[cache_key] = PromptTemplate(text, key, static_first)
+    return template
+
+
+def get_template(key, static_first: bool = False) -> PromptTemplate:
+    return _TEMPLATES[(key, static_first)]
+
+
+def registered_templates() -> list:
+    return list(_TEMPLATES.values())
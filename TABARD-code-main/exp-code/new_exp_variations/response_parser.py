@@ -0,0 +1,198 @@
+# ── response_parser.py ──────────────────────────────────────────────────────
+
+import re
+import json
+import logging
+import typing
+
+# Streaming parser for batch prediction output. One JSONL line is read,
+# parsed and yielded at a time, so memory stays flat however large the
+# output file is.
+#
+# Lines are not decoded whole: Vertex output echoes the full prompt of every
+# request, and decoding it only to throw it away dominated the old parse.
+# Per shape, a precompiled pattern finds the request id and the response
+# text in the raw line and json's C string scanner decodes just those two
+# strings; a line the patterns do not fit falls back to json.loads.
+#
+# Response shapes (detected from the first record, then fixed for the file):
+#   openai : {"custom_id", "response": {"body": {"choices": [{"message": {"content"}}]}}}
+#   llama  : {"custom_id", "response": {"choices": [{"message": {"content"}}]}}   (Vertex MaaS)
+#   gemini : {"id", "response": {"candidates": [{"content": {"parts": [{"text"}]}}]}}
+#
+# Anomaly formats, tried in this order with precompiled patterns:
+#   tuples        (3, 'Revenue')  (4, "Time (seconds)")
+#   pairs         [3, "Revenue"]
+#   JSON schema   {"index": 3, "anomaly_column": "Revenue"}   (either key order)
+# A response that is a bare JSON list takes the json.loads fast path; no
+# response is ever passed to ast.literal_eval.
+
+OPENAI, LLAMA, GEMINI = "openai", "llama", "gemini"
+
+_TEXT_GETTERS = {
+    OPENAI: lambda record: record["response"]["body"]["choices"][0]["message"]["content"] or "",
+    LLAMA: lambda record: record["response"]["choices"][0]["message"]["content"] or "",
+    GEMINI: lambda record: "".join(
+        part.get("text", "") for part in record["response"]["candidates"][0]["content"]["parts"]),
+}
+
+# Raw-line patterns for the response text (group 1: the still-escaped JSON
+# string). Quotes inside JSON strings are escaped, so a '"key"' in a pattern
+# can only match a real key, never text inside the echoed prompt.
+_JSON_STRING = r'"([^"\\]*(?:\\.[^"\\]*)*)"'
+_TEXT = {
+    OPENAI: re.compile(r'"response"\s*:\s*\{.*?"choices"\s*:\s*\[.*?"content"\s*:\s*' + _JSON_STRING),
+    LLAMA: re.compile(r'"response"\s*:\s*\{.*?"choices"\s*:\s*\[.*?"content"\s*:\s*' + _JSON_STRING),
+    GEMINI: re.compile(r'"response"\s*:\s*\{.*?"candidates"\s*:\s*\[.*?"parts"\s*:\s*\[.*?"text"\s*:\s*'
+                       + _JSON_STRING),
+}
+_COLON = re.compile(r"\s*:\s*")
+_scanstring = json.decoder.scanstring
+
+_TUPLE = re.compile(r"""\(\s*(\d+)\s*,\s*['"](.+?)['"]\s*\)""")        # (i, 'col')
+_PAIR = re.compile(r"""\[\s*(\d+)\s*,\s*['"](.+?)['"]\s*\]""")         # [i, "col"]
+_OBJECT = re.compile(                                                # {"index": i, "anomaly_column": "col"}
+    r'\{\s*"index"\s*:\s*(\d+)\s*,\s*"anomaly_column"\s*:\s*' + _JSON_STRING + r'\s*\}'
+    r'|\{\s*"anomaly_column"\s*:\s*' + _JSON_STRING + r'\s*,\s*"index"\s*:\s*(\d+)\s*\}'
+)
+_EMPTY_LIST = re.compile(r"\[\s*\]")
+
+
+def detect_shape(record: dict) -> str:
+    response = record.get("response") or {}
+    if "candidates" in response:
+        return GEMINI
+    if "body" in response:
+        return OPENAI
+    return LLAMA
+
+
+def request_key(record: dict) -> str:
+    """custom_id (OpenAI / Llama) or id (Gemini) of a response record."""
+    return record.get("custom_id", record.get("id", ""))
+
+
+def _from_json(items) -> list:
+    """Anomalies from an already-decoded JSON list, or None if it is not an anomaly list."""
+    anomalies = []
+    for item in items:
+        if isinstance(item, dict) and "index" in item and "anomaly_column" in item:
+            anomalies.append((int(item["index"]), str(item["anomaly_column"]).strip()))
+        elif isinstance(item, list) and len(item) == 2:
+            anomalies.append((int(item[0]), str(item[1]).strip()))
+        else:
+            return None
+    return anomalies
+
+
+def extract_anomalies(text: str) -> list:
+    """
+    (row index, column) pairs predicted in `text`; [] for an explicit empty
+    list, None if no anomaly list can be found.
+    """
+    stripped = text.strip()
+    # A bare JSON list (Gemini's response schema, or [[i, "col"], ...])
+    if stripped[:1] == "[" and stripped[-1:] == "]" and stripped[1:].lstrip()[:1] in ("{", "[", "]"):
+        try:
+            anomalies = _from_json(json.loads(stripped))
+            if anomalies is not None:
+                return anomalies
+        except (ValueError, TypeError):
+            pass
+
+    matches = _TUPLE.findall(text) or _PAIR.findall(text)
+    if matches:
+        return [(int(idx), label.strip()) for idx, label in matches]
+    matches = _OBJECT.findall(text)
+    if matches:
+        return [(int(idx or idx2), _scanstring(f'{col or col2}"', 0)[0].strip())
+                for idx, col, col2, idx2 in matches]
+    return [] if _EMPTY_LIST.search(text) else None
+
+
+def _value_at(line: str, key: str, start: int = 0) -> int:
+    """Index of the value of the first "key": at or after `start` in the raw line, or -1."""
+    needle = f'"{key}"'
+    pos = line.find(needle, start)
+    while pos >= 0:
+        m = _COLON.match(line, pos + len(needle))
+        if m is not None:
+            return m.end()
+        pos = line.find(needle, pos + 1)
+    return -1
+
+
+def _decode(line: str, m, group: int) -> str:
+    raw = m.group(group)
+    return _scanstring(line, m.start(group))[0] if "\\" in raw else raw
+
+
+def _parse_line(line: str, shape: str) -> tuple:
+    """(request id, response text) read straight from the raw line, or None if the line does not fit."""
+    id_pos = _value_at(line, "custom_id")
+    if id_pos < 0:
+        id_pos = _value_at(line, "id")
+    if id_pos < 0 or line[id_pos:id_pos + 1] != '"':
+        return None
+    m = _TEXT[shape].search(line)
+    if m is None:
+        return None
+    # The text must not come from an echoed request that follows the response
+    request_pos = line.find('"request"', m.start())
+    if 0 <= request_pos < m.start(1):
+        return None
+    return _scanstring(line, id_pos + 1)[0], _decode(line, m, 1)
+
+
+class ParseStats:
+    def __init__(self):
+        self.lines = 0
+        self.parsed = 0
+        self.unrecognized = 0
+        self.errors = 0
+
+    def __str__(self):
+        return (f"{self.lines} lines: {self.parsed} parsed, "
+                f"{self.unrecognized} unrecognized, {self.errors} errors")
+
+
+def iter_predictions(jsonl_path: str, key: typing.Callable = None, shape: str = None,
+                     stats: ParseStats = None, logger: logging.Logger = None):
+    """
+    Yield (gt_key, anomalies) for every response in `jsonl_path`, one line at
+    a time. `key(request_id)` maps a request id to the GT key (default: the
+    id itself); `shape` is detected from the first record if not given.
+    Lines that cannot be parsed are logged and skipped.
+
+    Usage:
+        stats = ParseStats()
+        for gt_key, anomalies in iter_predictions(path, key=to_gt_name, stats=stats):
+            ...
+        logger.info(f"{path}: {stats}")
+    """
+    logger = logger or logging.getLogger(__name__)
+    stats = stats if stats is not None else ParseStats()
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for idx, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            stats.lines += 1
+            try:
+                if shape is None:
+                    shape = detect_shape(json.loads(line))
+                parsed = _parse_line(line, shape)
+                if parsed is None:
+                    record = json.loads(line)
+                    parsed = request_key(record), _TEXT_GETTERS[shape](record)
+                request_id, text = parsed
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+                stats.errors += 1
+                logger.error(f"[ERROR] Line {idx} of {jsonl_path}: {type(e).__name__}: {e}")
+                continue
+            anomalies = extract_anomalies(text)
+            if anomalies is None:
+                stats.unrecognized += 1
+                logger.warning(f"Unrecognized format in line {idx} of {jsonl_path}: {text[:200]!r}")
+                continue
+            stats.parsed += 1
+            yield (key(request_id) if key else request_id), anomalies
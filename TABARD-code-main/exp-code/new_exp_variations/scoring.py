@@ -0,0 +1,133 @@
+# ── scoring.py ──────────────────────────────────────────────────────────────
+
+import numpy as np
+
+# Cell codes used by the scorer. Anything that is neither "Yes" nor "No"
+# (including keys missing from a ground-truth row) is OTHER and never counted,
+# which mirrors the string comparisons in the original compute_metrics.
+YES = 1
+NO = 0
+OTHER = -1
+
+_CODES = {"Yes": YES, "No": NO}
+
+
+# ─── ENCODING ────────────────────────────────────────────────────────────────
+def table_columns(rows: list) -> list:
+    """Return the column names of a yes/no table in first-seen order."""
+    return list(dict.fromkeys(key for row in rows for key in row))
+
+
+def encode_table(rows: list, columns: list = None, missing: int = OTHER) -> np.ndarray:
+    """
+    Encode a yes/no table (list of dicts) as an int8 matrix of shape
+    (len(rows), len(columns)) holding YES / NO / OTHER codes.
+    Keys absent from a row are encoded as `missing`.
+    """
+    if columns is None:
+        columns = table_columns(rows)
+    get = _CODES.get
+    flat = [
+        get(row[col], OTHER) if col in row else missing
+        for row in rows
+        for col in columns
+    ]
+    return np.asarray(flat, dtype=np.int8).reshape(len(rows), len(columns))
+
+
+def align_tables(gt_rows: list, pred_rows: list, columns: list = None):
+    """
+    Build aligned (gt_codes, pred_codes) matrices for one table.
+
+    Columns are taken from the ground truth and matched by key; prediction
+    cells missing from a row count as "No". Only the first
+    min(len(gt_rows), len(pred_rows)) rows are compared, like zip() did.
+    """
+    n_rows = min(len(gt_rows), len(pred_rows))
+    gt_rows = gt_rows[:n_rows]
+    if columns is None:
+        columns = table_columns(gt_rows)
+    gt_codes = encode_table(gt_rows, columns, missing=OTHER)
+    pred_codes = encode_table(pred_rows[:n_rows], columns, missing=NO)
+    return gt_codes, pred_codes
+
+
+# ─── COUNTING ────────────────────────────────────────────────────────────────
+def confusion_counts(gt_codes: np.ndarray, pred_codes: np.ndarray):
+    """Return (tp, fp, fn) for two aligned code arrays of any shape."""
+    pred_yes = pred_codes == YES
+    gt_yes = gt_codes == YES
+    tp = np.count_nonzero(gt_yes & pred_yes)
+    fp = np.count_nonzero((gt_codes == NO) & pred_yes)
+    fn = np.count_nonzero(gt_yes & (pred_codes == NO))
+    return int(tp), int(fp), int(fn)
+
+
+def compute_metrics(gt_items: list, pred_items: list):
+    """Drop-in replacement for the per-script compute_metrics loops."""
+    return confusion_counts(*align_tables(gt_items, pred_items))
+
+
+class TableBatch:
+    """
+    Collects many aligned tables into one ragged, concatenated array so a
+    whole fold is scored with a handful of vectorized calls.
+
+    Usage:
+        batch = TableBatch()
+        for name, gt, pred in pairs:
+            batch.add(name, *align_tables(gt, pred))
+        for name, tp, fp, fn in batch.score():
+            ...
+    """
+
+    def __init__(self):
+        self.names = []
+        self._gt = []
+        self._pred = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name: str, gt_codes: np.ndarray, pred_codes: np.ndarray):
+        if gt_codes.shape != pred_codes.shape:
+            raise ValueError(
+                f"Shape mismatch for {name}: gt {gt_codes.shape} vs pred {pred_codes.shape}"
+            )
+        self.names.append(name)
+        self._gt.append(gt_codes.ravel())
+        self._pred.append(pred_codes.ravel())
+
+    def counts(self):
+        """Return three int64 arrays (tp, fp, fn), one entry per table."""
+        n_tables = len(self.names)
+        if n_tables == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+
+        sizes = np.fromiter((a.size for a in self._gt), dtype=np.int64, count=n_tables)
+        table_idx = np.repeat(np.arange(n_tables), sizes)
+        gt = np.concatenate(self._gt)
+        pred = np.concatenate(self._pred)
+
+        pred_yes = pred == YES
+        gt_yes = gt == YES
+        tp = np.bincount(table_idx[gt_yes & pred_yes], minlength=n_tables)
+        fp = np.bincount(table_idx[(gt == NO) & pred_yes], minlength=n_tables)
+        fn = np.bincount(table_idx[gt_yes & (pred == NO)], minlength=n_tables)
+        return tp, fp, fn
+
+    def score(self):
+        """Return a list of (name, tp, fp, fn) tuples in insertion order."""
+        tp, fp, fn = self.counts()
+        return [
+            (name, int(t), int(f), int(n))
+            for name, t, f, n in zip(self.names, tp, fp, fn)
+        ]
+
+
+def precision_recall_f1(tp: int, fp: int, fn: int):
+    precision = tp / (tp + fp) if (tp + fp) else 0.0
+    recall = tp / (tp + fn) if (tp + fn) else 0.0
+    f1 = (2 * precision * recall) / (precision + recall) if (precision + recall) else 0.0
+    return precision, recall, f1
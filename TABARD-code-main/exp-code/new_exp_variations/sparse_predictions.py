@@ -0,0 +1,150 @@
+# ── sparse_predictions.py ───────────────────────────────────────────────────
+
+import os
+import json
+import typing
+
+from src.chunk_store import parse_chunk_filename
+
+# Sparse prediction store: everything one experiment (model x prompt x
+# fold / category) predicted, in a single file, as (row, column) coordinate
+# lists per table, instead of a "No"-filled copy of every yes/no table with
+# a handful of cells flipped to "Yes".
+#
+#   <pred_dir>.sparse.json
+#   {"format": 1, "kind": "chunks", "tables": {"tableA_yes_no_chunk_0_60.json": [[3, "Revenue"], ...], ...}}
+#
+# Entries are named like the yes/no files they replace, so scorers match
+# them against the ground truth exactly as before. Every table the
+# experiment covers has an entry, an empty list when nothing was predicted,
+# so a missing table is still told apart from an all-"No" one.
+#
+# Chunk cells become table cells by shifting their rows by the chunk's start
+# row, without reading any table: postprocessing adds each chunk response
+# straight to its table (add_chunk) and writes the table-level file in the
+# same pass; a "chunks" file from an older run merges the same way.
+SPARSE_SUFFIX = ".sparse.json"
+FORMAT_VERSION = 1
+
+KIND_CHUNKS = "chunks"
+KIND_TABLES = "tables"
+
+
+def sparse_path(pred_dir: str) -> str:
+    return pred_dir.rstrip("/\\") + SPARSE_SUFFIX
+
+
+def is_sparse(path: str) -> bool:
+    return path.endswith(SPARSE_SUFFIX) and os.path.isfile(path)
+
+
+def resolve_prediction_source(path: str) -> str:
+    """
+    The sparse file of prediction folder `path` if it exists (it wins over a
+    folder of yes/no files an older run left behind), else `path`.
+    """
+    if is_sparse(path):
+        return path
+    if is_sparse(sparse_path(path)):
+        return sparse_path(path)
+    return path
+
+
+def merged_name(chunk_name: str) -> str:
+    """Table file a chunk file merges into ("tableA_yes_no_chunk_0_60.json" -> "tableA_yes_no.json")."""
+    parsed = parse_chunk_filename(chunk_name)
+    if parsed is None:
+        return chunk_name
+    table_id, _, _, suffix = parsed
+    return f"{table_id}{suffix}.json"
+
+
+class SparsePredictions:
+    """
+    Predicted (row, column) cells per table of one experiment.
+
+    Usage:
+        preds = SparsePredictions(KIND_TABLES)
+        preds.add_chunk("tableA_yes_no_chunk_60_120.json", gt_chunk.valid_cells(anomalies))
+        preds.save(sparse_path(merged_dir))
+        ...
+        merged = SparsePredictions.load(path).merged()      # no-op for a "tables" file
+        gt_codes, pred_codes = gt_table.align_sparse(merged.get("tableA_yes_no.json"))
+    """
+
+    def __init__(self, kind: str = KIND_CHUNKS):
+        self.kind = kind
+        self.tables = {}
+
+    def __len__(self):
+        return len(self.tables)
+
+    def __contains__(self, name):
+        return name in self.tables
+
+    def add(self, name: str, cells: typing.Iterable = ()):
+        """Record `cells` ((row, column) pairs) for `name`; a table added with no cells is all "No"."""
+        self.tables.setdefault(name, set()).update((int(row), str(col)) for row, col in cells)
+
+    def get(self, name: str, default=None) -> list:
+        cells = self.tables.get(name)
+        return default if cells is None else sorted(cells)
+
+    def names(self) -> list:
+        return sorted(self.tables)
+
+    def n_cells(self) -> int:
+        return sum(len(cells) for cells in self.tables.values())
+
+    def add_chunk(self, chunk_name: str, cells: typing.Iterable = ()):
+        """
+        Record a chunk's cells on its table: rows are shifted by the chunk's
+        start row, so a table file is built straight from chunk responses.
+        """
+        parsed = parse_chunk_filename(chunk_name)
+        if parsed is None:
+            self.add(chunk_name, cells)
+            return
+        _, start, end, _ = parsed
+        # A row past the chunk's end would land in the next chunk
+        self.add(merged_name(chunk_name), ((start + row, col) for row, col in cells if 0 <= row < end - start))
+
+    def merged(self) -> "SparsePredictions":
+        """Table-level predictions: chunk rows shifted by the chunk's start row."""
+        if self.kind == KIND_TABLES:
+            return self
+        out = SparsePredictions(KIND_TABLES)
+        for name, cells in self.tables.items():
+            out.add_chunk(name, cells)
+        return out
+
+    def save(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = {
+            "format": FORMAT_VERSION,
+            "kind": self.kind,
+            "tables": {name: [list(cell) for cell in self.get(name)] for name in self.names()},
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SparsePredictions":
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("format") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported sparse prediction format {payload.get('format')!r}")
+        preds = cls(payload["kind"])
+        for name, cells in payload["tables"].items():
+            preds.add(name, cells)
+        return preds
+
+
+def merge_sparse(path: str, output_path: str) -> SparsePredictions:
+    """Merge a chunk-level sparse file into a table-level one at `output_path`."""
+    merged = SparsePredictions.load(path).merged()
+    merged.save(output_path)
+    return merged
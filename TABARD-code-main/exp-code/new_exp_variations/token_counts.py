@@ -0,0 +1,211 @@
+# ── token_counts.py ─────────────────────────────────────────────────────────
+
+import os
+import json
+import math
+import hashlib
+import threading
+
+# Row token counts for the chunkers. Rows are serialized once, tokenized in
+# batches, and every count is memoized under (tokenizer name, content hash),
+# so a row that reappears in the raw, stripped, variation and merged datasets
+# is tokenized once per process whichever file it turns up in.
+#
+# Tokenizers are looked up by name in TOKENIZERS and loaded the first time a
+# count actually needs them, then kept for the life of the process. Importing
+# this module imports no tokenizer library, and a run whose rows are all
+# cached never loads one.
+
+# Bytes of JSON per token assumed by the estimator. Table rows (numbers, short
+# strings, quotes and commas) tokenize more densely than prose, so this errs
+# on the side of over-counting and chunks stay within budget.
+ESTIMATE_BYTES_PER_TOKEN = 3.0
+
+# ────────────────────────────────────────────────────────────────────────────
+# REGISTRY
+# ────────────────────────────────────────────────────────────────────────────
+# name -> (backend, argument)
+#   tiktoken      : argument is the model name passed to tiktoken
+#   sentencepiece : argument is a local SentencePiece .model file (the one
+#                   Vertex's local tokenizer downloads for Gemini); if it is
+#                   empty, Vertex's tokenizer for `name` is used instead
+#   hf            : argument is a local Hugging Face tokenizer.json
+#   estimate      : byte-length estimate, no tokenizer
+# Names missing from the table resolve by prefix: "gpt-*" -> tiktoken,
+# "gemini-*" -> sentencepiece with GEMINI_TOKENIZER_MODEL, "llama-*" -> hf
+# with LLAMA_TOKENIZER_FILE.
+GEMINI_TOKENIZER_MODEL = os.environ.get("GEMINI_TOKENIZER_MODEL", "")
+LLAMA_TOKENIZER_FILE   = os.environ.get("LLAMA_TOKENIZER_FILE", "")
+
+TOKENIZERS = {
+    "gpt-4o"                : ("tiktoken", "gpt-4o"),
+    "gpt-4"                 : ("tiktoken", "gpt-4"),
+    "gemini-1.5-pro-002"    : ("sentencepiece", GEMINI_TOKENIZER_MODEL),
+    "gemini-1.5-flash-002"  : ("sentencepiece", GEMINI_TOKENIZER_MODEL),
+    "llama-3.1-70b-instruct": ("hf", LLAMA_TOKENIZER_FILE),
+    "estimate"              : ("estimate", None),
+}
+
+_COUNTS = {}    # (tokenizer name, content digest) -> token count
+_BACKENDS = {}  # tokenizer name -> loaded count_tokens_batch function
+_LOAD_LOCK = threading.Lock()
+
+
+def register_tokenizer(name: str, backend: str, argument=None):
+    """Add or override a TOKENIZERS entry (e.g. to point at a local model file)."""
+    if backend not in _LOADERS:
+        raise ValueError(f"Unknown tokenizer backend {backend!r}; expected one of {sorted(_LOADERS)}")
+    TOKENIZERS[name] = (backend, argument)
+    _BACKENDS.pop(name, None)
+    for key in [key for key in _COUNTS if key[0] == name]:
+        del _COUNTS[key]  # counted by the tokenizer being replaced
+
+
+def _spec(name: str) -> tuple:
+    if name in TOKENIZERS:
+        return TOKENIZERS[name]
+    if name.startswith("gpt-"):
+        return ("tiktoken", name)
+    if name.startswith("gemini-"):
+        return ("sentencepiece", GEMINI_TOKENIZER_MODEL)
+    if name.startswith("llama-"):
+        return ("hf", LLAMA_TOKENIZER_FILE)
+    raise KeyError(f"No tokenizer registered for {name!r}")
+
+
+# ─── backends ───────────────────────────────────────────────────────────────
+def _load_tiktoken(name, model):
+    import tiktoken
+
+    enc = tiktoken.encoding_for_model(model)
+    return lambda texts: [len(ids) for ids in enc.encode_batch(texts, num_threads=8)]
+
+
+def _load_sentencepiece(name, model_file):
+    if not model_file:
+        return _load_vertex(name)
+    import sentencepiece
+
+    sp = sentencepiece.SentencePieceProcessor(model_file=model_file)
+    return lambda texts: [len(ids) for ids in sp.encode(texts)]
+
+
+def _load_vertex(name):
+    from vertexai.preview import tokenization
+
+    tokenizer = tokenization.get_tokenizer_for_model(name)
+
+    def count_tokens_batch(texts):
+        # compute_tokens answers one TokensInfo per text; fall back to one
+        # count_tokens call per text if the SDK ever groups them differently
+        info = tokenizer.compute_tokens(texts).tokens_info
+        if len(info) == len(texts):
+            return [len(i.token_ids) for i in info]
+        return [tokenizer.count_tokens(text).total_tokens for text in texts]
+
+    return count_tokens_batch
+
+
+def _load_hf(name, tokenizer_file):
+    if not tokenizer_file:
+        raise FileNotFoundError(f"{name}: set LLAMA_TOKENIZER_FILE (or register_tokenizer) to a tokenizer.json")
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_file(tokenizer_file)
+    return lambda texts: [len(e.ids) for e in tokenizer.encode_batch(texts, add_special_tokens=False)]
+
+
+def _load_estimate(name, _):
+    return lambda texts: [estimate_tokens(text) for text in texts]
+
+
+_LOADERS = {
+    "tiktoken"     : _load_tiktoken,
+    "sentencepiece": _load_sentencepiece,
+    "hf"           : _load_hf,
+    "estimate"     : _load_estimate,
+}
+
+
+def _backend(name: str):
+    """The loaded count_tokens_batch function for `name`, loading it once per process."""
+    backend = _BACKENDS.get(name)
+    if backend is None:
+        with _LOAD_LOCK:
+            backend = _BACKENDS.get(name)
+            if backend is None:
+                kind, argument = _spec(name)
+                backend = _BACKENDS[name] = _LOADERS[kind](name, argument)
+    return backend
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# COUNTING
+# ────────────────────────────────────────────────────────────────────────────
+def content_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def row_text(row) -> str:
+    """The serialization the chunkers count tokens on."""
+    return json.dumps(row, ensure_ascii=False)
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokenizer-free upper estimate of the token count of `text`."""
+    return max(1, math.ceil(len(text.encode("utf-8")) / ESTIMATE_BYTES_PER_TOKEN))
+
+
+class TokenCounter:
+    """
+    Memoizing front end to a registered tokenizer.
+
+    Only texts not counted before (by any counter for the same tokenizer
+    name) reach the tokenizer, which is loaded on the first such text.
+
+    Usage:
+        counter = get_counter("gpt-4o")
+        row_tokens = counter.count_rows(rows)    # one count per row
+        n = counter.count_tokens(prompt)
+    """
+
+    def __init__(self, name: str):
+        _spec(name)  # fail fast on unknown names, without loading anything
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+    def count_tokens(self, text: str) -> int:
+        return self.count_tokens_batch([text])[0]
+
+    def count_tokens_batch(self, texts: list) -> list:
+        keys = [(self.name, content_key(text)) for text in texts]
+        todo = {}
+        for key, text in zip(keys, texts):
+            if key not in _COUNTS and key not in todo:
+                todo[key] = text
+        if todo:
+            counts = _backend(self.name)(list(todo.values()))
+            _COUNTS.update(zip(todo.keys(), counts))
+        self.misses += len(todo)
+        self.hits += len(texts) - len(todo)
+        return [_COUNTS[key] for key in keys]
+
+    def count_rows(self, rows: list) -> list:
+        """Token count of each row's JSON serialization."""
+        return self.count_tokens_batch([row_text(row) for row in rows])
+
+    def summary(self) -> str:
+        return f"Token counts ({self.name}): {self.misses} tokenized, {self.hits} from cache"
+
+
+def get_counter(name: str) -> TokenCounter:
+    return TokenCounter(name)
+
+
+def count_tokens(text: str, tokenizer: str = "gpt-4o") -> int:
+    return TokenCounter(tokenizer).count_tokens(text)
+
+
+def count_tokens_batch(texts: list, tokenizer: str = "gpt-4o") -> list:
+    return TokenCounter(tokenizer).count_tokens_batch(texts)
@@ -0,0 +1,25 @@
+# ── conftest.py ─────────────────────────────────────────────────────────────
+
+import os
+import sys
+import importlib.util
+
+# The experiment code imports its shared modules as `src.<module>` (the
+# new_exp_variations folder deployed as `src`), and the data-generation
+# scripts import each other by module name; make both importable here.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXP_CODE = os.path.join(ROOT, "exp-code")
+DATA_GENERATION = os.path.join(ROOT, "data-generation")
+
+for path in (EXP_CODE, DATA_GENERATION):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+if "src" not in sys.modules:
+    # A real package named `src` (not an alias of new_exp_variations), so
+    # every `src.<module>` import resolves to one module object
+    SRC = os.path.join(EXP_CODE, "new_exp_variations")
+    spec = importlib.util.spec_from_file_location(
+        "src", os.path.join(SRC, "__init__.py"), submodule_search_locations=[SRC])
+    sys.modules["src"] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules["src"])
@@ -0,0 +1,35 @@
+import pytest
+
+from src.chunk_ids import ChunkId, GTIndex, chunk_id_of, parse_chunk_id
+
+GT_FILES = ["tableA_yes_no_chunk_0_60.json", "tableA_yes_no_chunk_60_90.json", "tableB_yes_no.json"]
+
+
+def test_canonical_id_round_trip():
+    chunk = ChunkId.of("tableA_updated_chunk_0_60.json", "l4_cot", "FetaQA-merged")
+
+    assert str(chunk) == "tbc1|l4_cot|FetaQA-merged|tableA|0|60"
+    assert parse_chunk_id(str(chunk)) == chunk
+    assert parse_chunk_id("tableA_updated_chunk_0_60") is None
+
+
+def test_legacy_and_canonical_ids_share_the_gt_key():
+    gt_index = GTIndex(GT_FILES, "l4_cot")
+
+    legacy = "tableA_updated_chunk_0_60"
+    canonical = str(ChunkId.of("tableA_updated_chunk_0_60.json", "l4_cot"))
+    assert chunk_id_of(legacy).table == chunk_id_of(canonical).table == "tableA"
+    assert gt_index.lookup(legacy) == gt_index.lookup(canonical) == "tableA_yes_no_chunk_0_60.json"
+    assert gt_index.lookup("l4_cot/tableB_updated.json_yes_no.json") == "tableB_yes_no.json"
+
+
+def test_ids_of_another_batch_do_not_match():
+    gt_index = GTIndex(GT_FILES, "l4_cot")
+
+    assert gt_index.lookup("tbc1|sevcot||tableA|0|60") is None
+    assert gt_index.lookup("tbc1|||tableA|0|60") == "tableA_yes_no_chunk_0_60.json"
+
+
+def test_files_sharing_a_key_are_rejected():
+    with pytest.raises(ValueError, match="share a chunk id"):
+        GTIndex(["tableA_yes_no.json", "tableA_updated.json"])
@@ -0,0 +1,68 @@
+import pytest
+
+from src.chunk_plan import ChunkPlan, plan_rows, plan_tokens, row_budget
+
+
+def cost(row_tokens, start, end, separator_tokens=1):
+    return sum(row_tokens[start:end]) + separator_tokens * (end - start)
+
+
+def assert_covers(ranges, n_rows):
+    assert ranges[0][0] == 0 and ranges[-1][1] == n_rows
+    assert all(a_end == b_start for (_, a_end), (b_start, _) in zip(ranges, ranges[1:]))
+
+
+def test_plan_rows_balances_the_remainder():
+    assert plan_rows(10, 4) == [(0, 4), (4, 7), (7, 10)]
+    assert plan_rows(8, 4) == [(0, 4), (4, 8)]
+    assert plan_rows(0, 4) == []
+
+
+def test_plan_tokens_uses_the_fewest_chunks_and_balances_them():
+    row_tokens = [9] * 10  # 10 tokens per row with its separator
+
+    ranges = plan_tokens(row_tokens, budget=70)
+
+    # Greedy filling would give 7 + 3 rows
+    assert ranges == [(0, 5), (5, 10)]
+
+
+def test_plan_tokens_counts_row_separators():
+    # 4 rows of 10 tokens fit a 40-token budget only if separators are free
+    assert plan_tokens([10] * 4, budget=40, separator_tokens=0) == [(0, 4)]
+    assert len(plan_tokens([10] * 4, budget=40)) == 2
+
+
+def test_plan_tokens_keeps_oversized_rows_on_their_own():
+    row_tokens = [5, 100, 5, 5]
+
+    ranges = plan_tokens(row_tokens, budget=20)
+
+    assert_covers(ranges, len(row_tokens))
+    assert (1, 2) in ranges
+    assert all(cost(row_tokens, start, end) <= 20 for start, end in ranges if (start, end) != (1, 2))
+
+
+def test_plan_tokens_respects_max_rows():
+    ranges = plan_tokens([1] * 10, budget=1000, max_rows=3)
+
+    assert_covers(ranges, 10)
+    assert max(end - start for start, end in ranges) <= 3
+
+
+def test_row_budget_rejects_a_template_that_fills_the_context():
+    assert row_budget(5000, 1200, 1000) == 2800
+    with pytest.raises(ValueError, match="No room for rows"):
+        row_budget(2000, 1500, 500)
+
+
+def test_chunk_plan_round_trip(tmp_path):
+    plan = ChunkPlan(budget=70, tokenizer="estimate")
+    plan.add("t", plan_tokens([9] * 10, 70))
+    plan.save(str(tmp_path / "chunk_plan.json"))
+
+    loaded = ChunkPlan.load(str(tmp_path / "chunk_plan.json"))
+
+    assert loaded.ranges("t") == [(0, 5), (5, 10)]
+    assert (loaded.budget, loaded.tokenizer, loaded.n_chunks()) == (70, "estimate", 2)
+    assert loaded.ranges("missing") is None
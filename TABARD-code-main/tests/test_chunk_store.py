@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from src.chunk_store import (ChunkPack, ChunkPackWriter, chunk_filename, iter_chunk_source, merge_pack,
+                             pack_folder, pack_path)
+
+
+def rows(start, end):
+    return [{"row": i, "value": f"v{i}"} for i in range(start, end)]
+
+
+def test_pack_round_trip_merges_chunks_in_start_order(tmp_path):
+    path = pack_path(str(tmp_path / "Merged"))
+    with ChunkPackWriter(path, suffix="_labels") as pack:
+        # Written out of order, and interleaved across tables
+        pack.add("tableB_updated", 60, 90, rows(60, 90))
+        pack.add("tableA_updated", 60, 75, rows(60, 75))
+        pack.add("tableB_updated", 0, 60, rows(0, 60))
+        pack.add("tableA_updated", 0, 60, rows(0, 60))
+
+    with ChunkPack(path) as pack:
+        assert pack.tables() == ["tableA_updated", "tableB_updated"]
+        assert pack.ranges("tableB_updated") == [(0, 60), (60, 90)]
+        assert pack.ranges("missing") == []
+        assert pack.merged("tableB_updated") == rows(0, 90)
+        assert pack.read_name("tableA_updated_chunk_60_75_labels.json") == rows(60, 75)
+        assert "tableA_updated_chunk_0_60_labels.json" in pack
+
+    written = merge_pack(path, str(tmp_path / "merged"))
+    with open(written[0], "r", encoding="utf-8") as f:
+        assert json.load(f) == rows(0, 75)
+
+
+def test_pack_folder_matches_the_folder(tmp_path):
+    folder = tmp_path / "chunks"
+    folder.mkdir()
+    for start, end in [(0, 3), (3, 5)]:
+        (folder / chunk_filename("t", start, end)).write_text(json.dumps(rows(start, end)), encoding="utf-8")
+    (folder / "notes.txt").write_text("not a chunk", encoding="utf-8")
+
+    path = pack_folder(str(folder))
+
+    assert list(iter_chunk_source(path)) == list(iter_chunk_source(str(folder)))
+
+
+def test_duplicate_chunk_aborts_the_pack(tmp_path):
+    path = str(tmp_path / "x.chunks")
+    with pytest.raises(ValueError, match="added twice"):
+        with ChunkPackWriter(path) as pack:
+            pack.add("t", 0, 5, rows(0, 5))
+            pack.add("t", 0, 5, rows(0, 5))
+    assert list(tmp_path.iterdir()) == []  # aborted: no pack, no temp file
@@ -0,0 +1,102 @@
+import os
+import json
+
+import pytest
+
+from src.experiment_matrix import FakeBatchBackend, expand_matrix, run_matrix, SUCCEEDED, SKIPPED, FAILED
+from src.job_registry import JobRegistry, RUNNING, SUBMITTING, SUCCEEDED as JOB_SUCCEEDED, FAILED as JOB_FAILED
+
+
+@pytest.fixture
+def matrix(tmp_path):
+    """Two experiments over a small batch input; the fold "f2" job fails."""
+    for fold in ("f1", "f2"):
+        folder = tmp_path / "batch" / fold
+        folder.mkdir(parents=True)
+        with open(folder / "input.jsonl", "w", encoding="utf-8") as f:
+            for i in range(3):
+                f.write(json.dumps({"custom_id": f"{fold}-{i}", "body": {}}) + "\n")
+    backend = FakeBatchBackend(str(tmp_path / "jobs"), str(tmp_path / "batch" / "{fold}" / "input.jsonl"),
+                               str(tmp_path / "out" / "{fold}" / "output.jsonl"), latency=0.05,
+                               fail=lambda exp: exp.fold == "f2")
+    registry = JobRegistry(str(tmp_path / "jobs.sqlite"))
+    yield expand_matrix(["fake"], ["l1"], ["f1", "f2"]), {"fake": backend}, registry
+    registry.close()
+
+
+def run(experiments, backends, registry, **kwargs):
+    return run_matrix(experiments, backends, registry=registry, poll_interval=0.01, max_poll_interval=0.05, **kwargs)
+
+
+def test_jobs_are_run_collected_and_recorded(matrix):
+    experiments, backends, registry = matrix
+    completed = []
+
+    results = run(experiments, backends, registry, on_complete=lambda exp, path: completed.append(path))
+
+    ok, bad = experiments
+    assert results == {ok: SUCCEEDED, bad: FAILED}
+    with open(completed[0], "r", encoding="utf-8") as f:
+        assert [json.loads(line)["custom_id"] for line in f] == ["f1-0", "f1-1", "f1-2"]
+    assert registry.get(ok.key).state == JOB_SUCCEEDED
+    assert registry.get(bad.key).state == JOB_FAILED
+
+
+def test_rerun_skips_finished_jobs_and_resubmits_failed_ones(matrix):
+    experiments, backends, registry = matrix
+    run(experiments, backends, registry)
+    backend = backends["fake"]
+    assert backend.n_submitted == 2
+
+    ok, bad = experiments
+    assert run(experiments, backends, registry) == {ok: SKIPPED, bad: FAILED}
+    assert backend.n_submitted == 3
+
+
+def test_running_job_is_reattached_not_resubmitted(matrix):
+    experiments, backends, registry = matrix
+    backend, exp = backends["fake"], experiments[0]
+    # A previous driver submitted the job and stopped while it was running
+    registry.begin(exp.key, backend.provider, backend.fingerprint(exp))
+    registry.submitted(exp.key, backend.submit(exp, backend.fingerprint(exp)))
+    assert registry.get(exp.key).state == RUNNING
+
+    assert run([exp], backends, registry) == {exp: SUCCEEDED}
+    assert backend.n_submitted == 1
+
+
+def test_job_submitted_but_never_recorded_is_found(matrix):
+    experiments, backends, registry = matrix
+    backend, exp = backends["fake"], experiments[0]
+    # A previous driver stopped between submitting and recording the job id
+    registry.begin(exp.key, backend.provider, backend.fingerprint(exp))
+    job_ids = backend.submit(exp, backend.fingerprint(exp))
+    assert registry.get(exp.key).state == SUBMITTING
+
+    assert run([exp], backends, registry) == {exp: SUCCEEDED}
+    assert backend.n_submitted == 1
+    assert registry.get(exp.key).job_ids == job_ids
+
+
+def test_succeeded_job_with_missing_output_is_collected_again(matrix):
+    experiments, backends, registry = matrix
+    backend, exp = backends["fake"], experiments[0]
+    run([exp], backends, registry)
+    os.remove(backend.output_path(exp))
+
+    assert run([exp], backends, registry) == {exp: SUCCEEDED}
+    assert os.path.exists(backend.output_path(exp))
+    assert backend.n_submitted == 1
+
+
+def test_changed_input_is_submitted_again(matrix):
+    experiments, backends, registry = matrix
+    backend, exp = backends["fake"], experiments[0]
+    run([exp], backends, registry)
+    os.remove(backend.output_path(exp))
+    with open(exp.format(backend.input_path), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"custom_id": "f1-3", "body": {}}) + "\n")
+
+    assert run([exp], backends, registry) == {exp: SUCCEEDED}
+    assert backend.n_submitted == 2
+
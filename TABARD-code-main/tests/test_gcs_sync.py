@@ -0,0 +1,136 @@
+import os
+
+import pytest
+
+from src import gcs_sync
+from src.gcs_sync import LocalBucket, PredictionSync, INDEX_NAME
+
+
+def make_bucket(root, objects):
+    for name, data in objects.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return LocalBucket(str(root))
+
+
+class FlakyBucket(LocalBucket):
+    """Fails the first read of the byte range starting at `fail_at`."""
+
+    def __init__(self, root, fail_at):
+        super().__init__(root)
+        self.fail_at = fail_at
+        self.reads = []
+
+    def read_range(self, obj, start, end):
+        self.reads.append(start)
+        if start == self.fail_at:
+            self.fail_at = None
+            raise ConnectionError("connection reset")
+        return super().read_range(obj, start, end)
+
+
+class CorruptBucket(LocalBucket):
+    """Serves bytes of the right length but the wrong content."""
+
+    def read_range(self, obj, start, end):
+        return b"x" * (end - start)
+
+
+def test_second_sync_skips_up_to_date_files(tmp_path):
+    bucket = make_bucket(tmp_path / "bucket", {"run/a/predictions.jsonl": b"{}\n" * 5})
+    local_dir = str(tmp_path / "local")
+    syncer = PredictionSync(bucket, max_workers=2)
+
+    first = syncer.sync("run/", local_dir)
+    second = syncer.sync("run/", local_dir)
+    os.remove(os.path.join(local_dir, INDEX_NAME))
+    unindexed = syncer.sync("run/", local_dir)  # same contents: checked, not downloaded
+    syncer.close()
+
+    assert (first.downloaded, first.skipped, first.bytes) == (1, 0, 15)
+    assert (second.downloaded, second.skipped, second.bytes) == (0, 1, 0)
+    assert (unindexed.downloaded, unindexed.skipped) == (0, 1)
+    assert first.files == second.files == [os.path.join(local_dir, "predictions.jsonl")]
+
+
+def test_index_is_written_in_batches(tmp_path, monkeypatch):
+    bucket = make_bucket(tmp_path / "bucket", {f"run/predictions-{i}.jsonl": b"{}\n" * i for i in range(1, 6)})
+    local_dir = str(tmp_path / "local")
+    writes = []
+    dump_json = gcs_sync._dump_json
+    monkeypatch.setattr(gcs_sync, "INDEX_FLUSH_EVERY", 2)
+    monkeypatch.setattr(gcs_sync, "_dump_json", lambda data, path: (writes.append(len(data)), dump_json(data, path)))
+
+    syncer = PredictionSync(bucket, max_workers=2)
+    result = syncer.sync("run/", local_dir)
+    syncer.close()
+
+    assert result.downloaded == 5
+    assert writes == [2, 4, 5]
+
+
+def test_stale_part_file_does_not_affect_a_whole_download(tmp_path):
+    bucket = make_bucket(tmp_path / "bucket", {"run/predictions.jsonl": b"{}\n"})
+    local_dir = tmp_path / "local"
+    local_dir.mkdir()
+    # Left over from an interrupted ranged download of an earlier, larger generation
+    (local_dir / "predictions.jsonl.part").write_bytes(b"x" * 100)
+    (local_dir / "predictions.jsonl.part.json").write_text("{}", encoding="utf-8")
+    syncer = PredictionSync(bucket, chunk_size=4, parallel_threshold=4)
+
+    result = syncer.sync("run/", str(local_dir))
+    syncer.close()
+
+    assert result.downloaded == 1
+    assert sorted(os.listdir(local_dir)) == [INDEX_NAME, "predictions.jsonl"]
+
+
+def test_interrupted_ranged_download_resumes_missing_ranges(tmp_path):
+    data = bytes(range(10))
+    make_bucket(tmp_path / "bucket", {"run/predictions.jsonl": data})
+    bucket = FlakyBucket(str(tmp_path / "bucket"), fail_at=4)
+    local_dir = str(tmp_path / "local")
+    syncer = PredictionSync(bucket, max_workers=2, chunk_size=4, parallel_threshold=4)
+
+    failed = syncer.sync("run/", local_dir)
+    assert (failed.downloaded, failed.files) == (0, [])
+    assert not os.path.exists(os.path.join(local_dir, "predictions.jsonl"))
+
+    bucket.reads.clear()
+    resumed = syncer.sync("run/", local_dir)
+    syncer.close()
+
+    assert bucket.reads == [4]
+    assert (resumed.downloaded, resumed.bytes) == (1, 4)
+    with open(os.path.join(local_dir, "predictions.jsonl"), "rb") as f:
+        assert f.read() == data
+    assert not os.path.exists(os.path.join(local_dir, "predictions.jsonl.part"))
+
+
+@pytest.mark.parametrize("ranged", [False, True])
+def test_checksum_mismatch_is_not_kept_or_indexed(tmp_path, ranged):
+    make_bucket(tmp_path / "bucket", {"run/predictions.jsonl": b"{}\n" * 5})
+    bucket = CorruptBucket(str(tmp_path / "bucket"))
+    local_dir = str(tmp_path / "local")
+    chunking = {"chunk_size": 4, "parallel_threshold": 4} if ranged else {}
+    syncer = PredictionSync(bucket, max_workers=2, **chunking)
+
+    result = syncer.sync("run/", local_dir)
+    syncer.close()
+
+    assert (result.downloaded, result.files) == (0, [])
+    assert os.listdir(local_dir) == []  # no file, no leftover .tmp / .part, no index entry
+
+
+def test_clashing_basenames_are_rejected(tmp_path):
+    bucket = make_bucket(tmp_path / "bucket", {
+        "run/prediction-model-1/predictions.jsonl": b"1\n",
+        "run/prediction-model-2/predictions.jsonl": b"2\n",
+    })
+    syncer = PredictionSync(bucket)
+
+    with pytest.raises(ValueError, match="overwrite each other"):
+        syncer.sync("run/", str(tmp_path / "local"))
+    syncer.close()
+    assert not os.path.exists(tmp_path / "local")  # rejected before anything is written
@@ -0,0 +1,116 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from src import gt_cache
+from src.gt_cache import load_gt_dir
+from src.scoring import YES, NO, OTHER
+
+
+@pytest.fixture(autouse=True)
+def cache_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(gt_cache, "GT_CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(gt_cache, "_OPEN", {})
+
+
+def write_table(folder, filename, rows):
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / filename
+    path.write_text(json.dumps(rows), encoding="utf-8")
+    return path
+
+
+def test_marker_mode_labels_perturbed_tables(tmp_path):
+    write_table(tmp_path / "Merged", "tableA_updated.json", [{"a": "@@@_9", "b": "x"}, {"a": "1"}])
+
+    table = load_gt_dir(str(tmp_path / "Merged"), from_markers=True)["tableA_yes_no.json"]
+
+    assert table.columns == ["a", "b"]
+    np.testing.assert_array_equal(table.codes, [[YES, NO], [NO, OTHER]])
+
+
+def test_marker_mode_rejects_a_folder_without_markers(tmp_path):
+    write_table(tmp_path / "Merged", "tableA_updated.json", [{"a": "1", "b": "x"}])
+
+    with pytest.raises(ValueError, match="No '@@@_' markers"):
+        load_gt_dir(str(tmp_path / "Merged"), from_markers=True)
+
+
+def test_marker_mode_keys_only_replace_the_trailing_role(tmp_path):
+    marked = [{"a": "@@@_9"}]
+    write_table(tmp_path / "Merged", "t_updated_x_updated.json", marked)
+    write_table(tmp_path / "Merged", "t_updated_x_updated_chunk_0_1.json", marked)
+
+    assert sorted(load_gt_dir(str(tmp_path / "Merged"), from_markers=True)) == [
+        "t_updated_x_yes_no.json", "t_updated_x_yes_no_chunk_0_1.json"]
+
+
+def test_marker_mode_rejects_two_files_with_one_key(tmp_path):
+    marked = [{"a": "@@@_9"}]
+    write_table(tmp_path / "Merged", "tableA_updated.json", marked)
+    write_table(tmp_path / "Merged", "tableA_yes_no.json", marked)
+
+    with pytest.raises(ValueError, match="both map to GT table tableA_yes_no.json"):
+        load_gt_dir(str(tmp_path / "Merged"), from_markers=True)
+
+
+def reload_gt_dir(gt_dir):
+    gt_cache._OPEN.clear()  # a new process: only the on-disk cache survives
+    return load_gt_dir(str(gt_dir))
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    parsed = []
+    encode = gt_cache._encode_planes
+
+    def counting(rows):
+        parsed.append(rows)
+        return encode(rows)
+
+    monkeypatch.setattr(gt_cache, "_encode_planes", counting)
+    return parsed
+
+
+def test_cache_reuses_files_whose_content_is_unchanged(tmp_path, parses):
+    path = write_table(tmp_path / "yes-no", "t_yes_no.json", [{"a": "Yes", "b": "No"}])
+    reload_gt_dir(tmp_path / "yes-no")
+    assert len(parses) == 1
+
+    # Unchanged stats: nothing is re-read
+    reload_gt_dir(tmp_path / "yes-no")
+    assert len(parses) == 1
+
+    # Only the mtime moved (a copy or checkout): the sha1 still matches, so no re-parse
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    table = reload_gt_dir(tmp_path / "yes-no")["t_yes_no.json"]
+    assert len(parses) == 1
+    np.testing.assert_array_equal(table.codes, [[YES, NO]])
+
+
+def test_cache_reparses_a_file_whose_content_changed(tmp_path, parses):
+    path = write_table(tmp_path / "yes-no", "t_yes_no.json", [{"a": "Yes", "b": "No"}])
+    reload_gt_dir(tmp_path / "yes-no")
+
+    # Same size, new bytes and mtime: the sha1 differs, so the labels are rebuilt
+    st = path.stat()
+    write_table(tmp_path / "yes-no", "t_yes_no.json", [{"a": "No", "b": "Yes"}])
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert path.stat().st_size == st.st_size
+    table = reload_gt_dir(tmp_path / "yes-no")["t_yes_no.json"]
+
+    assert len(parses) == 2
+    np.testing.assert_array_equal(table.codes, [[NO, YES]])
+
+
+def test_cache_follows_added_and_removed_files(tmp_path):
+    write_table(tmp_path / "yes-no", "t_yes_no.json", [{"a": "Yes"}])
+    reload_gt_dir(tmp_path / "yes-no")
+
+    (tmp_path / "yes-no" / "t_yes_no.json").unlink()
+    write_table(tmp_path / "yes-no", "u_yes_no.json", [{"a": "No"}])
+
+    assert list(reload_gt_dir(tmp_path / "yes-no")) == ["u_yes_no.json"]
@@ -0,0 +1,187 @@
+import os
+import json
+import asyncio
+import types
+
+import openai
+import pytest
+
+import injection_engine
+from injection_engine import InjectionEngine, InjectionRequest, gather_slices
+from run_manifest import RunManifest, MANIFEST_NAME, DONE, SKIPPED, FAILED
+
+
+def _response(status):
+    # Just the attributes openai's status errors and the engine's backoff read
+    return types.SimpleNamespace(status_code=status, headers={}, request=None)
+
+
+class StubClient:
+    """Stands in for openai.AsyncOpenAI: replies with the prompt text, after `delays[prompt]` seconds."""
+
+    def __init__(self, delays=None, failures=None):
+        self.delays = delays or {}
+        self.failures = dict(failures or {})  # prompt -> rate-limit errors to raise first
+        self.calls = []
+        self.closed = False
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._create))
+
+    async def _create(self, **body):
+        prompt = body["messages"][-1]["content"]
+        self.calls.append(prompt)
+        await asyncio.sleep(self.delays.get(prompt, 0))
+        if self.failures.get(prompt):
+            self.failures[prompt] -= 1
+            raise openai.RateLimitError("rate limited", response=_response(429), body=None)
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=f" reply-{prompt} "))],
+            usage=types.SimpleNamespace(prompt_tokens=3, completion_tokens=2),
+        )
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    client = StubClient()
+    monkeypatch.setattr(injection_engine.openai, "AsyncOpenAI", lambda **kwargs: client)
+    return client
+
+
+def make_engine(**kwargs):
+    return InjectionEngine(api_key="test", concurrency=4, max_tokens=10, tokens_per_minute=10 ** 9,
+                           backoff_base=0.001, backoff_cap=0.01, **kwargs)
+
+
+def write_tables(folder, names):
+    os.makedirs(folder, exist_ok=True)
+    for name in names:
+        with open(os.path.join(folder, f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump([{"a": 1}], f)
+
+
+def build_prompt(df, file_id):
+    return InjectionRequest(messages=[{"role": "user", "content": file_id}])
+
+
+def apply_response(df, file_id, reply):
+    df = df.copy()
+    df["reply"] = reply
+    return df, [f"applied {file_id}"]
+
+
+def logged_tables(log_path):
+    with open(log_path, "r", encoding="utf-8") as f:
+        return [line.split(": ", 1)[1].strip() for line in f if line.startswith("Table: ")]
+
+
+def test_results_are_written_in_input_order(tmp_path, stub):
+    names = ["t0", "t1", "t2", "t3", "t4"]
+    write_tables(tmp_path / "in", names)
+    stub.delays = {"t0": 0.05, "t1": 0.03, "t2": 0.01}  # first tables finish last
+
+    make_engine().run(str(tmp_path / "in"), str(tmp_path / "out"), str(tmp_path / "log.txt"),
+                      build_prompt, apply_response, retry_failed=False)
+
+    assert logged_tables(tmp_path / "log.txt") == [f"{name}.json" for name in names]
+    with open(tmp_path / "out" / "t0_updated.json", "r", encoding="utf-8") as f:
+        assert json.load(f) == [{"a": 1, "reply": "reply-t0"}]
+    assert stub.closed
+
+
+def test_rate_limited_requests_are_retried(tmp_path, stub):
+    write_tables(tmp_path / "in", ["t0", "t1"])
+    stub.failures = {"t0": 2}
+
+    make_engine(max_retries=3).run(str(tmp_path / "in"), str(tmp_path / "out"), str(tmp_path / "log.txt"),
+                                   build_prompt, apply_response, retry_failed=False)
+
+    assert stub.calls.count("t0") == 3
+    assert stub.calls.count("t1") == 1
+    manifest = RunManifest(str(tmp_path / "out" / MANIFEST_NAME))
+    assert manifest.status("t0.json") == DONE
+
+
+def test_exhausted_retries_fail_one_table_and_rerun_retries_it(tmp_path, stub):
+    write_tables(tmp_path / "in", ["t0", "t1"])
+    stub.failures = {"t0": 5}
+    args = (str(tmp_path / "in"), str(tmp_path / "out"), str(tmp_path / "log.txt"), build_prompt, apply_response)
+
+    make_engine(max_retries=1).run(*args, retry_failed=False)
+    manifest = RunManifest(str(tmp_path / "out" / MANIFEST_NAME))
+    assert (manifest.status("t0.json"), manifest.status("t1.json")) == (FAILED, DONE)
+
+    # Finished tables are skipped; failed ones only with retry_failed
+    stub.calls.clear()
+    make_engine(max_retries=1).run(*args, retry_failed=False)
+    assert stub.calls == []
+    stub.failures = {}
+    make_engine(max_retries=1).run(*args, retry_failed=True)
+    assert stub.calls == ["t0"]
+    assert RunManifest(str(tmp_path / "out" / MANIFEST_NAME)).status("t0.json") == DONE
+
+
+def test_unusable_reply_fails_and_turned_down_table_is_skipped(tmp_path, stub):
+    write_tables(tmp_path / "in", ["t0", "t1", "t2"])
+
+    def picky_prompt(df, file_id):
+        return None if file_id == "t2" else build_prompt(df, file_id)  # e.g. no suitable columns
+
+    def picky_response(df, file_id, reply):
+        if file_id == "t0":
+            raise ValueError("Failed to extract or validate JSON from GPT response.")
+        return None, []  # nothing could be marked
+
+    args = (str(tmp_path / "in"), str(tmp_path / "out"), str(tmp_path / "log.txt"), picky_prompt, picky_response)
+    make_engine().run(*args, retry_failed=False)
+
+    manifest = RunManifest(str(tmp_path / "out" / MANIFEST_NAME))
+    assert [manifest.status(f"t{i}.json") for i in range(3)] == [FAILED, FAILED, SKIPPED]
+    assert "Failed to extract or validate JSON" in manifest.entries["t0.json"]["error"]
+    assert not os.path.exists(tmp_path / "out" / "t0_updated.json")
+
+    stub.calls.clear()
+    make_engine().run(*args[:3], build_prompt, apply_response, retry_failed=True)
+    assert sorted(stub.calls) == ["t0", "t1"]
+
+
+class Abort(BaseException):
+    pass
+
+
+def test_abort_cancels_tables_in_flight(tmp_path, stub):
+    write_tables(tmp_path / "in", ["t0", "t1", "t2"])
+    cancelled = []
+
+    async def process_table(engine, df, file_id):
+        if file_id == "t0":
+            await asyncio.sleep(0.01)
+            raise Abort()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(file_id)
+            raise
+
+    with pytest.raises(Abort):
+        make_engine().run(str(tmp_path / "in"), str(tmp_path / "out"), str(tmp_path / "log.txt"),
+                          process_table=process_table, retry_failed=False)
+    assert sorted(cancelled) == ["t1", "t2"]
+    assert stub.closed
+
+
+def test_gather_slices_keeps_order_and_closes_unstarted_slices():
+    async def slice_result(value, delay):
+        await asyncio.sleep(delay)
+        return value
+
+    async def failing():
+        raise ValueError("slice failed")
+
+    assert asyncio.run(gather_slices([slice_result(0, 0.02), slice_result(1, 0)])) == [0, 1]
+
+    rest = [slice_result(1, 0), slice_result(2, 0)]
+    with pytest.raises(ValueError):
+        asyncio.run(gather_slices([failing()] + rest, concurrent=False))
+    assert all(coro.cr_frame is None for coro in rest)  # closed, not left unawaited
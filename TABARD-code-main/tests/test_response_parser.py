@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from src.response_parser import ParseStats, extract_anomalies, iter_predictions
+
+
+@pytest.mark.parametrize("text, expected", [
+    # tuples, in prose or a code block
+    ("Anomalies: (3, 'Revenue'), (4, \"Time (seconds)\")", [(3, "Revenue"), (4, "Time (seconds)")]),
+    # pairs, as a bare JSON list and inside text
+    ('[[3, "Revenue"], [0, " Name "]]', [(3, "Revenue"), (0, "Name")]),
+    ('Found: [3, "Revenue"]', [(3, "Revenue")]),
+    # JSON schema objects, either key order
+    ('[{"index": 3, "anomaly_column": "Revenue"}]', [(3, "Revenue")]),
+    ('```json\n{"anomaly_column": "Say \\"hi\\"", "index": 7}\n```', [(7, 'Say "hi"')]),
+    # explicit empty list
+    ("[]", []),
+    ("No anomalies were found: []", []),
+    # nothing recognizable
+    ("I could not find any anomalies.", None),
+    ("", None),
+])
+def test_extract_anomalies(text, expected):
+    assert extract_anomalies(text) == expected
+
+
+def write_lines(path, records):
+    path.write_text("\n".join(json.dumps(record) for record in records) + "\n\n", encoding="utf-8")
+    return str(path)
+
+
+def test_iter_predictions_reads_openai_output(tmp_path):
+    path = write_lines(tmp_path / "out.jsonl", [
+        {"custom_id": "tbc1|sevcot||t|0|60",
+         "response": {"body": {"choices": [{"message": {"content": "[[1, \"a\"]]"}}]}}},
+        {"custom_id": "tbc1|sevcot||t|60|90",
+         "response": {"body": {"choices": [{"message": {"content": "nothing here"}}]}}},
+    ])
+    stats = ParseStats()
+
+    assert list(iter_predictions(path, key=str.upper, stats=stats)) == [("TBC1|SEVCOT||T|0|60", [(1, "a")])]
+    assert (stats.lines, stats.parsed, stats.unrecognized, stats.errors) == (2, 1, 1, 0)
+
+
+def test_iter_predictions_ignores_the_echoed_gemini_prompt(tmp_path):
+    prompt = 'Example answer: [[9, "wrong"]]'
+    path = write_lines(tmp_path / "out.jsonl", [
+        {"id": "t_chunk_0_5",
+         "request": {"contents": [{"parts": [{"text": prompt}]}]},
+         "response": {"candidates": [{"content": {"parts": [{"text": "[]"}]}}]}},
+    ])
+
+    assert list(iter_predictions(path)) == [("t_chunk_0_5", [])]
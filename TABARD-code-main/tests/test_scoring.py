@@ -0,0 +1,67 @@
+import pytest
+
+from src.scoring import TableBatch, align_tables, compute_metrics, precision_recall_f1
+
+
+def legacy_compute_metrics(gt_items, pred_items):
+    """The per-script loop scoring.py replaces."""
+    tp = fp = fn = 0
+    for gt_row, pred_row in zip(gt_items, pred_items):
+        for key in gt_row:
+            gt_val = gt_row[key]
+            pred_val = pred_row.get(key, "No")
+            if gt_val == "Yes" and pred_val == "Yes":
+                tp += 1
+            elif gt_val == "No" and pred_val == "Yes":
+                fp += 1
+            elif gt_val == "Yes" and pred_val == "No":
+                fn += 1
+    return tp, fp, fn
+
+
+TABLES = {
+    "plain": (
+        [{"a": "Yes", "b": "No"}, {"a": "No", "b": "Yes"}],
+        [{"a": "Yes", "b": "Yes"}, {"a": "No", "b": "No"}],
+    ),
+    # Prediction rows missing keys (counted as "No") and carrying extra ones (ignored)
+    "missing_pred_keys": (
+        [{"a": "Yes", "b": "Yes"}, {"a": "No", "b": "No"}],
+        [{"b": "Yes", "z": "Yes"}, {}],
+    ),
+    # GT rows with different key sets, and values that are neither "Yes" nor "No"
+    "ragged_gt": (
+        [{"a": "Yes"}, {"b": "Yes", "c": "maybe"}, {"a": "No", "c": "Yes"}],
+        [{"a": "Yes", "b": "Yes"}, {"b": "No", "c": "Yes"}, {"a": "Yes", "c": "N/A"}],
+    ),
+    # More predicted rows than GT rows, then fewer: only the common rows count
+    "extra_pred_rows": ([{"a": "Yes"}], [{"a": "Yes"}, {"a": "Yes"}]),
+    "missing_pred_rows": ([{"a": "Yes"}, {"a": "Yes"}, {"a": "No"}], [{"a": "No"}]),
+    "empty_pred": ([{"a": "Yes"}], []),
+}
+
+
+@pytest.mark.parametrize("name", TABLES)
+def test_compute_metrics_matches_the_legacy_loop(name):
+    gt, pred = TABLES[name]
+    assert compute_metrics(gt, pred) == legacy_compute_metrics(gt, pred)
+
+
+def test_table_batch_matches_the_legacy_loop_per_table():
+    batch = TableBatch()
+    for name, (gt, pred) in TABLES.items():
+        batch.add(name, *align_tables(gt, pred))
+
+    assert batch.score() == [(name, *legacy_compute_metrics(gt, pred)) for name, (gt, pred) in TABLES.items()]
+
+
+def test_table_batch_rejects_misaligned_tables():
+    gt_codes, _ = align_tables([{"a": "Yes"}, {"a": "No"}], [{"a": "Yes"}, {"a": "No"}])
+    _, pred_codes = align_tables([{"a": "Yes"}], [{"a": "Yes"}])
+
+    with pytest.raises(ValueError, match="Shape mismatch for t"):
+        TableBatch().add("t", gt_codes, pred_codes)
+
+
+def test_precision_recall_f1_without_positives():
+    assert precision_recall_f1(0, 0, 0) == (0.0, 0.0, 0.0)
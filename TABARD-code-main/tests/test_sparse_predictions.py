@@ -0,0 +1,55 @@
+import pytest
+
+from src.sparse_predictions import (KIND_CHUNKS, KIND_TABLES, SparsePredictions, merge_sparse,
+                                    merged_name, resolve_prediction_source, sparse_path)
+
+
+def test_add_chunk_shifts_rows_by_the_chunk_start():
+    preds = SparsePredictions(KIND_TABLES)
+    preds.add_chunk("tableA_yes_no_chunk_60_90.json", [(0, "a"), (29, "b")])
+    preds.add_chunk("tableA_yes_no_chunk_0_60.json", [(5, "a")])
+
+    assert preds.names() == ["tableA_yes_no.json"]
+    assert preds.get("tableA_yes_no.json") == [(5, "a"), (60, "a"), (89, "b")]
+
+
+def test_add_chunk_drops_rows_outside_the_chunk():
+    preds = SparsePredictions(KIND_TABLES)
+    # Row 30 of a 30-row chunk would be row 0 of the next one
+    preds.add_chunk("tableA_yes_no_chunk_60_90.json", [(30, "a"), (-1, "a"), (2, "b")])
+
+    assert preds.get("tableA_yes_no.json") == [(62, "b")]
+
+
+def test_add_chunk_keeps_unchunked_tables_and_empty_entries():
+    preds = SparsePredictions(KIND_TABLES)
+    preds.add_chunk("tableB_yes_no.json", [(3, "c")])
+    preds.add_chunk("tableC_yes_no_chunk_0_10.json")
+
+    assert preds.get("tableB_yes_no.json") == [(3, "c")]
+    assert preds.get("tableC_yes_no.json") == []  # covered, nothing predicted
+    assert preds.get("missing") is None
+    assert merged_name("tableC_yes_no_chunk_0_10.json") == "tableC_yes_no.json"
+
+
+def test_chunk_file_merges_into_a_table_file(tmp_path):
+    chunks = SparsePredictions(KIND_CHUNKS)
+    chunks.add("t_yes_no_chunk_0_2.json", [(1, "a")])
+    chunks.add("t_yes_no_chunk_2_4.json", [(0, "a"), (5, "a")])
+    path = sparse_path(str(tmp_path / "predicted-yes-no"))
+    chunks.save(path)
+
+    merged = merge_sparse(path, str(tmp_path / "merged.sparse.json"))
+
+    assert merged.kind == KIND_TABLES
+    assert merged.tables == SparsePredictions.load(str(tmp_path / "merged.sparse.json")).tables
+    assert merged.get("t_yes_no.json") == [(1, "a"), (2, "a")]
+    assert resolve_prediction_source(str(tmp_path / "predicted-yes-no")) == path
+
+
+def test_load_rejects_an_unknown_format(tmp_path):
+    path = tmp_path / "x.sparse.json"
+    path.write_text('{"format": 99, "kind": "tables", "tables": {}}', encoding="utf-8")
+
+    with pytest.raises(ValueError, match="unsupported sparse prediction format"):
+        SparsePredictions.load(str(path))